@@ -1,10 +1,42 @@
 """Implementation of methods described in *In the Zone: The effects of zoning regulation changes on urban life* by Arin Khare, James Lian, and Kai Vernooy.
+
+Submodules and the functions re-exported here are imported on first use, so that importing the
+package (or only itz.data) doesn't import semopy, scipy, matplotlib and folium.
 """
 
-from itz.data import get_data
-from itz.model import evaluate, fit, get_description
-from itz.visualization import (make_sem_diagram, make_regression_plot, make_residual_plot,
-                               make_histogram, make_correlation_matrix, make_covariance_matrix,
-                               make_map_vis)
+import importlib
+
+
+# Functions re-exported from submodules, by name.
+_EXPORTS = {
+    "get_data": "data",
+    "cross_validate": "model",
+    "evaluate": "model",
+    "fit": "model",
+    "fit_groups": "model",
+    "get_description": "model",
+    "permutation_test": "model",
+    "transform_data": "model",
+    "make_sem_diagram": "visualization",
+    "make_regression_plot": "visualization",
+    "make_residual_plot": "visualization",
+    "make_histogram": "visualization",
+    "make_correlation_matrix": "visualization",
+    "make_covariance_matrix": "visualization",
+    "make_map_vis": "visualization",
+}
+
+_SUBMODULES = ("crosswalk", "data", "greenspace", "lazy", "model", "registry", "server", "spatial",
+               "tracing", "tracts", "util", "visualization")
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    if name in _EXPORTS:
+        return getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-from . import data, model, util, visualization
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_SUBMODULES))
@@ -21,8 +21,8 @@ Parameters:
 - data_path: path to dataset CSV.
 - img_path: path to output image file.
 
-fit <model> <model_path> <data_path> [--cov_mat_path COV_MAT_PATH]
-------------------------------------------------------------------
+fit <model> <model_path> <data_path> [--cov_mat_path COV_MAT_PATH] [--obj OBJ] [--robust] [--registry_path REGISTRY_PATH]
+-------------------------------------------------------------------------------------------------------------------------
 Fit an SEM model and print results.
 
 Parameters:
@@ -30,6 +30,56 @@ Parameters:
 - model_path: path to file to store mode.
 - data_path: path to CSV with data for model.
 - cov_mat_path (optional): path to file to store covariance matrix (CSV).
+- obj (optional): objective to fit with, MLW (default) or FIML to use tracts with missing values.
+- robust: also reports sandwich standard errors and the Satorra-Bentler scaled chi-square (not
+  with FIML).
+- registry_path (optional): path to the registry the run is recorded in (see itz.registry),
+  experiments.sqlite by default.
+
+runs [--registry_path REGISTRY_PATH] [--add OUTPUT_PATHS] [--x X] [--y Y] [--max_p_value P] [--robust]
+-------------------------------------------------------------------------------------------------------
+List the runs recorded by fit with their statistics or, given x or y, the estimates of the
+regression of y on x in every run.
+
+Parameters:
+- registry_path (optional): path to the registry, experiments.sqlite by default.
+- add (optional): output directories of fit to record first, e.g. ones written before the
+  registry existed.
+- x (optional): explanatory variable of the regression.
+- y (optional): response variable of the regression.
+- max_p_value (optional): only lists estimates with smaller p-values.
+- robust: compares the robust p-values to max_p_value.
+
+permute <model_description> <data_path> [--paths PATHS] [--exposure EXPOSURE] [--strata STRATA] [--permutations N] [--processes N] [--seed SEED] [--output_path PATH1] [--null_path PATH2]
+-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+Test paths of a model by refitting it with the upzoning exposure shuffled across tracts within
+strata, printing randomization p-values next to the asymptotic ones (see
+itz.model.permutation_test).
+
+Parameters:
+- model_description: path to the model description.
+- data_path: path to dataset CSV.
+- paths (optional): relations to test, as "y ~ x", every regression on an exposure by default.
+- exposure (optional): variables to shuffle, 2002_2010_percent_upzoned and
+  2010_2018_percent_upzoned by default.
+- strata (optional): borough (default), density (quantiles of original population density)
+  or none.
+- permutations (optional): number of permutations, 1000 by default.
+- processes (optional): number of processes fitting permutations, all CPUs by default.
+- seed (optional): seed of the permutations, 0 by default.
+- output_path (optional): path to CSV of the tests.
+- null_path (optional): path to CSV of every permutation's estimates.
+
+serve <output_path> <data_path> [--host HOST] [--port PORT]
+-----------------------------------------------------------
+Answer effect, path and prediction queries about a fitted model over a local HTTP/JSON API
+(see itz.server for the endpoints).
+
+Parameters:
+- output_path: output path of the fit command, with the model's description and inspection.
+- data_path: path to dataset CSV.
+- host (optional): address to listen on, 127.0.0.1 by default.
+- port (optional): port to listen on, 8000 by default.
 
 regress <x> <y> <data_path> [--regression_plot_path PATH1] [--residual_plot_path PATH2] [--histogram_path PATH3] [--transform_x] [--transform_y]
 ------------------------------------------------------------------------------------------------------------------------------------------------
@@ -46,15 +96,54 @@ Parameters:
 - transform_x: applies a transformation to x
 - transform_y: applies a transformation to y
 
-distribute <x> <data_path> [--img_path IMG_PATH] [--transform]
---------------------------------------------------------------
+distribute <x> <data_path> [--img_path IMG_PATH] [--transform TRANSFORM] [--processes N]
+----------------------------------------------------------------------------------------
 Create a histogram of a variable.
 
 Parameters:
 - x: name of variable to graph (can also be all_vars)
 - data_path: path to dataset CSV.
 - img_path: path to histogram
-- transform: log-transforms x
+- transform: transforms x
+- processes: number of processes rendering histograms when x is all_vars
+
+With all_vars, bins and statistics for every variable under every transformation are written
+to histogram-data/histogram-bins.csv, and only missing or out of date images are re-rendered.
+
+transform <data_path> [--output_path OUTPUT_PATH]
+-------------------------------------------------
+Rank every transformation of every variable, over all tracts and within each borough, by how
+close to normal it makes the variable (skewness, kurtosis and the Jarque-Bera statistic). The
+recommended transformation of each variable over all tracts is printed as the variable name fit
+takes (e.g. log_<variable>).
+
+Parameters:
+- data_path: path to dataset CSV.
+- output_path (optional): path to the CSV of the ranked transformations,
+  transformations.csv by default.
+
+greenspace <raster_path> <year> [--processes N]
+-----------------------------------------------
+Compute the square meters of greenspace in every tract from a land cover raster, writing the
+greenspace coverage CSV for the year that parse integrates.
+
+Parameters:
+- raster_path: path to a single band land cover raster in the ENVI format, in state plane feet
+  (see itz.greenspace).
+- year: year of the imagery, e.g. 2018.
+- processes: number of processes rasterizing tracts and counting tiles.
+
+parks <parks_path> <parks_2018_path> [--lot_data_path LOT_DATA_PATH]
+--------------------------------------------------------------------
+Compute the distance from every tract to the nearest park in 2010 and its change to 2018,
+writing the park distance CSV that parse integrates.
+
+Parameters:
+- parks_path: path to a GeoJSON of the 2010 park polygons.
+- parks_2018_path: path to a GeoJSON of the 2018 park polygons.
+- lot_data_path (optional): path to the lot data CSV written by parse. Distances are averaged
+  over the tracts' lots weighted by their residential units if it's given, and measured from the
+  tracts' centroids otherwise.
 
 parse [--lot_data_path LOT_DATA_PATH] [--tract_data_paths TRACT_DATA_PATHS] output_path
 ---------------------------------------------------------------------------------------
@@ -66,6 +155,10 @@ Parameters:
 - tract_data_paths (optional): paths to CSV files containing pre-parsed tract data.
 
 Use -v for verbosity.
+
+Every command also takes --trace TRACE_PATH, which records the time, CPU time, memory and row
+counts of each stage to a JSON trace that can be opened in chrome://tracing or
+https://ui.perfetto.dev.
 """
 
 
@@ -80,11 +173,14 @@ import pickle
 import sys
 import subprocess
 import time
-import semopy
-import numpy as np
-import pandas as pd
 
 import itz
+from itz.lazy import lazy_import
+
+# Imported on first use, so that commands only import what they need.
+semopy = lazy_import("semopy")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 
 def _print_stats(dict_: Dict[str, float]):
@@ -102,7 +198,7 @@ def _make_diagram(model_string: str, data_path: str, img_path: str, verbose: boo
     itz.make_sem_diagram(model_name, data, img_path, verbose)
 
 
-def _fit(model_string: str, model_type: str, data_path: str, output_path:str, cov_mat_path: str, model_description: str, verbose: bool):
+def _fit(model_string: str, model_type: str, data_path: str, output_path:str, cov_mat_path: str, model_description: str, obj: str, robust: bool, registry_path: str, verbose: bool):
     """Fits a model to the data and prints evaluation metrics.
     """
     # TODO: figure out if semopy.efa.explore_cfa_model() is something worth exploring (see semopy documentation)
@@ -111,8 +207,10 @@ def _fit(model_string: str, model_type: str, data_path: str, output_path:str, co
     if verbose:
         print("Loading data... ", end="")
         sys.stdout.flush()
-    data = pd.read_csv(data_path)
-    data = data[~data[model_type_string].isna()]
+    with itz.tracing.span("load_data") as info:
+        data = pd.read_csv(data_path)
+        data = data[~data[model_type_string].isna()]
+        info["rows"] = len(data)
     print(f"Data length: {len(data)}")
     if verbose:
         print("done!")
@@ -135,7 +233,7 @@ def _fit(model_string: str, model_type: str, data_path: str, output_path:str, co
 
     beginning_fit = time.time()
 
-    model = itz.fit(model_description, variables, data, verbose)
+    model = itz.fit(model_description, variables, data, verbose, obj=obj)
     ending_fit = time.time()
     print(f"Time to fit: {ending_fit-beginning_fit}")
     # TODO: figure out how to save/load a model
@@ -145,12 +243,22 @@ def _fit(model_string: str, model_type: str, data_path: str, output_path:str, co
     if verbose:
         print("Evaluating model...", end="")
         sys.stdout.flush()
-    stats, params = itz.evaluate(model)
+    stats, params = itz.evaluate(model, robust)
     if verbose:
         print("done!")
     _print_stats(stats)
     print(params)
     print(f"Output path: {output_path}")
+    with itz.tracing.span("record_run"):
+        connection = itz.registry.connect(registry_path)
+        try:
+            run_id = itz.registry.record_run(
+                connection, output_path, model_description, stats, params, data,
+                data_path=os.path.abspath(data_path), model=f"{model_string} {model_type}",
+                objective=obj, n_samples=len(data))
+        finally:
+            connection.close()
+    print(f"Run recorded: {run_id}")
     # factors = model.predict_factors(data)
     # print(factors)
     # print(type(factors))
@@ -166,12 +274,13 @@ def _fit(model_string: str, model_type: str, data_path: str, output_path:str, co
             f.write(stat + ": " + item + "\n")
     params.to_csv(os.path.join(output_path, "model_inspection.csv"))
     print("model inspection created!")
-    semopy.estimate_means(model).to_csv(os.path.join(output_path, "model_means.csv"))
+    with itz.tracing.span("estimate_means"):
+        semopy.estimate_means(model).to_csv(os.path.join(output_path, "model_means.csv"))
     # factors.to_csv(os.path.join(output_path, "model_factors.csv"))
 
     # semopy.semplot(model, os.path.join(output_path, "model_diagram.png"))
-    # TODO: learn more about robust p-values (see semopy FAQ)
-    semopy.report(model, "report", output_path)
+    with itz.tracing.span("report"):
+        semopy.report(model, "report", output_path)
     print("report crerated!")
     # subprocess.run(f"dot {os.path.join(output_path, 'report/plots/1')} -Tpng -Granksep=3 > {os.path.join(output_path, 'model_diagram.png')}")
     # subprocess.run(f"dot {os.path.join(output_path, 'report/plots/2')} -Tpng -Granksep=3 > {os.path.join(output_path, 'with_estimation_model_diagram.png')}")
@@ -182,25 +291,86 @@ def _fit(model_string: str, model_type: str, data_path: str, output_path:str, co
     # subprocess.run(["dot", os.path.join(output_path, "'report'/plots/3"), "-Tpng", "-Granksep=3", ">", os.path.join(output_path, "with_covariances_model_diagram.png")])
     # subprocess.run(["dot", os.path.join(output_path, "'report'/plots/4"), "-Tpng", "-Granksep=3", ">", os.path.join(output_path, "with_both_model_diagram.png")])
 
-def _make_histogram(x: str, data_path: str, img_path: str, transform: str, verbose: bool):
+def _list_runs(registry_path: str, add: List[str], x: str, y: str, max_p_value: float,
+        robust: bool, verbose: bool):
+    """Prints the recorded runs, or the estimates of a regression across them.
+    """
+    connection = itz.registry.connect(registry_path)
+    try:
+        if add:
+            for path, run_id in itz.registry.add_outputs(connection, add).items():
+                if verbose:
+                    print(f"Run recorded: {run_id} ({path})")
+        if x is None and y is None:
+            table = itz.registry.get_runs(connection)
+        else:
+            table = itz.registry.find_parameters(connection, x, y, max_p_value=max_p_value,
+                                                 robust=robust)
+    finally:
+        connection.close()
+    with pd.option_context("display.max_rows", None, "display.width", None):
+        print(table)
+
+
+def _permute(model_description: str, data_path: str, paths: List[str], exposure: List[str],
+        strata: str, permutations: int, processes: int, seed: int, output_path: str,
+        null_path: str, verbose: bool):
+    """Tests paths of a model by permutation and prints the results.
+    """
+    with open(model_description) as f:
+        desc = f.read()
+    variables = set(semopy.Model(desc).vars["observed"])
+    exposure = tuple(exposure) if exposure else itz.model.PERMUTATION_EXPOSURE
+    data = pd.read_csv(data_path)
+    data = data[data[[var for var in exposure if var in data.columns]].notna().all(axis=1)]
+    results, null = itz.model.permutation_test(
+        desc, variables, data, paths, exposure, None if strata == "none" else strata,
+        permutations, processes, seed, verbose=verbose)
+    with pd.option_context("display.max_columns", None, "display.width", None):
+        print(results)
+    if output_path:
+        results.to_csv(output_path, index=False)
+    if null_path:
+        null.to_csv(null_path, index=False)
+
+
+def _serve(output_path: str, data_path: str, host: str, port: int, verbose: bool):
+    """Serves queries about a fitted model until interrupted.
+    """
+    data = pd.read_csv(data_path)
+    model, model_data = itz.server.load_model(output_path, data)
+    server = itz.server.make_server(itz.server.make_state(model, model_data), host, port, verbose)
+    print(f"Serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _make_histogram(x: str, data_path: str, img_path: str, transform: str, processes: int,
+        verbose: bool):
     """Visualize the distribution of a variable.
     """
     data = pd.read_csv(data_path)
     data.set_index("ITZ_GEOID", inplace=True)
 
     if x == 'all_vars':
-        try:
-            os.mkdir("histogram-data/")
-        except FileExistsError:
-            pass
-        for column in data.columns:
-            if column.startswith("Unnamed") or column == "all_vars":
-                continue
-            if verbose:
-                print("working on:", column)
-            itz.make_histogram(column, data, "histogram-data/" + column + ".png")
-            if verbose:
-                print("Histogram created:", column)
+        # Bins for every variable and transformation are stored together, and only the images
+        # for the requested transformation that are missing or out of date get rendered.
+        if verbose:
+            print("Computing histogram bins... ", end="")
+            sys.stdout.flush()
+        bin_table = itz.visualization.compute_histogram_bins(data)
+        if verbose:
+            print("done!")
+        rendered = itz.visualization.render_histogram_atlas(
+            bin_table, "histogram-data/", (transform if transform else "identity",), processes,
+            verbose)
+        if verbose:
+            for path in rendered:
+                print("Histogram created:", path)
         return
     else:
         histogram_path = img_path if img_path else x + ".png"
@@ -361,11 +531,11 @@ def _parse(output_path: str, itz_data_path: str, lot_data_path: str, tract_data_
         lot_data.to_csv(os.path.join(output_path, "lot-data.csv"))
     else:
         model_data = pd.read_csv(itz_data_path, index_col="ITZ_GEOID")
-    orthoimagery_2010 = pd.read_csv("in-the-zone-data/greenspace-orthoimagery/2010-greenspace-orthoimagery.csv")
+    orthoimagery_2010 = pd.read_csv(itz.greenspace.GREENSPACE_COVERAGE_PATH % "2010")
     orthoimagery_2010.set_index("ITZ_GEOID", inplace=True) 
-    orthoimagery_2018 = pd.read_csv("in-the-zone-data/greenspace-orthoimagery/2018-greenspace-orthoimagery.csv") 
+    orthoimagery_2018 = pd.read_csv(itz.greenspace.GREENSPACE_COVERAGE_PATH % "2018")
     orthoimagery_2018.set_index("ITZ_GEOID", inplace=True) 
-    distance_from_park = pd.read_csv("in-the-zone-data/greenspace-distance/tract_distance_from_park.csv") 
+    distance_from_park = pd.read_csv(itz.greenspace.PARK_DISTANCE_PATH)
     distance_from_park.set_index("ITZ_GEOID", inplace=True) 
     for index, _ in model_data.iterrows():
         try:
@@ -381,6 +551,44 @@ def _parse(output_path: str, itz_data_path: str, lot_data_path: str, tract_data_
     model_data.to_csv(os.path.join(output_path, "integrated-itz-data.csv"))
 
 
+def _search_transformations(data_path: str, output_path: str, verbose: bool):
+    """Writes the transformations of every variable ranked by normality, and prints the
+    recommended ones.
+    """
+    table = itz.util.search_transformations(pd.read_csv(data_path))
+    table.to_csv(output_path if output_path else "transformations.csv", index=False)
+    recommended = table[table["recommended"] & (table["group"] == "ALL")]
+    for row in recommended.itertuples():
+        print(f"{row.variable}: {row.fit_variable} (skewness {row.skewness:.3f}, "
+              f"kurtosis {row.kurtosis:.3f}, Jarque-Bera {row.jarque_bera:.1f})")
+
+
+def _compute_greenspace(raster_path: str, year: str, processes: int, verbose: bool):
+    """Writes the greenspace coverage of every tract from a land cover raster.
+    """
+    coverage = itz.greenspace.get_greenspace_coverage(raster_path, processes=processes)
+    coverage.to_csv(itz.greenspace.GREENSPACE_COVERAGE_PATH % year)
+    if verbose:
+        print(coverage.describe())
+
+
+def _compute_park_distances(parks_path: str, parks_2018_path: str, lot_data_path: str,
+        verbose: bool):
+    """Writes the distance from every tract to the nearest park in 2010 and its change to 2018.
+    """
+    lot_data = pd.read_csv(lot_data_path) if lot_data_path is not None else None
+    distances = {year: itz.greenspace.get_tract_distances_from_parks(path, lot_data, year)
+                 for year, path in (("2010", parks_path), ("2018", parks_2018_path))}
+    table = pd.DataFrame({
+        "2010_distance_from_park": distances["2010"],
+        "d_2010_2018_distance_from_park": distances["2018"] - distances["2010"],
+    })
+    table.index.name = "ITZ_GEOID"
+    table.to_csv(itz.greenspace.PARK_DISTANCE_PATH)
+    if verbose:
+        print(table.describe())
+
+
 def _correlate(data_path: str, output_path: str, img_path: str, verbose: bool):
     data = pd.read_csv(data_path)
     itz.make_correlation_matrix(data, output_path, img_path)
@@ -407,30 +615,70 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(usage=__doc__)
     parser.add_argument("-v", "--verbose", action="store_true")
     subparsers = parser.add_subparsers()
+
+    # Options shared by every command.
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument("--trace", required=False)
     
-    diagram_parser = subparsers.add_parser("diagram")
+    diagram_parser = subparsers.add_parser("diagram", parents=[common_parser])
     diagram_parser.add_argument("model_string")
     diagram_parser.add_argument("data_path")
     diagram_parser.add_argument("img_path")
     diagram_parser.set_defaults(func=_make_diagram)
 
-    fit_parser = subparsers.add_parser("fit")
+    fit_parser = subparsers.add_parser("fit", parents=[common_parser])
     fit_parser.add_argument("model_string", choices=itz.model.MODEL_NAMES)
     fit_parser.add_argument("model_type", choices=itz.model.MODEL_TYPE_UPZONED_VARS)
     fit_parser.add_argument("data_path")
     fit_parser.add_argument("output_path")
     fit_parser.add_argument("--cov_mat_path", required=False)
     fit_parser.add_argument("--model_description", required=False)
+    fit_parser.add_argument("--obj", required=False, default="MLW", choices=("MLW", "FIML"))
+    fit_parser.add_argument("--robust", action="store_true")
+    fit_parser.add_argument("--registry_path", required=False,
+                            default=itz.registry.REGISTRY_PATH)
     fit_parser.set_defaults(func=_fit)
 
-    histogram_parser = subparsers.add_parser("distribute")
+    runs_parser = subparsers.add_parser("runs", parents=[common_parser])
+    runs_parser.add_argument("--registry_path", required=False,
+                             default=itz.registry.REGISTRY_PATH)
+    runs_parser.add_argument("--add", action="extend", nargs="+", required=False)
+    runs_parser.add_argument("--x", required=False)
+    runs_parser.add_argument("--y", required=False)
+    runs_parser.add_argument("--max_p_value", required=False, type=float)
+    runs_parser.add_argument("--robust", required=False, default=False, action="store_true")
+    runs_parser.set_defaults(func=_list_runs)
+
+    permute_parser = subparsers.add_parser("permute", parents=[common_parser])
+    permute_parser.add_argument("model_description")
+    permute_parser.add_argument("data_path")
+    permute_parser.add_argument("--paths", action="extend", nargs="+", required=False)
+    permute_parser.add_argument("--exposure", action="extend", nargs="+", required=False)
+    permute_parser.add_argument("--strata", required=False, default="borough",
+                                choices=("borough", "density", "none"))
+    permute_parser.add_argument("--permutations", required=False, default=1000, type=int)
+    permute_parser.add_argument("--processes", required=False, type=int)
+    permute_parser.add_argument("--seed", required=False, default=0, type=int)
+    permute_parser.add_argument("--output_path", required=False)
+    permute_parser.add_argument("--null_path", required=False)
+    permute_parser.set_defaults(func=_permute)
+
+    serve_parser = subparsers.add_parser("serve", parents=[common_parser])
+    serve_parser.add_argument("output_path")
+    serve_parser.add_argument("data_path")
+    serve_parser.add_argument("--host", required=False, default="127.0.0.1")
+    serve_parser.add_argument("--port", required=False, default=8000, type=int)
+    serve_parser.set_defaults(func=_serve)
+
+    histogram_parser = subparsers.add_parser("distribute", parents=[common_parser])
     histogram_parser.add_argument("x", choices=itz.data.VAR_NAMES + ("all_vars",))
     histogram_parser.add_argument("data_path")
     histogram_parser.add_argument("--img_path", required=False)
     histogram_parser.add_argument("--transform", required=False, choices=itz.util.TRANSFORMATION_NAMES)
+    histogram_parser.add_argument("--processes", required=False, type=int)
     histogram_parser.set_defaults(func=_make_histogram)
 
-    regress_parser = subparsers.add_parser("regress")
+    regress_parser = subparsers.add_parser("regress", parents=[common_parser])
     regress_parser.add_argument("x", choices=itz.data.VAR_NAMES + ("all_vars",))
     regress_parser.add_argument("y", choices=itz.data.VAR_NAMES + ("all_vars",))
     regress_parser.add_argument("data_path")
@@ -441,26 +689,43 @@ if __name__ == "__main__":
     regress_parser.add_argument("--transform_y", required=False, choices=itz.util.TRANSFORMATION_NAMES)
     regress_parser.set_defaults(func=_make_regression)
 
-    parse_parser = subparsers.add_parser("parse")
+    transform_parser = subparsers.add_parser("transform", parents=[common_parser])
+    transform_parser.add_argument("data_path")
+    transform_parser.add_argument("--output_path", required=False)
+    transform_parser.set_defaults(func=_search_transformations)
+
+    parse_parser = subparsers.add_parser("parse", parents=[common_parser])
     parse_parser.add_argument("output_path")
     parse_parser.add_argument("--itz_data_path", required=False)
     parse_parser.add_argument("--lot_data_path", required=False)
     parse_parser.add_argument("--tract_data_paths", action="extend", required=False)
     parse_parser.set_defaults(func=_parse)
 
-    correlate_parser = subparsers.add_parser("correlate")
+    greenspace_parser = subparsers.add_parser("greenspace", parents=[common_parser])
+    greenspace_parser.add_argument("raster_path")
+    greenspace_parser.add_argument("year")
+    greenspace_parser.add_argument("--processes", required=False, type=int)
+    greenspace_parser.set_defaults(func=_compute_greenspace)
+
+    parks_parser = subparsers.add_parser("parks", parents=[common_parser])
+    parks_parser.add_argument("parks_path")
+    parks_parser.add_argument("parks_2018_path")
+    parks_parser.add_argument("--lot_data_path", required=False)
+    parks_parser.set_defaults(func=_compute_park_distances)
+
+    correlate_parser = subparsers.add_parser("correlate", parents=[common_parser])
     correlate_parser.add_argument("data_path")
     correlate_parser.add_argument("output_path")
     correlate_parser.add_argument("--img_path", required=False)
     correlate_parser.set_defaults(func=_correlate)
 
-    covariance_parser = subparsers.add_parser("covariance")
+    covariance_parser = subparsers.add_parser("covariance", parents=[common_parser])
     covariance_parser.add_argument("data_path")
     covariance_parser.add_argument("output_path")
     covariance_parser.add_argument("--img_path", required=False)
     covariance_parser.set_defaults(func=_covariance)
 
-    vis_parser = subparsers.add_parser("vis")
+    vis_parser = subparsers.add_parser("vis", parents=[common_parser])
     vis_parser.add_argument("geodata_path")
     vis_parser.add_argument("data_path")
     vis_parser.add_argument("--columns", action="extend", nargs="+", required=True)
@@ -469,4 +734,15 @@ if __name__ == "__main__":
     vis_parser.set_defaults(func=_visualize)
 
     args = parser.parse_args()
-    args.func(**{key: val for key, val in vars(args).items() if key != "func"})
\ No newline at end of file
+    if args.func is _fit and args.obj == "FIML" and args.robust:
+        fit_parser.error("--robust can't be used with --obj FIML")
+    kwargs = {key: val for key, val in vars(args).items() if key not in ("func", "trace")}
+    if args.trace:
+        itz.tracing.start()
+        try:
+            with itz.tracing.span(args.func.__name__.lstrip("_")):
+                args.func(**kwargs)
+        finally:
+            itz.tracing.stop(args.trace)
+    else:
+        args.func(**kwargs)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""Crosswalk from 2000 to 2010 census tracts.
+
+The census relationship file at TRACT_DICT_PATH is parsed once into a sparse matrix of weights
+between 2000 and 2010 tracts, so a table on 2000 tracts is reapportioned to 2010 tracts with a
+single sparse product. Both of the census's layouts are read: the block relationship file
+(TAB2000_TAB2010), whose weights are the land areas of the blocks' intersections, and the tract
+relationship file (us2010trf), which also has the population and housing units of every part.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+import os
+
+from .data import TRACT_DICT_PATH
+from .lazy import lazy_import
+from .tracing import span, traced
+from .tracts import from_county_tract
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+scipy = lazy_import("scipy")
+
+
+WEIGHTS = ("area", "population", "housing_units")
+
+# Columns of the tract relationship file, which has no header.
+TRACT_RELATIONSHIP_COLUMNS = (
+    "STATE00", "COUNTY00", "TRACT00", "GEOID00", "POP00", "HU00", "PART00", "AREA00",
+    "AREALAND00", "STATE10", "COUNTY10", "TRACT10", "GEOID10", "POP10", "HU10", "PART10",
+    "AREA10", "AREALAND10", "AREAPT", "AREALANDPT", "AREAPCT00PT", "AREALANDPCT00PT",
+    "AREAPCT10PT", "AREALANDPCT10PT", "POP10PT", "POPPCT00", "POPPCT10", "HU10PT", "HUPCT00",
+    "HUPCT10",
+)
+
+_crosswalks = {}
+
+
+class Crosswalk(NamedTuple):
+    """Weights between 2000 and 2010 tracts, e.g. the population living in both.
+    """
+    tracts_2000: pd.Index  # ITZ_GEOID of every 2000 tract.
+    tracts_2010: pd.Index  # ITZ_GEOID of every 2010 tract.
+    weights: scipy.sparse.csr_matrix  # 2000 tracts by 2010 tracts.
+
+
+@traced
+def get_crosswalk(weight="population", path: str=TRACT_DICT_PATH) -> Crosswalk:
+    """Returns the crosswalk between the New York City tracts of a census relationship file,
+    weighted by the area, population or housing units of their intersections. Crosswalks are
+    cached until the file changes.
+    """
+    if weight not in WEIGHTS:
+        raise ValueError(f"Unknown weight {weight}.")
+    key = (path, os.path.getmtime(path), weight)
+    if key in _crosswalks:
+        return _crosswalks[key]
+
+    with open(path, "r") as f:
+        has_header = not f.readline().split(",")[0].strip().isdigit()
+    with span("read_relationships") as info:
+        if has_header:
+            relationships = pd.read_csv(path, dtype=str)
+            parts = pd.DataFrame({
+                "tract_2000": from_county_tract(relationships["COUNTY_2000"],
+                                                relationships["TRACT_2000"]),
+                "tract_2010": from_county_tract(relationships["COUNTY_2010"],
+                                                relationships["TRACT_2010"]),
+                "area": pd.to_numeric(relationships["AREALAND_INT"]),
+            })
+        else:
+            relationships = pd.read_csv(path, dtype=str, header=None,
+                                        names=TRACT_RELATIONSHIP_COLUMNS)
+            parts = pd.DataFrame({
+                "tract_2000": from_county_tract(relationships["COUNTY00"],
+                                                relationships["TRACT00"]),
+                "tract_2010": from_county_tract(relationships["COUNTY10"],
+                                                relationships["TRACT10"]),
+                "area": pd.to_numeric(relationships["AREALANDPT"]),
+                "population": pd.to_numeric(relationships["POP10PT"]),
+                "housing_units": pd.to_numeric(relationships["HU10PT"]),
+            })
+        info["rows"] = len(parts)
+    if weight not in parts.columns:
+        raise ValueError(f"The block relationship file has no {weight}, only area.")
+
+    parts = parts.dropna(subset=["tract_2000", "tract_2010"])
+    codes_2000, tracts_2000 = pd.factorize(parts["tract_2000"], sort=True)
+    codes_2010, tracts_2010 = pd.factorize(parts["tract_2010"], sort=True)
+    # Duplicate pairs, such as the blocks of a tract, are summed.
+    weights = scipy.sparse.csr_matrix(
+        (parts[weight].to_numpy(dtype=float), (codes_2000, codes_2010)),
+        shape=(len(tracts_2000), len(tracts_2010)))
+    weights.eliminate_zeros()
+    _crosswalks[key] = Crosswalk(pd.Index(tracts_2000, name="ITZ_GEOID"),
+                                 pd.Index(tracts_2010, name="ITZ_GEOID"), weights)
+    return _crosswalks[key]
+
+
+@traced
+def reapportion(table: pd.DataFrame, crosswalk: Crosswalk, intensive=False) -> pd.DataFrame:
+    """Reapportions a table indexed by 2000 ITZ_GEOIDs to 2010 tracts.
+
+    Counts (such as population) are split between the 2010 tracts in proportion to the weights.
+    With intensive, values (such as percentages and medians) are instead averaged over the 2000
+    tracts, weighted by how much of each 2010 tract they make up. Missing values are left out,
+    and 2010 tracts without any values get NaN.
+    """
+    positions = crosswalk.tracts_2000.get_indexer(table.index)
+    found = positions >= 0
+    weights = crosswalk.weights[positions[found]]
+    values = table[found].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    values = np.where(present, values, 0)
+    if intensive:
+        totals = weights.T @ values
+        shares = weights.T @ present.astype(float)
+        result = np.divide(totals, shares, out=np.full(totals.shape, np.nan), where=shares > 0)
+    else:
+        # Splits every 2000 tract by its share of the weight in each 2010 tract.
+        row_totals = np.asarray(crosswalk.weights.sum(axis=1)).ravel()[positions[found]]
+        shares = scipy.sparse.diags(np.divide(1, row_totals, out=np.zeros(len(row_totals)),
+                                              where=row_totals > 0)) @ weights
+        result = shares.T @ values
+        result[(shares.T @ present.astype(float)) == 0] = np.nan
+    return pd.DataFrame(result, index=crosswalk.tracts_2010, columns=table.columns)
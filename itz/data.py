@@ -1,14 +1,21 @@
 """Data parsing for the American Consumer Survey and NYC PLUTO databases.
 """
 
+from __future__ import annotations
+
 import json
-from tracemalloc import start
 from typing import List, Tuple
 
-import pandas as pd
-import numpy as np
 import math
 
+from . import tracts
+from .lazy import lazy_import
+from .tracing import span, traced
+from .tracts import CODE_TO_COUNTY, COUNTY_TO_CODE
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
 
 ACS_DEMOGRAPHIC_PATH = "in-the-zone-data/acs/nyc-demographic-data-%s.csv"
 ACS_ECONOMIC_PATH = "in-the-zone-data/acs/nyc-economic-data-%s.csv"
@@ -114,23 +121,18 @@ TRACT_DATA_YEARS = ["2010", "2014", "2018"]
 LOT_DATA_YEARS = ["2002", "2010", "2014", "2018"]
 # LOT_DATA_YEARS = ["2010", "2014", "2018"]
 
-CODE_TO_COUNTY = {
-    "005": "BX",
-    "047": "BK",
-    "061": "MN",
-    "081": "QN",
-    "085": "SI"
-}
-COUNTY_TO_CODE = {
-    "BX": "005",
-    "BK": "047",
-    "MN": "061",
-    "QN": "081",
-    "SI": "085"
-}
+# Thresholds of growth in maximum residential capacity for a lot to count as upzoned. Columns
+# for UPZONING_THRESHOLD keep the unsuffixed names, e.g. 2010_2018_percent_upzoned, and the
+# others are suffixed by their percent, e.g. 2010_2018_percent_upzoned_25.
+UPZONING_THRESHOLD = 0.1
+UPZONING_THRESHOLDS = (0.05, 0.1, 0.25, 0.5, 1.0)
+# Quantiles of the percent change in the capacity of each tract's lots.
+CAPACITY_CHANGE_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
 SQM_TO_SQKM = 1000000
 LOT_TRACT_DATA_STARTING_YEAR = 2002
 
+@traced
 def get_data(lot_data: pd.DataFrame=None, tract_data: List[pd.DataFrame]=[],
              verbose=False) -> Tuple[pd.DataFrame, List[pd.DataFrame], pd.DataFrame]:
     """Creates DataFrame with columns corresponding to variables used in the SEM models.
@@ -165,6 +167,8 @@ def get_data(lot_data: pd.DataFrame=None, tract_data: List[pd.DataFrame]=[],
         if verbose:
             print("Using provided.")
 
+    # Tracts are keyed by their codes in the registry until the data is returned.
+    tract_dfs = [tract_df.set_axis(tracts.encode(tract_df.index), axis=0) for tract_df in tract_dfs]
     for tract_df in tract_dfs:
         tract_df = tract_df[tract_df["median_gross_rent"].notnull()]
         tract_df = tract_df[tract_df["median_home_value"].notnull()]
@@ -190,17 +194,16 @@ def get_data(lot_data: pd.DataFrame=None, tract_data: List[pd.DataFrame]=[],
     except:
         pass
 
-    # Create dictionary which holds all lot BBL numbers corresponding to each tract ITZ_GEOID. 
-    tracts_to_lots = {}
-    for value in tract_dfs[0].index:
-        tracts_to_lots[value] = []
-    for index, row in lot_df.iterrows():
-        # print(row)
-        # print(lot_df.columns)
-        tracts_to_lots[row["ITZ_GEOID"]].append(index)
+    # Create dictionary which holds all lot BBL numbers corresponding to each tract code. 
+    with span("tracts_to_lots", rows=len(lot_df)):
+        lot_tracts = pd.Series(tracts.encode(lot_df["ITZ_GEOID"]), index=lot_df.index)
+        lot_tracts = lot_tracts[lot_tracts.isin(tract_dfs[0].index)]
+        tracts_to_lots = {tract: [] for tract in tract_dfs[0].index}
+        for tract, lots in lot_tracts.groupby(lot_tracts).groups.items():
+            tracts_to_lots[tract] = list(lots)
     print("Tracts to lots created!")
     with open(TRACTS_TO_LOTS_PATH, "w") as f:
-        json.dump(tracts_to_lots, f)
+        json.dump(dict(zip(tracts.decode(list(tracts_to_lots)), tracts_to_lots.values())), f)
     # with open(TRACTS_TO_LOTS_PATH, "r") as f:
     #     tracts_to_lots = json.load(f)
 
@@ -229,15 +232,18 @@ def get_data(lot_data: pd.DataFrame=None, tract_data: List[pd.DataFrame]=[],
     # Combine dataframes to create final model data. 
     if verbose:
         print("Combining data sources... ", end="")
-    columns = {}
-    for column in tract_dfs[0].columns:
-        columns[column] = "orig_" + column
-    tract_dfs[0].rename(mapper=columns, axis="columns", inplace=True)
-    model_df = pd.concat([tract_lot_data, tract_deltas, tract_dfs[0]], axis=1)
+    with span("combine") as info:
+        columns = {}
+        for column in tract_dfs[0].columns:
+            columns[column] = "orig_" + column
+        tract_dfs[0].rename(mapper=columns, axis="columns", inplace=True)
+        model_df = pd.concat([tract_lot_data, tract_deltas, tract_dfs[0]], axis=1)
+        info["rows"] = len(model_df)
     
     # model_df.drop(columns=["Unnamed: 0.4", "Unnamed: 0.3","Unnamed: 0.2","Unnamed: 0.1"], inplace=True)
     # model_df.set_index("Unnamed: 0", inplace=True)
-    model_df.index.rename("ITZ_GEOID", inplace=True)
+    model_df = tracts.decode_index(model_df)
+    tract_dfs = [tracts.decode_index(tract_df) for tract_df in tract_dfs]
 
     
     # for index, row in model_df.iterrows():
@@ -258,6 +264,7 @@ def get_data(lot_data: pd.DataFrame=None, tract_data: List[pd.DataFrame]=[],
 # TODO: Add verbosity options to these functions.
 
 
+@traced
 def _get_tract_data() -> List[pd.DataFrame]:
     """Returns a list of two DataFrames with columns not requiring lot data.
     Index: ITZ_GEOID
@@ -562,20 +569,38 @@ def _add_tract_ids(tract_df: pd.DataFrame):
     """Adds an "ITZ_GEOID" column to the data combining the borough and census tract number.
     """
     # Different possibilities for GEOID. 
-    try:
-        itz_geoids = []
-        for _, row in tract_df.iterrows():
-            geoid = row["GEOID10"]
-            itz_geoids.append(CODE_TO_COUNTY[geoid[11:14]] + row["NAME"][13:row["NAME"].find(",")])
-    except:
-        itz_geoids = []
-        for _, row in tract_df.iterrows():
-            geoid = row["GEO_ID"]
-            itz_geoids.append(CODE_TO_COUNTY[geoid[11:14]] + row["NAME"][13:row["NAME"].find(",")])
+    geoids = tract_df["GEOID10"] if "GEOID10" in tract_df.columns else tract_df["GEO_ID"]
+    tract_df["ITZ_GEOID"] = tracts.from_geoid(geoids).to_numpy()
+
 
-    tract_df["ITZ_GEOID"] = itz_geoids
+def _locate_lots(lots: pd.DataFrame) -> pd.Series:
+    """Returns the ITZ_GEOIDs of the tracts containing lots, from their XCoord and YCoord or else
+    those in 2012 PLUTO (XCoord_2012 and YCoord_2012), or NaN for lots outside every tract or
+    without coordinates.
+    """
+    # itz.spatial imports this module's constants.
+    from . import spatial
+    geometry = spatial.get_tract_geometry()
+    positions = spatial.locate_points(*_lot_coordinates(lots), geometry)
+    ids = np.where(positions >= 0, np.asarray(geometry.ids, dtype=object)[positions], np.nan)
+    return pd.Series(ids, index=lots.index)
+
+
+def _lot_coordinates(lots: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the state plane XCoord and YCoord of lots, or else those in 2012 PLUTO (XCoord_2012
+    and YCoord_2012), with NaN for lots without coordinates.
+    """
+    coordinates = []
+    for column in ("XCoord", "YCoord"):
+        values = pd.Series(np.nan, index=lots.index)
+        for source in (column, column + "_2012"):
+            if source in lots.columns:
+                values = values.fillna(pd.to_numeric(lots[source], errors="coerce"))
+        coordinates.append(values.to_numpy())
+    return coordinates[0], coordinates[1]
 
 
+@traced
 def _get_lot_data() -> pd.DataFrame:
     """Creates DataFrame with columns being lot-specific data and rows being lots. 
     Index: ITZ_GEOID
@@ -586,7 +611,7 @@ def _get_lot_data() -> pd.DataFrame:
     try:
         starting_pluto = pd.read_csv(PLUTO_PATH % LOT_DATA_YEARS[0], header=0, dtype=str)
     except:
-        starting_pluto = pd.read_table(PLUTO_TEXT_PATH % LOT_DATA_YEARS[0], header=0, sep=",", dtype=str, usecols=["BBL", "Borough", "LotArea"])
+        starting_pluto = pd.read_table(PLUTO_TEXT_PATH % LOT_DATA_YEARS[0], header=0, sep=",", dtype=str, usecols=lambda column: column in ("BBL", "Borough", "LotArea", "XCoord", "YCoord"))
     print("starting pluto created")
     # print(dict(zip(starting_pluto.index.tolist(), starting_pluto.iloc[0])))
     print(starting_pluto["BBL"])
@@ -597,17 +622,25 @@ def _get_lot_data() -> pd.DataFrame:
 
     # Create ITZ_GEOID column in lot_df
     if LOT_TRACT_DATA_STARTING_YEAR < 2012:
-        next_pluto = pd.read_table(PLUTO_TEXT_PATH % 2012, header=0, sep=",", dtype=str, usecols=["BBL", "CT2010"])
+        next_pluto = pd.read_table(PLUTO_TEXT_PATH % 2012, header=0, sep=",", dtype=str, usecols=lambda column: column in ("BBL", "CT2010", "XCoord", "YCoord"))
         next_pluto.set_index("BBL", inplace=True)
         print("next pluto created")
         print(next_pluto)
-        starting_pluto = starting_pluto.join(next_pluto, on="BBL")
+        starting_pluto = starting_pluto.join(next_pluto, on="BBL", rsuffix="_2012")
         del next_pluto
         print(starting_pluto)
         print(starting_pluto.columns)
-        starting_pluto["ITZ_GEOID"] = starting_pluto["Borough"] + starting_pluto["CT2010"].str.strip()
-    else: 
-        starting_pluto["ITZ_GEOID"] = starting_pluto["Borough"] + starting_pluto["CT2010"]
+    starting_pluto["ITZ_GEOID"] = tracts.from_borough_tract(starting_pluto["Borough"],
+                                                            starting_pluto["CT2010"]).to_numpy()
+
+    # Lots without a tract (whose ITZ_GEOID is missing or just a borough) are placed in tracts by
+    # their coordinates instead.
+    with span("locate_lots") as info:
+        unassigned = starting_pluto["ITZ_GEOID"].isna() | (starting_pluto["ITZ_GEOID"].str.len() == 2)
+        starting_pluto.loc[unassigned, "ITZ_GEOID"] = _locate_lots(starting_pluto[unassigned])
+        info["dropped"] = int(starting_pluto["ITZ_GEOID"].isna().sum())
+        info["recovered"] = int(unassigned.sum()) - info["dropped"]
+    print(f"{info['recovered']} lots without a tract placed by their coordinates, {info['dropped']} dropped")
 
     # Filter starting_pluto for valid ITZ_GEOIDs
     starting_pluto = starting_pluto[starting_pluto['ITZ_GEOID'].map(lambda x: len(str(x)) != 2)]
@@ -631,6 +664,8 @@ def _get_lot_data() -> pd.DataFrame:
     print(lot_df["ITZ_GEOID"])
     # LotArea doesn't change, and starting_pluto uses the same indexing as lot_df, so the column can simply be copied over.
     lot_df["lot_area"] = starting_pluto["LotArea"].astype(float)
+    # Coordinates place lots relative to parks (see itz.greenspace).
+    lot_df["x_coord"], lot_df["y_coord"] = _lot_coordinates(starting_pluto)
     print("ITZ geoids created!")
 
     del starting_pluto
@@ -715,127 +750,156 @@ def _get_lot_data() -> pd.DataFrame:
     return lot_df
 
 
-def _get_tract_lot_data(lot_df, tracts_to_lots) -> pd.DataFrame:
-    """Calculates the percent of each tract that was upzoned using the (using a 10% threshold in
-    maximum residential capacity)
+@traced
+def _get_tract_lot_data(lot_df, tracts_to_lots, thresholds=UPZONING_THRESHOLDS) -> pd.DataFrame:
+    """Calculates the percent of each tract's lots that were upzoned and downzoned between the
+    years of each delta for every threshold in maximum residential capacity, the change in
+    residential units, and the tract's land use.
+
+    A lot is upzoned at threshold t if its capacity grew by more than t (end/start > 1 + t), and
+    downzoned if it shrank by as much (start/end > 1 + t). Each lot's capacity ratio is computed
+    once per delta and binned between the thresholds, so every threshold is counted from the
+    same per-tract histogram, which also gives the percent of the tract's lot area that was
+    upzoned. The added residential floor area (the change in maximum residential FAR times the
+    lot area) and quantiles of the percent change in capacity are computed from the same
+    arrays.
     """
-    tract_lot_data = pd.DataFrame(index=tracts_to_lots.keys(), columns=[
-        "2010_2014_percent_upzoned", 
-        "2010_2018_percent_upzoned", 
-        "2014_2018_percent_upzoned", 
-        # "2010_2014_average_years_since_upzoning", 
-        # "2010_2018_average_years_since_upzoning", 
-        # "2014_2018_average_years_since_upzoning", 
+    n = len(tracts_to_lots)
+    lot_lists = [list(lot_list) for lot_list in tracts_to_lots.values()]
+    lots_per_tract = np.array([len(lot_list) for lot_list in lot_lists])
+    lots = lot_df.loc[[lot for lot_list in lot_lists for lot in lot_list]]
+    # The position in tracts_to_lots of each lot's tract.
+    lot_tracts = np.repeat(np.arange(n), lots_per_tract)
+    area = _to_float(lots["lot_area"])
+    area_per_tract = np.bincount(lot_tracts, np.nan_to_num(area), minlength=n)
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    edges = np.unique(np.concatenate([1 / (1 + thresholds), 1 + thresholds]))
+    bins = len(edges) + 1
+    upper_bins = np.searchsorted(edges, 1 + thresholds) + 1
+    lower_bins = np.searchsorted(edges, 1 / (1 + thresholds))
+    suffixes = ["" if t == UPZONING_THRESHOLD else f"_{t * 100:g}" for t in thresholds]
+
+    columns = {}
+    for delta in DELTAS:
+        print("Now working on: ", delta)
+        start = delta[0]
+        end = delta[1]
+        capacity_start = _to_float(lots["max_resid_far"+start]) * area
+        capacity_end = _to_float(lots["max_resid_far"+end]) * area
+        valid = (capacity_start != 0) & ~np.isnan(capacity_start) & ~np.isnan(capacity_end)
+        ratio = capacity_end[valid] / capacity_start[valid]
+        # Histograms of each tract's ratios between the edges, with ratios on an edge in the
+        # bin above it in one and the bin below it in the other, so both comparisons are strict.
+        offsets = lot_tracts[valid] * bins
+        above = np.bincount(offsets + np.searchsorted(edges, ratio, "left"),
+                            minlength=n * bins).reshape(n, bins)
+        below = np.bincount(offsets + np.searchsorted(edges, ratio, "right"),
+                            minlength=n * bins).reshape(n, bins)
+        area_above = np.bincount(offsets + np.searchsorted(edges, ratio, "left"), area[valid],
+                                 minlength=n * bins).reshape(n, bins)
+        upzoned = np.cumsum(above[:, ::-1], axis=1)[:, ::-1]
+        downzoned = np.cumsum(below, axis=1)
+        area_upzoned = np.cumsum(area_above[:, ::-1], axis=1)[:, ::-1]
+        # Percents of all of the tract's lots and lot area, including those without capacities.
+        for suffix, upper_bin in zip(suffixes, upper_bins):
+            columns[start + "_" + end + "_percent_upzoned" + suffix] = (
+                100 * upzoned[:, upper_bin] / lots_per_tract)
+        for suffix, lower_bin in zip(suffixes, lower_bins):
+            columns[start + "_" + end + "_percent_downzoned" + suffix] = (
+                100 * downzoned[:, lower_bin] / lots_per_tract)
+        for suffix, upper_bin in zip(suffixes, upper_bins):
+            columns[start + "_" + end + "_percent_area_upzoned" + suffix] = np.divide(
+                100 * area_upzoned[:, upper_bin], area_per_tract, out=np.zeros(n),
+                where=area_per_tract > 0)
+
+        # Lots without any capacity at the start still add floor area.
+        added = capacity_end - capacity_start
+        with_capacities = ~np.isnan(added)
+        columns["d_" + start + "_" + end + "_resid_floor_area"] = np.bincount(
+            lot_tracts[with_capacities], added[with_capacities], minlength=n)
+        quantiles = _grouped_quantiles(lot_tracts[valid], 100 * (ratio - 1), n,
+                                       CAPACITY_CHANGE_QUANTILES)
+        for q, values in zip(CAPACITY_CHANGE_QUANTILES, quantiles.T):
+            columns[start + "_" + end + f"_percent_capacity_change_p{q * 100:g}"] = values
+
+        units_start = np.trunc(_to_float(lots["resid_units"+start]))
+        units_end = np.trunc(_to_float(lots["resid_units"+end]))
+        with_units = ~np.isnan(units_start) & ~np.isnan(units_end)
+        columns["d_" + start + "_" + end + "_resid_units"] = np.bincount(
+            lot_tracts[with_units], units_end[with_units] - units_start[with_units], minlength=n)
+
+    # 1 corresponds to one/two family, 2 and 3 correspond to multi-family, 4 corresponds to
+    # mixed_resid/comm. Only lots with a land use are counted.
+    land_use = _to_float(lots["land_use2010"])
+    land_use_lots = ~np.isnan(land_use)
+    mixed_development = lots["mixed_development2010"].to_numpy(dtype=object) == True
+    land_use_counts = np.bincount(lot_tracts[land_use_lots], minlength=n)
+    residential = np.bincount(lot_tracts[land_use_lots & (land_use < 5)], minlength=n)
+    mixed = np.bincount(lot_tracts[land_use_lots & mixed_development], minlength=n)
+    for tract in np.array(list(tracts_to_lots), dtype=object)[land_use_counts == 0]:
+        print("TRACT WITH NO LAND USE LOTS??", tract)
+    columns["orig_percent_residential"] = np.divide(
+        100 * residential, land_use_counts, out=np.zeros(n), where=land_use_counts > 0)
+    columns["orig_percent_mixed_development"] = np.divide(
+        100 * mixed, land_use_counts, out=np.zeros(n), where=land_use_counts > 0)
+
+    subsidized_tracts = tracts.encode(tracts.from_geoid(pd.read_csv(SUBSIDIZED_PROPERTIES_PATH)["tract_10"]))
+    subsidized_property_by_tract = pd.Series(subsidized_tracts).value_counts(sort=False)
+    columns["orig_percent_subsidized_properties"] = 100 * subsidized_property_by_tract.reindex(
+        list(tracts_to_lots), fill_value=0).to_numpy() / lots_per_tract
+    # Tracts with subsidized properties but no lots.
+    unmatched = subsidized_property_by_tract.drop(list(tracts_to_lots), errors="ignore")
+    print(dict(zip(tracts.decode(unmatched.index), unmatched)))
+
+    first = [
+        "2010_2014_percent_upzoned",
+        "2010_2018_percent_upzoned",
+        "2014_2018_percent_upzoned",
         "d_2010_2014_resid_units",
         "d_2010_2018_resid_units",
-        "d_2014_2018_resid_units", 
+        "d_2014_2018_resid_units",
         "orig_percent_residential",
-        # "orig_percent_limited_height",
         "orig_percent_mixed_development",
         "orig_percent_subsidized_properties",
-    ])
-    for delta in DELTAS:
-        print("Now working on: ", delta)
-        start = delta[0]
-        end = delta[1]
-        for tract, lot_list in tracts_to_lots.items():
-            # print(tract, lot_list)
-            upzoned = 0
-            # years_since_upzoned = []
-            lots_with_res_unit_data = 0
-            residential_units_start = 0
-            residential_units_end = 0
-            for lot in lot_list:
-                # prev = float(lot_df.at[lot, "max_resid_far"+str(start)])*float(lot_df.at[lot, "lot_area"])
-                # # for year in range(int(start)+1, int(end)+1):
-                # for year in [2002, 2010]:
-                # # for year in [start, end]:
-                #     curr = float(lot_df.at[lot, "max_resid_far"+str(year)])*float(lot_df.at[lot, "lot_area"])
-                #     if prev != 0 and curr/prev > 1.1:
-                #         upzoned += 1
-                #         # years_since_upzoned.append(int(end)-int(year))
-                #         break
-                #     prev = curr
-                capacity_start = float(lot_df.at[lot, "max_resid_far"+str(start)])*float(lot_df.at[lot, "lot_area"])
-                capacity_end = float(lot_df.at[lot, "max_resid_far"+str(end)])*float(lot_df.at[lot, "lot_area"])
-                if capacity_start != 0 and capacity_end/capacity_start > 1.1:
-                    upzoned += 1
-                try:
-                    _ = int(lot_df.at[lot, "resid_units"+str(start)])
-                    _ = int(lot_df.at[lot, "resid_units"+str(end)])
-                except:
-                    continue
-                else:
-                    residential_units_start += int(lot_df.at[lot, "resid_units"+str(start)])
-                    residential_units_end += int(lot_df.at[lot, "resid_units"+str(end)])
-                    lots_with_res_unit_data += 1
-                    # print(residential_units_start, residential_units_end)
-                try:
-                    _ = float(residential_units_end)
-                except:
-                    raise Exception()
-            tract_lot_data.at[tract, start + "_" + end + "_percent_upzoned"] = 100 * upzoned/len(lot_list)
-            # if len(years_since_upzoned) != 0:
-                # tract_lot_data.at[tract, start + "_" + end + "_average_years_since_upzoning"] = sum(years_since_upzoned)/len(years_since_upzoned)
-            tract_lot_data.at[tract, "d_" + start + "_" + end + "_resid_units"] = residential_units_end-residential_units_start
+        "2002_2010_percent_upzoned",
+        "d_2002_2010_resid_units",
+    ]
+    order = first + [column for column in columns if column not in first]
+    return pd.DataFrame({column: columns[column] for column in order},
+                        index=pd.Index(list(tracts_to_lots)))
 
 
-    for tract, lot_list in tracts_to_lots.items():
-        land_use_lots = 0
-        residential = 0
-        # limited_height = 0
-        mixed_development = 0
-        for lot in lot_list:    
-            # 1 corresponds to one/two family, 2 and 3 correspond to multi-family, 4 corresponds to mixed_resid/comm
-            if str(lot_df["land_use2010"][lot]).strip() != '':
-                try:
-                    if int(lot_df["land_use2010"][lot]) < 5:
-                        residential += 1
-                except:
-                    continue
-                land_use_lots += 1
-                # print(lot_df["mixed_development2010"][lot])
-                # print(type(lot_df["mixed_development2010"][lot]))
-                try:
-                    if lot_df["mixed_development2010"][lot].astype(bool) == True:
-                        mixed_development += 1
-                except AttributeError:
-                    if lot_df["mixed_development2010"][lot] == True:
-                        mixed_development += 1
-
-
-            # except ValueError:
-                # pass
-            # if lot_df["limited_height2010"][lot] == True:
-            #     limited_height += 1
-        try:
-            tract_lot_data.at[tract, "orig_percent_residential"] = 100 * residential/land_use_lots
-            tract_lot_data.at[tract, "orig_percent_mixed_development"] = 100 * mixed_development/land_use_lots
-        except:
-            print("TRACT WITH NO LAND USE LOTS??", tract)
-            tract_lot_data.at[tract, "orig_percent_residential"] = 0
-            tract_lot_data.at[tract, "orig_percent_mixed_development"] = 0
-        # tract_lot_data.at[tract, "orig_percent_limited_height"] = 100 * limited_height/len(lot_list)
-
-    subsidized_property_by_tract = pd.read_csv(SUBSIDIZED_PROPERTIES_PATH)["tract_10"].value_counts(sort=False)
-    subsidized_property_by_geoid = {}
-    for tract, count in subsidized_property_by_tract.items():
-        str_tract = str(tract)
-        if str_tract[-1] != "0":
-            itz_geoid = CODE_TO_COUNTY[str_tract[2:5]]+str(int(str_tract[5:9]))+"."+str(int(str_tract[9:]))
-        else:
-            itz_geoid = CODE_TO_COUNTY[str_tract[2:5]]+str(int(str_tract[5:9]))
-        subsidized_property_by_geoid[itz_geoid] = count
-    for itz_geoid, lot_list in tracts_to_lots.items():
-        try:
-            tract_lot_data.at[itz_geoid, "orig_percent_subsidized_properties"] = 100 * subsidized_property_by_geoid[itz_geoid]/len(lot_list)
-            del subsidized_property_by_geoid[itz_geoid]
-        except:
-            tract_lot_data.at[itz_geoid, "orig_percent_subsidized_properties"] = 0
-    print(subsidized_property_by_geoid)
-    return tract_lot_data
+def _grouped_quantiles(groups: np.ndarray, values: np.ndarray, n: int,
+                       quantiles) -> np.ndarray:
+    """Returns the quantiles of the values in each of n groups, interpolated linearly as by
+    np.quantile, with NaN for groups without values. The values of every group are sorted
+    together, so the result is an (n, len(quantiles)) array computed without a loop over groups.
+    """
+    order = np.lexsort((values, groups))
+    values = values[order]
+    sizes = np.bincount(groups, minlength=n)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    positions = (sizes[:, np.newaxis] - 1) * np.asarray(quantiles)[np.newaxis, :]
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, np.maximum(sizes - 1, 0)[:, np.newaxis])
+    result = np.full(positions.shape, np.nan)
+    present = sizes > 0
+    if present.any():
+        below = values[(starts[:, np.newaxis] + np.maximum(lower, 0))[present]]
+        above = values[(starts[:, np.newaxis] + np.maximum(upper, 0))[present]]
+        fraction = (positions - lower)[present]
+        result[present] = below + (above - below) * fraction
+    return result
+
+
+def _to_float(values: pd.Series) -> np.ndarray:
+    """Returns values as floats, with NaN for those that aren't numbers.
+    """
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
 
 
+@traced
 def _get_delta_data(tract_dfs, index) -> pd.DataFrame:
     """Calculates the changes for tract-specific data between starting and ending points. 
     """
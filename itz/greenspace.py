@@ -0,0 +1,365 @@
+"""Greenspace coverage of census tracts from land cover rasters, and their distance from parks.
+
+Rasters are read in the ENVI format (a flat binary file with a .hdr header, e.g. written by
+gdal_translate -of ENVI), which is memory-mapped, so only the tiles being read are ever loaded.
+They must be in New York State Plane Long Island feet (EPSG:2263), like the city's land cover
+datasets. Tract polygons are rasterized once onto every raster grid into a label grid of tract
+indexes, which is cached on disk next to the raster and reused by every raster on the same grid
+(e.g. later vintages of the same imagery). Coverage is then a bincount of the labels of the
+greenspace pixels of every tile, with the tiles counted in parallel.
+
+Distances from parks are measured to points spaced along the parks' boundaries, which are put
+in a KD-tree once per file, so the nearest park of every lot is a single query. Points inside a
+park are found with spatial.locate_points and are at distance 0.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, NamedTuple, Tuple
+import hashlib
+import json
+import os
+
+from .data import CENSUS_TRACT_GEODATA_PATH
+from .lazy import lazy_import
+from .spatial import (US_SURVEY_FOOT, TractGeometry, _ranges, get_centroids,
+                      get_tract_geometry, locate_points, to_state_plane)
+from .tracing import span, traced
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+scipy = lazy_import("scipy")
+
+
+GREENSPACE_COVERAGE_PATH = "in-the-zone-data/greenspace-orthoimagery/%s-greenspace-orthoimagery.csv"
+PARK_DISTANCE_PATH = "in-the-zone-data/greenspace-distance/tract_distance_from_park.csv"
+
+# Classes of the New York City land cover rasters counted as greenspace: tree canopy and
+# grass/shrub.
+GREENSPACE_CLASSES = (1, 2)
+
+# Rows and columns of the square tiles rasters are read and rasterized in.
+TILE_SIZE = 4096
+
+# Feet between the points parks' boundaries are densified into, which bounds the error of
+# distances from parks to half of it.
+PARK_POINT_SPACING = 50
+
+# Names of the numpy types of ENVI data type codes.
+ENVI_DTYPES = {
+    1: "uint8", 2: "int16", 3: "int32", 4: "float32", 5: "float64", 12: "uint16",
+    13: "uint32", 14: "int64", 15: "uint64",
+}
+
+_parks = {}
+
+
+class Raster(NamedTuple):
+    """A single band raster stored as a flat binary file, which is memory-mapped when read.
+    """
+    path: str
+    dtype: np.dtype
+    shape: Tuple[int, int]  # Rows and columns.
+    offset: int  # Bytes before the first pixel.
+    # The x and y of the upper left corner and the width and height of pixels, in feet.
+    transform: Tuple[float, float, float, float]
+
+
+def open_raster(path: str) -> Raster:
+    """Returns the raster in an ENVI file, read from the header at path.hdr or with its
+    extension replaced by .hdr.
+    """
+    header_path = path + ".hdr"
+    if not os.path.exists(header_path):
+        header_path = os.path.splitext(path)[0] + ".hdr"
+    header = _read_envi_header(header_path)
+    if int(header.get("bands", 1)) != 1:
+        raise ValueError(f"{path} has {header['bands']} bands, but only one can be read.")
+    if "map info" not in header:
+        raise ValueError(f"{path} has no map info.")
+    # {projection, reference column, reference row, x, y, pixel width, pixel height, ...}, with
+    # the reference pixel counted from 1 at the upper left corner of the raster.
+    map_info = [value.strip() for value in header["map info"].split(",")]
+    if any(value.lower() == "units=meters" for value in map_info):
+        raise ValueError(f"{path} is in meters, not state plane feet.")
+    column, row, x, y, width, height = (float(value) for value in map_info[1:7])
+    dtype = np.dtype(ENVI_DTYPES[int(header["data type"])])
+    if int(header.get("byte order", 0)) == 1:
+        dtype = dtype.newbyteorder(">")
+    return Raster(path, dtype, (int(header["lines"]), int(header["samples"])),
+                  int(header.get("header offset", 0)),
+                  (x - (column - 1) * width, y + (row - 1) * height, width, height))
+
+
+def _read_envi_header(path: str) -> Dict[str, str]:
+    """Returns the fields of an ENVI header, with braced values joined onto one line.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    if not text.startswith("ENVI"):
+        raise ValueError(f"{path} isn't an ENVI header.")
+    fields, key = {}, None
+    for line in text.replace("\r", "").split("\n")[1:]:
+        if key is not None and fields[key].count("{") > fields[key].count("}"):
+            fields[key] += " " + line.strip()
+        elif "=" in line:
+            key, value = line.split("=", 1)
+            key = key.strip().lower()
+            fields[key] = value.strip()
+    return {key: value.strip("{} ") for key, value in fields.items()}
+
+
+def read_window(raster: Raster, rows: slice, columns: slice) -> np.ndarray:
+    """Returns a window of a raster, reading only its pixels.
+    """
+    pixels = np.memmap(raster.path, dtype=raster.dtype, mode="r", offset=raster.offset,
+                       shape=raster.shape)
+    return np.array(pixels[rows, columns])
+
+
+def _tiles(shape: Tuple[int, int]):
+    """Yields the row and column slices of the tiles covering a grid.
+    """
+    for row in range(0, shape[0], TILE_SIZE):
+        for column in range(0, shape[1], TILE_SIZE):
+            yield (slice(row, min(row + TILE_SIZE, shape[0])),
+                   slice(column, min(column + TILE_SIZE, shape[1])))
+
+
+def _tract_edges(geometry: TractGeometry) -> np.ndarray:
+    """Returns the edges of every ring of the tracts in state plane feet, as rows of x0, y0,
+    x1, y1 and the tract's index.
+    """
+    x, y = to_state_plane(geometry.vertices[:, 0], geometry.vertices[:, 1])
+    ring_of_vertex = np.repeat(np.arange(len(geometry.ring_tracts)),
+                               np.diff(geometry.ring_offsets))
+    same_ring = np.flatnonzero(ring_of_vertex[:-1] == ring_of_vertex[1:])
+    return np.column_stack([x[same_ring], y[same_ring], x[same_ring + 1], y[same_ring + 1],
+                            geometry.ring_tracts[ring_of_vertex[same_ring]]])
+
+
+def rasterize(edges: np.ndarray, tracts: int, transform: Tuple[float, float, float, float],
+              rows: slice, columns: slice) -> np.ndarray:
+    """Returns the index of the tract containing the center of every pixel in a window of a
+    grid, or -1 for pixels outside every tract or in more than one.
+
+    Every row's crossings with the tracts' edges are sorted along the row, and the pixels
+    between each tract's first and second crossing, third and fourth, and so on are filled
+    with a cumulative sum, the same even-odd rule as spatial.locate_points.
+    """
+    left, top, width, height = transform
+    count_rows, count_columns = rows.stop - rows.start, columns.stop - columns.start
+    x0, y0, x1, y1, edge_tracts = edges.T
+    # Rows whose centers are on or above the lower end of an edge and below its upper end, as
+    # in spatial.locate_points.
+    low, high = np.minimum(y0, y1), np.maximum(y0, y1)
+    first = np.maximum(np.floor((top - high) / height - 0.5) + 1, rows.start).astype(int)
+    last = np.minimum(np.floor((top - low) / height - 0.5), rows.stop - 1).astype(int)
+    counts = np.maximum(last - first + 1, 0)
+    crossing_edges = np.repeat(np.arange(len(edges)), counts)
+    crossing_rows = first[crossing_edges] + _ranges(np.zeros(len(counts), dtype=int), counts)
+    y = top - (crossing_rows + 0.5) * height
+    e = crossing_edges
+    x = x0[e] + (y - y0[e]) * (x1[e] - x0[e]) / (y1[e] - y0[e])
+
+    # Pairs of consecutive crossings of a tract along a row.
+    keys = (crossing_rows - rows.start) * tracts + edge_tracts[e].astype(int)
+    order = np.lexsort((x, keys))
+    keys, x = keys[order], x[order]
+    group_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(keys)])
+    rank = np.arange(len(keys)) - np.repeat(group_starts, group_sizes)
+    pair = np.flatnonzero((rank % 2 == 0)[:-1] & (keys[1:] == keys[:-1]))
+    # Pixels whose centers are on or after the first crossing and before the second.
+    start = np.ceil((x[pair] - left) / width - 0.5).astype(int) - columns.start
+    end = np.ceil((x[pair + 1] - left) / width - 0.5).astype(int) - columns.start
+    row = keys[pair] // tracts
+    label = keys[pair] % tracts + 1
+    fills = np.zeros((count_rows, count_columns + 1), dtype=np.int64)
+    np.add.at(fills, (row, np.clip(start, 0, count_columns)), label)
+    np.add.at(fills, (row, np.clip(end, 0, count_columns)), -label)
+    labels = np.cumsum(fills[:, :-1], axis=1) - 1
+    # Pixels in overlapping tracts would get the sum of their labels, so the tracts covering
+    # every pixel are counted the same way and pixels in more than one are left out.
+    fills = np.zeros((count_rows, count_columns + 1), dtype=np.int32)
+    np.add.at(fills, (row, np.clip(start, 0, count_columns)), 1)
+    np.add.at(fills, (row, np.clip(end, 0, count_columns)), -1)
+    labels[np.cumsum(fills[:, :-1], axis=1) > 1] = -1
+    return labels
+
+
+def _rasterize_tile(job) -> None:
+    """Rasterizes the edges overlapping a tile into the label grid.
+    """
+    label_path, edges, tracts, transform, rows, columns = job
+    labels = np.load(label_path, mmap_mode="r+")
+    labels[rows, columns] = rasterize(edges, tracts, transform, rows, columns)
+    labels.flush()
+
+
+@traced
+def get_label_grid(raster: Raster, path: str=CENSUS_TRACT_GEODATA_PATH, processes=None
+                   ) -> Tuple[pd.Index, str]:
+    """Returns the tracts of a census tract GeoJSON and the path of a label grid of the index of
+    the tract containing every pixel of a raster, or -1 outside every tract.
+
+    The grid is rasterized tile by tile in parallel into a .npy file next to the raster, named
+    by the tracts file and the raster's grid, and reused until the tracts file changes.
+    """
+    geometry = get_tract_geometry(path)
+    key = repr((os.path.abspath(path), os.path.getmtime(path), raster.shape, raster.transform))
+    label_path = os.path.join(os.path.dirname(os.path.abspath(raster.path)), "labels-%s.npy"
+                              % hashlib.sha1(key.encode()).hexdigest()[:16])
+    if os.path.exists(label_path):
+        return geometry.ids, label_path
+
+    edges = _tract_edges(geometry)
+    left, top, width, height = raster.transform
+    dtype = np.int16 if len(geometry.ids) < np.iinfo(np.int16).max else np.int32
+    with span("rasterize_tracts", rows=raster.shape[0] * raster.shape[1]):
+        partial_path = label_path + ".partial.npy"
+        np.lib.format.open_memmap(partial_path, mode="w+", dtype=dtype, shape=raster.shape).flush()
+        jobs = []
+        for rows, columns in _tiles(raster.shape):
+            # Only edges spanning the tile's rows can cross them.
+            bottom, upper = top - rows.stop * height, top - rows.start * height
+            overlapping = ((np.maximum(edges[:, 1], edges[:, 3]) >= bottom)
+                           & (np.minimum(edges[:, 1], edges[:, 3]) <= upper))
+            jobs.append((partial_path, edges[overlapping], len(geometry.ids), raster.transform,
+                         rows, columns))
+        if processes != 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                list(executor.map(_rasterize_tile, jobs))
+        else:
+            for job in jobs:
+                _rasterize_tile(job)
+        os.replace(partial_path, label_path)
+    return geometry.ids, label_path
+
+
+def _count_tile(job) -> np.ndarray:
+    """Returns the number of pixels of the classes in every tract in a tile.
+    """
+    raster, label_path, classes, tracts, rows, columns = job
+    labels = np.load(label_path, mmap_mode="r")[rows, columns]
+    selected = np.isin(read_window(raster, rows, columns), classes) & (labels >= 0)
+    return np.bincount(labels[selected], minlength=tracts)
+
+
+@traced
+def get_greenspace_coverage(raster_path: str, path: str=CENSUS_TRACT_GEODATA_PATH,
+                            classes=GREENSPACE_CLASSES, processes=None) -> pd.Series:
+    """Returns the square meters of greenspace in every tract of a census tract GeoJSON, from
+    the pixels of a land cover raster in the given classes.
+    """
+    raster = open_raster(raster_path)
+    ids, label_path = get_label_grid(raster, path, processes)
+    jobs = [(raster, label_path, list(classes), len(ids), rows, columns)
+            for rows, columns in _tiles(raster.shape)]
+    with span("count_greenspace", rows=raster.shape[0] * raster.shape[1]):
+        if processes != 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                pixels = sum(executor.map(_count_tile, jobs))
+        else:
+            pixels = sum(_count_tile(job) for job in jobs)
+    _, _, width, height = raster.transform
+    square_meters = pixels * abs(width * height) * US_SURVEY_FOOT ** 2
+    return pd.Series(square_meters, index=ids, name="SQUARE_METER_GREENSPACE_COVERAGE")
+
+
+def get_park_geometry(path: str) -> TractGeometry:
+    """Returns the boundaries of the parks in a GeoJSON of park polygons, as the rings of a
+    TractGeometry whose ids are the parks' indexes in the file.
+    """
+    with open(path, "r") as f:
+        geodata = json.load(f)
+    rings, ring_parks = [], []
+    for park, feature in enumerate(geodata["features"]):
+        geometry = feature["geometry"]
+        if geometry is None or geometry["type"] not in ("Polygon", "MultiPolygon"):
+            continue
+        polygons = ([geometry["coordinates"]] if geometry["type"] == "Polygon"
+                    else geometry["coordinates"])
+        for polygon in polygons:
+            for ring in polygon:
+                rings.append(np.asarray(ring, dtype=float)[:, :2])
+                ring_parks.append(park)
+    return TractGeometry(pd.RangeIndex(len(geodata["features"])), np.concatenate(rings),
+                         np.cumsum([0] + [len(ring) for ring in rings]), np.array(ring_parks))
+
+
+@traced
+def get_parks(path: str, spacing=PARK_POINT_SPACING
+              ) -> Tuple[TractGeometry, scipy.spatial.cKDTree]:
+    """Returns the boundaries of the parks in a GeoJSON and a KD-tree of points at most spacing
+    feet apart along them, cached until the file changes.
+    """
+    key = (path, os.path.getmtime(path), spacing)
+    if key in _parks:
+        return _parks[key]
+    geometry = get_park_geometry(path)
+    x, y = to_state_plane(geometry.vertices[:, 0], geometry.vertices[:, 1])
+    ring_of_vertex = np.repeat(np.arange(len(geometry.ring_tracts)),
+                               np.diff(geometry.ring_offsets))
+    same_ring = np.flatnonzero(ring_of_vertex[:-1] == ring_of_vertex[1:])
+    x0, y0 = x[same_ring], y[same_ring]
+    dx, dy = x[same_ring + 1] - x0, y[same_ring + 1] - y0
+    # Every edge is split into equal steps no longer than spacing. Its end is the start of the
+    # ring's next edge.
+    steps = np.maximum(np.ceil(np.hypot(dx, dy) / spacing), 1).astype(int)
+    edges = np.repeat(np.arange(len(same_ring)), steps)
+    fractions = _ranges(np.zeros(len(steps), dtype=int), steps) / steps[edges]
+    points = np.column_stack([x0[edges] + fractions * dx[edges],
+                              y0[edges] + fractions * dy[edges]])
+    with span("build_park_tree", rows=len(points)):
+        _parks[key] = (geometry, scipy.spatial.cKDTree(points))
+    return _parks[key]
+
+
+@traced
+def get_distances_from_parks(x: np.ndarray, y: np.ndarray, path: str,
+                             spacing=PARK_POINT_SPACING) -> np.ndarray:
+    """Returns the distance in feet from every point, given in state plane feet, to the nearest
+    park in a GeoJSON of park polygons, 0 inside parks and NaN for points without coordinates.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    geometry, tree = get_parks(path, spacing)
+    distances = np.full(len(x), np.nan)
+    present = ~np.isnan(x) & ~np.isnan(y)
+    distances[present], _ = tree.query(np.column_stack([x[present], y[present]]), workers=-1)
+    distances[present & (locate_points(x, y, geometry) >= 0)] = 0
+    return distances
+
+
+@traced
+def get_tract_distances_from_parks(path: str, lot_df: pd.DataFrame=None, year="2010",
+                                   geodata_path: str=CENSUS_TRACT_GEODATA_PATH) -> pd.Series:
+    """Returns the distance in feet from every tract to the nearest park in a GeoJSON of park
+    polygons.
+
+    With lot_df (lot data with ITZ_GEOID, x_coord and y_coord columns), it is the average
+    distance of the tract's lots weighted by their residential units in the year, as a proxy for
+    where the tract's residents live, or the unweighted average in tracts without residential
+    units. Otherwise, it is the distance of the tract's centroid.
+    """
+    if lot_df is None:
+        geometry = get_tract_geometry(geodata_path)
+        centroids = get_centroids(geometry)
+        return pd.Series(get_distances_from_parks(centroids[:, 0], centroids[:, 1], path),
+                         index=geometry.ids, name=f"{year}_distance_from_park")
+
+    distances = get_distances_from_parks(lot_df["x_coord"], lot_df["y_coord"], path)
+    codes, ids = pd.factorize(lot_df["ITZ_GEOID"])
+    located = (codes >= 0) & ~np.isnan(distances)
+    codes, distances = codes[located], distances[located]
+    units = pd.to_numeric(lot_df["resid_units" + year], errors="coerce").to_numpy()[located]
+    units = np.where(np.isnan(units), 0, units)
+    weights = np.bincount(codes, units, len(ids))
+    counts = np.bincount(codes, minlength=len(ids))
+    weighted = np.bincount(codes, units * distances, len(ids))
+    unweighted = np.bincount(codes, distances, len(ids))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averages = np.where(weights > 0, weighted / weights, unweighted / counts)
+    return pd.Series(averages, index=pd.Index(ids, name="ITZ_GEOID"),
+                     name=f"{year}_distance_from_park")
@@ -0,0 +1,42 @@
+"""Lazily imported modules.
+
+numpy, pandas, scipy and semopy take most of a second or more to import, and every module of
+the package needs some of them, so they are imported with lazy_import: the module is created
+at once but only executed the first time one of its attributes is used. Modules importing them
+this way use postponed annotations (from __future__ import annotations), so that annotations
+such as pd.DataFrame don't load them either. Submodules that their packages don't import,
+such as semopy.inspector, can be imported lazily too.
+"""
+
+import importlib.util
+import sys
+import types
+
+
+class _LazySubmodule(types.ModuleType):
+    """Stand-in for a submodule, which is imported along with its packages when one of its
+    attributes is first used.
+    """
+
+    def __getattr__(self, attr: str):
+        return getattr(importlib.import_module(self.__name__), attr)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Returns a module that is only executed when one of its attributes is first used, or the
+    module itself if it was already imported.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if "." in name:
+        # Finding a submodule imports its package, so it's found when first used instead.
+        return _LazySubmodule(name)
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -1,17 +1,27 @@
 """Implementation of SEM for modeling the effect of upzoning on various urban metrics.
 """
 
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from typing import Dict, List, Set, Tuple
+import hashlib
 import itertools
+import logging
 import sys
 import time
 
-import pandas as pd
-import semopy
+from .data import CODE_TO_COUNTY, DENSIFICATION_MEASURES, CONTROL_VARS, DEPENDENT_VARS, EARLY_UPZONING
+from .lazy import lazy_import
+from .tracing import span, traced
+from .util import log_transform, square_transform, sqrt_transform, regress, vectorized_transform
 
-from .data import DENSIFICATION_MEASURES, CONTROL_VARS, DEPENDENT_VARS, EARLY_UPZONING
-from .util import log_transform, square_transform, sqrt_transform, regress
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+scipy = lazy_import("scipy")
+semopy = lazy_import("semopy")
+inspector = lazy_import("semopy.inspector")
 
 
 # DEPENDENT_VARIABLE_COVARIANCE_SIGNIFICANCE_THRESHOLD = 0.005
@@ -20,6 +30,42 @@ DEPENDENT_VARIABLE_COVARIANCE_SIGNIFICANCE_THRESHOLD = 1
 CONTROL_COVARIANCE_SIGNIFICANCE_THRESHOLD = 0.05
 # REGRESSION_SIGNIFICANCE_THRESHOLD = 0.01
 REGRESSION_SIGNIFICANCE_THRESHOLD = 0.5
+# Relative convergence tolerance and iteration cap for iterated SUR in fit_recursive.
+SUR_TOLERANCE = 1e-10
+SUR_MAX_ITERATIONS = 500
+# Relative convergence tolerance and iteration cap for the EM fit of the saturated model that
+# FIML fit statistics are measured against.
+SATURATED_TOLERANCE = 1e-10
+SATURATED_MAX_ITERATIONS = 10000
+# Rows per batch when robust_statistics accumulates per-tract scores and fourth moments.
+ROBUST_CHUNK_ROWS = 8192
+
+# Array versions of the transformations fit applies to variables with these prefixes.
+PREFIX_TRANSFORMATIONS = {
+    "log_": lambda X: vectorized_transform(X, "log"),
+    "square_": lambda X: vectorized_transform(X, "square") / 10000,
+    "sqrt_": lambda X: vectorized_transform(X, "sqrt"),
+}
+
+# Census tracts are numbered in geographic order within each borough, so cross_validate treats
+# tracts whose numbers fall in the same run of this many as one neighborhood.
+NEIGHBORHOOD_TRACT_RANGE = 100
+
+# Upzoning exposures permutation_test shuffles by default.
+PERMUTATION_EXPOSURE = ("2002_2010_percent_upzoned", "2010_2018_percent_upzoned")
+# Number of quantiles of original population density permutation_test stratifies by.
+PERMUTATION_DENSITY_STRATA = 5
+# Permutations per job of permutation_test. Each job draws from its own random stream, so the
+# permutations don't depend on the number of processes.
+PERMUTATION_CHUNK_SIZE = 50
+
+# Kinds of parameters fit_groups can constrain to be equal across groups.
+EQUALITY_CONSTRAINTS = ("loadings", "regressions", "variances", "covariances")
+
+# Covariance matrices and sample sizes from get_sufficient_statistics, by dataset fingerprint.
+_sufficient_statistics = {}
+# Fits of search_specification's candidate models, by covariance matrix and description hash.
+_specification_fits = {}
 
 
 class ModelName(Enum):
@@ -75,11 +121,69 @@ MODEL_TYPE_UPZONED_VARS = {
 }
 
 
-def fit(desc: str, variables: Set[str], data: pd.DataFrame, verbose=False) -> semopy.Model:
+@traced
+def fit(desc: str, variables: Set[str], data: pd.DataFrame, verbose=False,
+        equationwise=True, from_covariance=False, obj="MLW") -> semopy.Model:
     """Fits an SEM to a dataset. 
+
+    Recursive path models over observed variables are solved equation by equation (see
+    fit_recursive) unless equationwise is False; other models use semopy's optimizer.
+
+    With from_covariance, the model is fitted from the dataset's cached covariance matrix (see
+    get_sufficient_statistics) instead of from a transformed copy of the data. The estimates
+    are the same, but the fitted model has no data, so e.g. semopy.estimate_means can't be used.
+
+    With obj="FIML", tracts with missing values are kept and the model is fitted by full
+    information maximum likelihood (see fit_fiml).
     """
-    # Transform data
+    if from_covariance and obj == "FIML":
+        raise ValueError("FIML needs the data, not just its covariance matrix.")
+    if from_covariance:
+        cov, n_samples = get_sufficient_statistics(data)
+        model = semopy.Model(desc)
+        cov = cov.loc[model.vars["observed"], model.vars["observed"]]
+        with span("semopy_fit", rows=n_samples, variables=len(cov.columns)) as info:
+            info["equationwise"] = equationwise and fit_recursive(model, cov=cov,
+                                                                  n_samples=n_samples)
+            if not info["equationwise"]:
+                model.fit(cov=cov, n_samples=n_samples)
+        return model
+
+    model_data = transform_data(variables, data, verbose)
+    model_data.to_csv("in-the-zone-data/all-data-integrated-itz-data.csv")
+
+    # Create and fit model
 
+    if verbose:
+        print("Constructing SEM model... ", end="")
+        sys.stdout.flush()
+    model = semopy.Model(desc)
+    # model = semopy.ModelMeans(desc)
+    if verbose:
+        print("done!")
+
+    if verbose:
+        print("Fitting SEM to data... ", end="")
+        sys.stdout.flush()
+    start_time = time.time()
+    with span("semopy_fit", rows=len(model_data), variables=len(model_data.columns)) as info:
+        if obj == "FIML":
+            fit_fiml(model, model_data, equationwise)
+        else:
+            info["equationwise"] = equationwise and fit_recursive(model, model_data)
+            if not info["equationwise"]:
+                model.fit(model_data, obj=obj)
+    duration = time.time() - start_time
+    if verbose:
+        print(f"done! Model fitted in {duration // 60}m {round(duration, 1) % 60}s")
+    return model
+
+
+def transform_data(variables: Set[str], data: pd.DataFrame, verbose=False) -> pd.DataFrame:
+    """Returns the columns of a dataset a model uses, applying the transformations named by the
+    variables' log_, square_ and sqrt_ prefixes and keeping tracts with people in them. The
+    dataset isn't modified and nothing is written.
+    """
     log_transform_vars = set()
     square_transform_vars = set()
     sqrt_transform_vars = set()
@@ -92,7 +196,7 @@ def fit(desc: str, variables: Set[str], data: pd.DataFrame, verbose=False) -> se
         elif var.startswith("log_"):
             model_data[var[4:]] = data[var[4:]]
             log_transform_vars.add(var[4:])
-        elif var[:4].startswith("square_"):
+        elif var.startswith("square_"):
             model_data[var[7:]] = data[var[7:]]
             square_transform_vars.add(var[7:])
         elif var.startswith("sqrt_"):
@@ -104,7 +208,6 @@ def fit(desc: str, variables: Set[str], data: pd.DataFrame, verbose=False) -> se
     # print(data.index)
     model_data = model_data[model_data["orig_pop_density"] > 0]
     # model_data = model_data.dropna()
-    model_data.to_csv("in-the-zone-data/all-data-integrated-itz-data.csv")
     if verbose:
         print(model_data, "after fit drop")
     if verbose:
@@ -116,30 +219,1015 @@ def fit(desc: str, variables: Set[str], data: pd.DataFrame, verbose=False) -> se
         model_data["square_" + var] = square_transform(model_data[var])
     for var in sqrt_transform_vars:
         model_data["sqrt_" + var] = sqrt_transform(model_data[var])
-        print(var, "sqrt_"+var)
     if verbose:
         print("done!")
+    return model_data
 
-    # Create and fit model
 
+@traced
+def get_sufficient_statistics(data: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    """Returns the covariance matrix of every numeric column of a dataset and its log_, square_
+    and sqrt_ transformations, along with the number of samples.
+
+    Rows are filtered as in fit, and covariances are computed as semopy does, so any model's
+    sub-block of the matrix is what semopy would compute from its data. The result is cached
+    for each dataset.
+    """
+    numeric = data.select_dtypes("number")
+    fingerprint = (tuple(numeric.columns),
+                   int(pd.util.hash_pandas_object(numeric, index=False).sum()))
+    if fingerprint in _sufficient_statistics:
+        return _sufficient_statistics[fingerprint]
+
+    if "orig_pop_density" in numeric.columns:
+        numeric = numeric[numeric["orig_pop_density"] > 0]
+    columns = {var: numeric[var].to_numpy(dtype=float) for var in numeric.columns
+               if not var.startswith("Unnamed")}
+    for var, vals in list(columns.items()):
+        for prefix, transformation in PREFIX_TRANSFORMATIONS.items():
+            columns[prefix + var] = transformation(vals)
+    values = np.column_stack(list(columns.values()))
+    cov = np.ma.cov(np.ma.masked_invalid(values), rowvar=False, bias=True).data
+    statistics = (pd.DataFrame(cov, index=list(columns), columns=list(columns)), len(numeric))
+    _sufficient_statistics[fingerprint] = statistics
+    return statistics
+
+
+def fit_recursive(model: semopy.Model, data: pd.DataFrame=None, cov: pd.DataFrame=None,
+        n_samples: int=None) -> bool:
+    """Fits a recursive path model over observed variables without semopy's optimizer.
+
+    With no latent variables and no feedback loops, the ML estimates of each equation are its
+    least squares solution, computed from the sample covariance matrix. Equations whose
+    residuals are declared to covary are solved together by iterated SUR. Covariances between
+    exogenous variables are set to their sample values.
+
+    Takes either data or a covariance matrix and number of samples, as semopy.Model.fit does.
+    The model is left as if semopy had fitted it with MLW, so inspect(), calc_stats() and
+    report() work as usual. Returns False, without fitting, if the model is not of this form.
+    """
+    if type(model) is not semopy.Model or model.vars["latent"]:
+        return False
+    model.load(data=data, cov=cov, n_samples=n_samples)
+    structure = _recursive_structure(model)
+    if structure is None:
+        return False
+    equations, blocks, covariances, exogenous = structure
+    position = {var: i for i, var in enumerate(model.vars["observed"])}
+    cov = model.mx_cov
+
+    estimates = {name: cov[position[lval], position[rval]]
+                 for name, (lval, rval) in exogenous.items()}
+    iterations = 1
+    # Solve the equations with uncorrelated residuals in batches of equal size.
+    by_size = {}
+    for block in blocks:
+        if len(block) == 1:
+            by_size.setdefault(len(equations[block[0]][0]), []).append(block[0])
+    for size, outcomes in by_size.items():
+        x = np.array([[position[pred] for pred, _ in equations[var][0]] for var in outcomes],
+                     dtype=int).reshape(len(outcomes), size)
+        y = np.array([position[var] for var in outcomes])
+        s_xy = cov[x, y[:, None]]
+        coefs = np.linalg.solve(cov[x[:, :, None], x[:, None, :]], s_xy[..., None])[..., 0]
+        resid = cov[y, y] - np.einsum("ij,ij->i", s_xy, coefs)
+        for var, coef, var_resid in zip(outcomes, coefs, resid):
+            for (_, name), val in zip(equations[var][0], coef):
+                estimates[name] = val
+            estimates[equations[var][1]] = var_resid
+    for block in blocks:
+        if len(block) > 1:
+            block_estimates, block_iterations = _fit_sur(block, equations, covariances,
+                                                         position, cov)
+            estimates.update(block_estimates)
+            iterations = max(iterations, block_iterations)
+
+    names = [name for name, param in model.parameters.items() if param.active]
+    x = np.array([estimates[name] for name in names])
+    model.param_vals = x
+    model.update_matrices(x)
+    model.last_result = semopy.solver.SolverResult(
+        fun=model.obj_mlw(x), success=True, n_it=iterations, x=x,
+        message="Solved equation by equation", name_method="equationwise", name_obj="MLW")
+    return True
+
+
+def fit_fiml(model: semopy.Model, data: pd.DataFrame, warm_start=True
+             ) -> semopy.solver.SolverResult:
+    """Fits a model by full information maximum likelihood.
+
+    Tracts are grouped by which variables they are missing, and each group is reduced to its
+    size, mean and covariance, so every evaluation of the likelihood and its analytic gradient
+    inverts one sub-covariance matrix per missingness pattern rather than one per tract. The
+    variable means are estimated along with the model. With warm_start, the optimizer starts
+    from the estimates of the tracts missing no variables, by fit_recursive if it applies and
+    otherwise by semopy's MLW fit.
+
+    The model is left as if semopy had fitted it with FIML, with last_result.fun the -2
+    log-likelihood up to a constant (see fiml_statistics). Its inspect() standard errors treat
+    every tract as complete; evaluate reports ones that don't (see fiml_std_errors). Raises
+    ValueError if the likelihood can't be evaluated at the starting values, i.e. their
+    covariance matrix isn't positive definite.
+    """
+    observed = model.vars["observed"]
+    complete = data.dropna(subset=observed)
+    if warm_start and len(complete) > len(observed):
+        if not fit_recursive(model, complete):
+            model.fit(complete)
+        start = model.param_vals.copy()
+        # A clean slate sets the fixed exogenous covariances to those of every tract.
+        model.load(data, clean_slate=True)
+        model.param_vals = start
+        model.update_matrices(start)
+    else:
+        model.load(data)
+    values = model.mx_data
+    groups = _missingness_patterns(values)
+    num_params = len(model.param_vals)
+    num_vars = values.shape[1]
+
+    def _objective(z):
+        # -2 log-likelihood, up to a constant, and its gradient.
+        x = z / scale
+        model.update_matrices(x[:num_params])
+        means = x[num_params:]
+        sigma, (m, c) = model.calc_sigma()
+        loss = 0.0
+        grad_sigma = np.zeros((num_vars, num_vars))
+        grad_means = np.zeros(num_vars)
+        for cols, n, mean, cov in groups:
+            try:
+                chol = np.linalg.cholesky(sigma[np.ix_(cols, cols)])
+            except np.linalg.LinAlgError:
+                return np.inf, np.zeros_like(x)
+            inv = scipy.linalg.cho_solve((chol, True), np.identity(len(cols)))
+            diff = mean - means[cols]
+            moments = cov + np.outer(diff, diff)
+            loss += n * (2 * np.log(np.diag(chol)).sum() + np.einsum("ij,ji->", inv, moments))
+            grad_sigma[np.ix_(cols, cols)] += n * (inv - inv @ moments @ inv)
+            grad_means[cols] -= 2 * n * inv @ diff
+        grad_params = np.einsum("ij,kij->k", grad_sigma, np.array(model.calc_sigma_grad(m, c)))
+        return loss, np.concatenate([grad_params, grad_means]) / scale
+
+    start = np.concatenate([model.param_vals, np.nanmean(values, axis=0)])
+    scale = np.ones(len(start))
+    if not np.isfinite(_objective(start)[0]):
+        raise ValueError("the starting values' covariance matrix isn't positive definite")
+    # The parameters range from shares to squared dollars, so the optimizer works on them
+    # divided by their standard errors at the start.
+    model.update_matrices(start[:num_params])
+    sigma = model.calc_sigma()[0]
+    mean_information = np.zeros(num_vars)
+    for cols, n, _, _ in groups:
+        mean_information[cols] += n * np.linalg.inv(sigma[np.ix_(cols, cols)]).diagonal()
+    scale = np.sqrt(np.concatenate([_fiml_information(model, groups).diagonal(),
+                                    mean_information]))
+    scale[~(scale > 0)] = 1
+    bounds = [tuple(None if bound is None else bound * s for bound in pair)
+              for pair, s in zip(model.get_bounds() + [(None, None)] * num_vars, scale)]
+    result = scipy.optimize.minimize(_objective, start * scale, jac=True, method="L-BFGS-B",
+                                     bounds=bounds)
+    x = result.x[:num_params] / scale[:num_params]
+    model.param_vals = x
+    model.update_matrices(x)
+    model.last_result = semopy.solver.SolverResult(
+        fun=result.fun, success=result.success, n_it=result.nit, x=x, message=result.message,
+        name_method="L-BFGS-B", name_obj="FIML")
+    return model.last_result
+
+
+def _fiml_information(model: semopy.Model, groups: List[Tuple]) -> np.ndarray:
+    """Returns the expected Fisher information about a model's active parameters of tracts
+    grouped by missingness pattern, each group's about the covariances of the variables it has.
+    """
+    sigma, (m, c) = model.calc_sigma()
+    sigma_grads = np.array(model.calc_sigma_grad(m, c))
+    information = np.zeros((len(sigma_grads), len(sigma_grads)))
+    for cols, n, _, _ in groups:
+        inv = np.linalg.inv(sigma[np.ix_(cols, cols)])
+        information += _expected_information(inv @ sigma_grads[:, cols][:, :, cols], n)
+    return information
+
+
+def _missingness_patterns(values: np.ndarray) -> List[Tuple[np.ndarray, int, np.ndarray,
+                                                            np.ndarray]]:
+    """Groups the rows of values by which columns they have, returning the columns, number of
+    rows, mean and (biased) covariance of each group with any.
+    """
+    present = np.isfinite(values)
+    patterns, pattern_index = np.unique(present, axis=0, return_inverse=True)
+    groups = []
+    for i, pattern in enumerate(patterns):
+        if not pattern.any():
+            continue
+        rows = values[pattern_index.ravel() == i][:, pattern]
+        mean = rows.mean(axis=0)
+        groups.append((np.flatnonzero(pattern), len(rows), mean,
+                       (rows - mean).T @ (rows - mean) / len(rows)))
+    return groups
+
+
+def _fiml_loss(groups: List[Tuple], sigma: np.ndarray, means: np.ndarray) -> float:
+    """Returns -2 log-likelihood, up to the same constant as fit_fiml's, of the grouped rows
+    under a normal distribution.
+    """
+    loss = 0.0
+    for cols, n, mean, cov in groups:
+        chol = np.linalg.cholesky(sigma[np.ix_(cols, cols)])
+        diff = np.linalg.solve(chol, mean - means[cols])
+        loss += n * (2 * np.log(np.diag(chol)).sum() + diff @ diff
+                     + np.trace(scipy.linalg.cho_solve((chol, True), cov)))
+    return loss
+
+
+def _fit_saturated(groups: List[Tuple], num_vars: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the FIML means and covariance matrix of grouped rows with missing values, with
+    no structure imposed, by the EM algorithm.
+    """
+    num_rows = sum(n for _, n, _, _ in groups)
+    means = np.zeros(num_vars)
+    counts = np.zeros(num_vars)
+    for cols, n, mean, _ in groups:
+        means[cols] += n * mean
+        counts[cols] += n
+    means /= counts
+    sigma = np.zeros((num_vars, num_vars))
+    for cols, n, mean, cov in groups:
+        sigma[cols, cols] += n * (cov.diagonal() + (mean - means[cols]) ** 2)
+    sigma = np.diag(sigma.diagonal() / counts)
+    loss = _fiml_loss(groups, sigma, means)
+    for _ in range(SATURATED_MAX_ITERATIONS):
+        # Expected sums of x and x x' given each group's observed variables.
+        sums, products = np.zeros(num_vars), np.zeros((num_vars, num_vars))
+        for cols, n, mean, cov in groups:
+            missing = np.setdiff1d(np.arange(num_vars), cols)
+            coefs = np.linalg.solve(sigma[np.ix_(cols, cols)], sigma[np.ix_(cols, missing)]).T
+            # Each row's missing values are predicted as means_m + coefs (x_o - means_o).
+            predicted = means[missing] + coefs @ (mean - means[cols])
+            group_mean = np.empty(num_vars)
+            group_mean[cols], group_mean[missing] = mean, predicted
+            group_cov = np.zeros((num_vars, num_vars))
+            group_cov[np.ix_(cols, cols)] = cov
+            group_cov[np.ix_(missing, cols)] = coefs @ cov
+            group_cov[np.ix_(cols, missing)] = cov @ coefs.T
+            group_cov[np.ix_(missing, missing)] = (
+                coefs @ cov @ coefs.T + sigma[np.ix_(missing, missing)]
+                - coefs @ sigma[np.ix_(cols, missing)])
+            sums += n * group_mean
+            products += n * (group_cov + np.outer(group_mean, group_mean))
+        means = sums / num_rows
+        sigma = products / num_rows - np.outer(means, means)
+        new_loss = _fiml_loss(groups, sigma, means)
+        converged = loss - new_loss <= SATURATED_TOLERANCE * abs(new_loss)
+        loss = new_loss
+        if converged:
+            break
+    return means, sigma
+
+
+@traced
+def fiml_statistics(model: semopy.Model) -> Dict[str, float]:
+    """Returns the fit statistics of a model fitted by fit_fiml, as semopy.calc_stats does for
+    other objectives.
+
+    The chi-square is the difference between the -2 log-likelihoods of the model and of the
+    saturated model (free means and covariances, fitted by EM). The baseline is semopy's
+    independence model, whose FIML estimates are each variable's mean and variance over the
+    tracts that have it, with semopy's degrees of freedom. The log-likelihood, AIC and BIC count
+    the means among the parameters.
+    """
+    values = model.mx_data
+    groups = _missingness_patterns(values)
+    num_vars = values.shape[1]
+    num_rows = sum(n for _, n, _, _ in groups)
+    means, sigma = _fit_saturated(groups, num_vars)
+    saturated = _fiml_loss(groups, sigma, means)
+    counts = np.isfinite(values).sum(axis=0)
+    variances = np.nanvar(values, axis=0)
+    chi2 = max(model.last_result.fun - saturated, 0.0)
+    chi2_base = (counts * (np.log(variances) + 1)).sum() - saturated
+    dof = semopy.stats.calc_dof(model)
+    # Variances of exogenous variables are fixed at their sample values in semopy's baseline.
+    base = semopy.Model(model.description, baseline=True)
+    dof_base = num_vars * (num_vars + 1) // 2 - sum(param.active
+                                                    for param in base.parameters.values())
+    num_params = len(model.param_vals) + num_vars
+    loglik = -(model.last_result.fun
+               + sum(n * len(cols) for cols, n, _, _ in groups) * np.log(2 * np.pi)) / 2
+    gfi = semopy.stats.calc_gfi(model, chi2, chi2_base)
+    return {"DoF": dof, "DoF Baseline": dof_base, "chi2": chi2,
+            "chi2 p-value": scipy.stats.chi2.sf(chi2, dof), "chi2 Baseline": chi2_base,
+            "CFI": semopy.stats.calc_cfi(model, dof, chi2, dof_base, chi2_base),
+            "GFI": gfi, "AGFI": semopy.stats.calc_agfi(model, dof, dof_base, gfi),
+            "NFI": semopy.stats.calc_nfi(model, chi2, chi2_base),
+            "TLI": semopy.stats.calc_tli(model, dof, chi2, dof_base, chi2_base),
+            "RMSEA": semopy.stats.calc_rmsea(model, chi2, dof),
+            "AIC": 2 * (num_params - loglik), "BIC": np.log(num_rows) * num_params - 2 * loglik,
+            "LogLik": loglik}
+
+
+@traced
+def fiml_std_errors(model: semopy.Model) -> np.ndarray:
+    """Returns the standard errors of the active parameters of a model fitted by fit_fiml.
+
+    They come from the expected information of the tracts' observed variables: each missingness
+    pattern contributes the information of its tracts about the covariances of the variables
+    they have, so tracts missing variables count for less, as they don't in model.inspect(). The
+    means are free, so their information doesn't change the parameters' standard errors.
+    """
+    information = _fiml_information(model, _missingness_patterns(model.mx_data))
+    try:
+        variances = np.linalg.inv(information).diagonal().copy()
+    except np.linalg.LinAlgError:
+        variances = np.linalg.pinv(information).diagonal().copy()
+    variances[variances < 0] = np.nan
+    return np.sqrt(variances)
+
+
+@traced
+def fit_groups(desc: str, variables: Set[str], data: pd.DataFrame, equal: Tuple[str, ...]=(),
+               processes: int=None, verbose=False, equationwise=True, obj="MLW"
+               ) -> Tuple[Dict[str, semopy.Model], Dict[str, pd.DataFrame], pd.DataFrame]:
+    """Fits an SEM to the tracts of each borough (the first two letters of the ITZ_GEOID).
+
+    The boroughs are first fitted separately, in parallel over processes (all CPUs by default).
+    Then, for each kind of parameter in equal (see EQUALITY_CONSTRAINTS), in order, the groups
+    are fitted jointly with those parameters and the ones before them held equal across
+    boroughs, warm-starting from the previous fit.
+
+    Returns the fitted model and parameter table of each borough, from the most constrained fit,
+    and the invariance tests: the chi-square and degrees of freedom of every fit, and the
+    likelihood-ratio test of each fit against the one before it.
+    """
+    unknown = set(equal) - set(EQUALITY_CONSTRAINTS)
+    if unknown:
+        raise ValueError(f"Can't constrain {', '.join(sorted(unknown))} to be equal.")
+    if equal and obj != "MLW":
+        raise ValueError("Equality constraints are only supported with the MLW objective.")
+    model_data = transform_data(variables, data, verbose)
+    boroughs = data.loc[model_data.index, "ITZ_GEOID"].str[:2]
+    num_observed = len(semopy.Model(desc).vars["observed"])
+    group_data = {borough: model_data[boroughs == borough]
+                  for borough in CODE_TO_COUNTY.values()
+                  if (boroughs == borough).sum() > num_observed}
+
+    jobs = [(desc, group, equationwise, obj) for group in group_data.values()]
+    with span("fit_groups_separately", groups=len(jobs)):
+        if len(jobs) > 1 and processes != 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                estimates = list(executor.map(_fit_group, jobs))
+        else:
+            estimates = [_fit_group(job) for job in jobs]
+    models = {}
+    for (borough, group), (param_vals, last_result) in zip(group_data.items(), estimates):
+        model = semopy.Model(desc)
+        model.load(group)
+        model.param_vals = param_vals
+        model.update_matrices(param_vals)
+        model.last_result = last_result
+        models[borough] = model
+
+    num_moments = sum(semopy.stats.calc_dof(model) + len(model.param_vals)
+                      for model in models.values())
+    num_params = sum(len(model.param_vals) for model in models.values())
+    kinds = list(_parameter_kinds(next(iter(models.values()))).values())
+    tests = [("configural", sum(semopy.stats.calc_chi2(model)[0] for model in models.values()),
+              num_moments - num_params)]
+    std_errors = None
+    for i in range(len(equal)):
+        with span("fit_groups_jointly", constraints=",".join(equal[:i + 1])):
+            std_errors = _fit_constrained(models, equal[:i + 1])
+        num_shared = sum(kind in equal[:i + 1] for kind in kinds)
+        tests.append(("+".join(equal[:i + 1]),
+                      sum(model.n_samples * model.last_result.fun for model in models.values()),
+                      num_moments - num_params + (len(models) - 1) * num_shared))
+        if verbose:
+            print(f"Fitted with equal {', '.join(equal[:i + 1])}: chi2={tests[-1][1]}")
+
+    inspections = {}
+    for borough, model in models.items():
+        if std_errors is None:
+            inspections[borough] = model.inspect()
+            continue
+        params = inspector.inspect_list(model, index_names=True)
+        model_std_errors = params.index.map(std_errors[borough]).astype(float)
+        params["Std. Err"] = model_std_errors
+        params["z-value"] = pd.to_numeric(params["Estimate"]) / model_std_errors
+        params["p-value"] = 2 * scipy.stats.norm.sf(np.abs(params["z-value"]))
+        inspections[borough] = params.reset_index(drop=True)
+
+    invariance = pd.DataFrame(tests, columns=["constraints", "chi2", "DoF"])
+    invariance["chi2 diff"] = invariance["chi2"].diff()
+    invariance["DoF diff"] = invariance["DoF"].diff()
+    invariance["p-value"] = scipy.stats.chi2.sf(invariance["chi2 diff"], invariance["DoF diff"])
+    return models, inspections, invariance
+
+
+@traced
+def cross_validate(desc: str, variables: Set[str], data: pd.DataFrame, folds=5,
+                   blocks="neighborhood", processes: int=None, seed=0, equationwise=True,
+                   verbose=False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Estimates how well an SEM predicts tracts it wasn't fitted to by K-fold cross-validation.
+
+    Tracts are assigned to folds in spatial blocks, by "borough" or by "neighborhood" (see
+    NEIGHBORHOOD_TRACT_RANGE), so neighboring tracts don't end up on both sides of a split.
+    The model is fitted to the whole sample once, then to every fold's training tracts in
+    parallel over processes, with semopy's optimizer starting from the full-sample estimates.
+    Each held-out tract's endogenous variables are predicted from its exogenous ones with the
+    reduced form of the model fitted without it (see reduced_form).
+
+    Returns the out-of-sample RMSE and R^2 of every endogenous variable, and the held-out
+    predictions of every tract.
+    """
+    model_data = transform_data(variables, data, verbose)
+    geoids = data.loc[model_data.index, "ITZ_GEOID"].astype(str)
+    if blocks == "borough":
+        block_ids = geoids.str[:2]
+    elif blocks == "neighborhood":
+        numbers = pd.to_numeric(geoids.str[2:], errors="coerce") // NEIGHBORHOOD_TRACT_RANGE
+        block_ids = geoids.str[:2] + numbers.astype(str)
+    else:
+        raise ValueError(f"Unknown blocks {blocks}.")
+    unique_blocks = block_ids.unique()
+    folds = min(folds, len(unique_blocks))
+    rng = np.random.default_rng(seed)
+    block_folds = dict(zip(unique_blocks, rng.permutation(len(unique_blocks)) % folds))
+    fold = block_ids.map(block_folds).to_numpy()
+
+    with span("fit_full_sample"):
+        start, _ = _fit_group((desc, model_data, equationwise, "MLW"))
+    jobs = [(desc, model_data[fold != i], model_data[fold == i], start, equationwise)
+            for i in range(folds)]
+    with span("fit_folds", folds=folds):
+        if processes != 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                predictions = list(executor.map(_fit_fold, jobs))
+        else:
+            predictions = [_fit_fold(job) for job in jobs]
+    predictions = pd.concat(predictions).reindex(model_data.index)
+
+    actual = model_data[predictions.columns]
+    errors = actual - predictions
+    scored = errors.notna()
+    total = ((actual - actual.where(scored).mean()) ** 2).where(scored).sum()
+    metrics = pd.DataFrame({"n": scored.sum(),
+                            "RMSE": np.sqrt((errors ** 2).mean()),
+                            "R2": 1 - (errors ** 2).sum() / total})
     if verbose:
-        print("Constructing SEM model... ", end="")
-        sys.stdout.flush()
+        print(metrics)
+    return metrics, predictions
+
+
+def _fit_fold(job: Tuple) -> pd.DataFrame:
+    """Fits a model to a fold's training tracts, starting semopy's optimizer from start, and
+    returns its predictions of the endogenous variables of the held-out tracts.
+    """
+    desc, train, test, start, equationwise = job
     model = semopy.Model(desc)
-    # model = semopy.ModelMeans(desc)
-    if verbose:
-        print("done!")
+    if not (equationwise and fit_recursive(model, train)):
+        model.load(train)
+        model.param_vals = start.copy()
+        model.fit(train)
+    exogenous, endogenous, coefs = reduced_form(model)
+    means = train.mean()
+    predictions = ((test[exogenous] - means[exogenous]).to_numpy() @ coefs.T
+                   + means[endogenous].to_numpy())
+    return pd.DataFrame(predictions, index=test.index, columns=endogenous)
 
+
+@traced
+def permutation_test(desc: str, variables: Set[str], data: pd.DataFrame,
+                     paths: List[str]=None, exposure=PERMUTATION_EXPOSURE,
+                     strata="borough", permutations=1000, processes: int=None, seed=0,
+                     equationwise=True, verbose=False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Tests paths of an SEM by randomization inference, which unlike the asymptotic p-values
+    doesn't assume tracts are independent.
+
+    The exposure variables (and their log_, square_ and sqrt_ transformations) are shuffled
+    together across tracts within strata: "borough", "density" (quantiles of the original
+    population density, see PERMUTATION_DENSITY_STRATA) or None for all tracts. The model is
+    refitted to every permutation from its covariance matrix, of which only the rows of the
+    exposure variables change, equation by equation where fit_recursive applies and with
+    semopy's optimizer starting from the observed estimates otherwise. Permutations are fitted
+    in parallel over processes, in chunks of PERMUTATION_CHUNK_SIZE with random streams spawned
+    from seed, so the results are the same for any number of processes.
+
+    paths are relations as in a description ("y ~ x") or as (lval, op, rval), every regression
+    on an exposure variable by default.
+    Returns, for each path, its estimate and asymptotic p-value, the mean and standard deviation
+    of its permutation distribution and the two-sided randomization p-value
+    (1 + #{|permuted| >= |observed|}) / (1 + permutations), along with the estimates of every
+    permutation.
+    """
+    if strata not in ("borough", "density", None):
+        raise ValueError(f"Unknown strata {strata}.")
+    model_data = transform_data(variables, data, verbose)
+    model = semopy.Model(desc)
+    observed = model.vars["observed"]
+    exposed = [i for i, var in enumerate(observed)
+               if var in exposure or any(var.startswith(prefix) and var[len(prefix):] in exposure
+                                         for prefix in PREFIX_TRANSFORMATIONS)]
+    if not exposed:
+        raise ValueError(f"The model has none of the exposure variables {', '.join(exposure)}.")
+    if strata == "borough":
+        groups = data.loc[model_data.index, "ITZ_GEOID"].astype(str).str[:2]
+    elif strata == "density":
+        groups = pd.qcut(data.loc[model_data.index, "orig_pop_density"],
+                         PERMUTATION_DENSITY_STRATA, labels=False, duplicates="drop")
+    else:
+        groups = pd.Series(0, index=model_data.index)
+    codes = pd.factorize(groups)[0]
+
+    # Covariances as semopy computes them: products of deviations from each column's mean over
+    # the tracts where both columns are present.
+    values = model_data[observed].to_numpy(dtype=float)
+    present = (~np.isnan(values)).astype(float)
+    centered = np.nan_to_num(values - np.nanmean(values, axis=0))
+    n_samples = len(values)
+    cov = pd.DataFrame((centered.T @ centered) / (present.T @ present), index=observed,
+                       columns=observed)
+    with span("fit_observed"):
+        if not (equationwise and fit_recursive(model, cov=cov, n_samples=n_samples)):
+            model.fit(cov=cov, n_samples=n_samples)
+    relations = _parameter_relations(model)
+    if paths is None:
+        paths = [relation for relation in relations.values()
+                 if relation[1] == "~" and observed.index(relation[2]) in exposed]
+    paths = [relation for path in paths
+             for relation in (sorted(_parse_description(path)) if isinstance(path, str)
+                              else [path])]
+    paths = [(min(lval, rval), op, max(lval, rval)) if op == "~~" else (lval, op, rval)
+             for lval, op, rval in paths]
+    names = {relation: name for name, relation in relations.items()}
+    unknown = [" ".join(path) for path in paths if path not in names]
+    if unknown:
+        raise ValueError(f"The model has no parameters {', '.join(unknown)}.")
+    active = [name for name, param in model.parameters.items() if param.active]
+    indices = [active.index(names[path]) for path in paths]
+    estimates = model.param_vals[indices]
+    inspection = model.inspect()
+    asymptotic = {(lval, op, rval) if op != "~~" else (min(lval, rval), op, max(lval, rval)):
+                  p_value for lval, op, rval, p_value
+                  in inspection[["lval", "op", "rval", "p-value"]].itertuples(index=False)}
+
+    counts = [min(PERMUTATION_CHUNK_SIZE, permutations - start)
+              for start in range(0, permutations, PERMUTATION_CHUNK_SIZE)]
+    streams = np.random.SeedSequence(seed).spawn(len(counts))
+    jobs = [(desc, centered, present, exposed, codes, indices, model.param_vals, equationwise,
+             stream, count) for stream, count in zip(streams, counts)]
+    with span("fit_permutations", permutations=permutations, jobs=len(jobs)):
+        if len(jobs) > 1 and processes != 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                null = list(executor.map(_fit_permutations, jobs))
+        else:
+            null = [_fit_permutations(job) for job in jobs]
+    null = np.vstack(null) if null else np.empty((0, len(paths)))
+
+    fitted = ~np.isnan(null)
+    extreme = (np.abs(null) >= np.abs(estimates)) & fitted
+    with np.errstate(invalid="ignore"):
+        results = pd.DataFrame({
+            "lval": [path[0] for path in paths],
+            "op": [path[1] for path in paths],
+            "rval": [path[2] for path in paths],
+            "Estimate": estimates,
+            "p-value": [asymptotic.get(path, np.nan) for path in paths],
+            "permutations": fitted.sum(axis=0),
+            "null mean": np.nanmean(null, axis=0),
+            "null std": np.nanstd(null, axis=0),
+            "permutation p-value": (1 + extreme.sum(axis=0)) / (1 + fitted.sum(axis=0)),
+        })
     if verbose:
-        print("Fitting SEM to data... ", end="")
-        sys.stdout.flush()
-    start_time = time.time()
-    model.fit(model_data)
-    # model.fit(model_data, obj='FIML')
-    duration = time.time() - start_time
-    if verbose:
-        print(f"done! Model fitted in {duration // 60}m {round(duration, 1) % 60}s")
-    return model
+        print(results)
+    return results, pd.DataFrame(null, columns=[" ".join(path) for path in paths])
+
+
+def _fit_permutations(job: Tuple) -> np.ndarray:
+    """Refits a model to count permutations of its exposure variables within strata, drawn
+    from a random stream, and returns the estimates of the parameters at indices (NaN where a
+    fit fails).
+    """
+    (desc, centered, present, exposed, codes, indices, start, equationwise, stream,
+     count) = job
+    rng = np.random.default_rng(stream)
+    model = semopy.Model(desc)
+    observed = model.vars["observed"]
+    n_samples = len(centered)
+    products, overlaps = centered.T @ centered, present.T @ present
+    block = np.ix_(exposed, exposed)
+    by_stratum = np.argsort(codes, kind="stable")
+    permutation = np.empty(n_samples, dtype=int)
+    estimates = np.full((count, len(indices)), np.nan)
+    # semopy warns about every permuted covariance matrix that isn't positive definite, as
+    # pairwise covariances of data with missing values often aren't, like the observed one.
+    disabled = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    try:
+        for i in range(count):
+            # Tracts sorted by stratum and then at random take the places of the tracts sorted
+            # by stratum alone, so every tract gets the exposure of a tract in its own stratum.
+            permutation[by_stratum] = np.lexsort((rng.random(n_samples), codes))
+            sums, counts = products.copy(), overlaps.copy()
+            for matrix, original, columns in ((sums, products, centered),
+                                              (counts, overlaps, present)):
+                matrix[exposed] = columns[permutation][:, exposed].T @ columns
+                matrix[:, exposed] = matrix[exposed].T
+                matrix[block] = original[block]
+            cov = pd.DataFrame(sums / counts, index=observed, columns=observed)
+            try:
+                if not (equationwise and fit_recursive(model, cov=cov, n_samples=n_samples)):
+                    model.load(cov=cov, n_samples=n_samples)
+                    model.param_vals = start.copy()
+                    model.fit(cov=cov, n_samples=n_samples)
+            except np.linalg.LinAlgError:
+                continue
+            estimates[i] = model.param_vals[indices]
+    finally:
+        logging.disable(disabled)
+    return estimates
+
+
+def reduced_form(model: semopy.Model, interventions: List[str]=None
+                 ) -> Tuple[List[str], List[str], np.ndarray]:
+    """Returns the causes of a fitted model's observed outcomes, the outcomes, and the
+    coefficients of the outcomes on the causes, so that the expected deviations of the outcomes
+    from their means are coefs @ (x - mean(x)).
+
+    The causes are the observed exogenous variables, or the interventions (structural variables)
+    if given, and the outcomes are the other observed endogenous variables. The coefficients are
+    the total effects through the model's structural paths, Lambda (I - B)^-1, with the rows of
+    B of the causes zeroed: interventions are made jointly, cutting their own regressions.
+    """
+    inner = model.vars["inner"]
+    observed = list(model.vars["observed"])
+    if interventions is None:
+        causes = [var for var in observed if var in model.vars["exogenous"]]
+    else:
+        causes = list(interventions)
+    unknown = [var for var in causes if var not in inner]
+    if unknown:
+        raise ValueError(f"Can't intervene on {unknown}, which aren't structural variables.")
+    columns = [inner.index(var) for var in causes]
+    beta = model.mx_beta.copy()
+    beta[columns] = 0
+    effects = model.mx_lambda @ np.linalg.solve(np.identity(len(inner)) - beta,
+                                                np.identity(len(inner))[:, columns])
+    outcomes = [var for var in observed
+                if var not in model.vars["exogenous"] and var not in causes]
+    return causes, outcomes, effects[[observed.index(var) for var in outcomes]]
+
+
+def counterfactual_effects(model: semopy.Model, interventions: List[str]) -> pd.DataFrame:
+    """Returns the effects of setting each of the interventions (observed variables of a fitted
+    model) on every other observed endogenous variable, as a DataFrame with a row per outcome
+    and a column per intervention (see reduced_form).
+    """
+    causes, outcomes, coefs = reduced_form(model, interventions)
+    return pd.DataFrame(coefs, index=outcomes, columns=causes)
+
+
+@traced
+def predict_counterfactuals(effects: pd.DataFrame, scenarios: pd.DataFrame,
+                            data: pd.DataFrame=None) -> np.ndarray:
+    """Predicts how every outcome of counterfactual_effects changes under a batch of scenarios,
+    each a row of scenarios with a column per intervention.
+
+    With data, the scenarios' values are what the interventions are set to in every tract, and
+    the result has shape (scenarios, tracts, outcomes), the changes from the tracts' observed
+    values. Without it, the scenarios' values are changes to the interventions, and the result
+    has shape (scenarios, outcomes).
+    """
+    coefs = effects[scenarios.columns].to_numpy().T
+    deltas = scenarios.to_numpy(dtype=float) @ coefs
+    if data is None:
+        return deltas
+    return deltas[:, np.newaxis, :] - (data[scenarios.columns].to_numpy(dtype=float) @ coefs)
+
+
+def _fit_group(job: Tuple) -> Tuple[np.ndarray, semopy.solver.SolverResult]:
+    """Fits a model to one group's transformed data and returns its estimates, which (unlike
+    semopy models) can be sent back from a worker process.
+    """
+    desc, group_data, equationwise, obj = job
+    model = semopy.Model(desc)
+    if obj == "FIML":
+        fit_fiml(model, group_data, equationwise)
+    elif not (equationwise and fit_recursive(model, group_data)):
+        model.fit(group_data, obj=obj)
+    return model.param_vals, model.last_result
+
+
+def _parameter_kinds(model: semopy.Model) -> Dict[str, str]:
+    """Returns which of EQUALITY_CONSTRAINTS each active parameter of a model is.
+    """
+    kinds = {}
+    for name, (lval, op, rval) in _parameter_relations(model).items():
+        if op == "=~":
+            kinds[name] = "loadings"
+        elif op == "~":
+            kinds[name] = "regressions"
+        else:
+            kinds[name] = "variances" if lval == rval else "covariances"
+    return kinds
+
+
+def _parameter_relations(model: semopy.Model) -> Dict[str, Tuple[str, str, str]]:
+    """Returns the relation (lval, op, rval) each active parameter of a model estimates, with
+    the variables of covariances in sorted order.
+    """
+    relations = {}
+    latent = set(model.vars["latent"])
+    for name, param in model.parameters.items():
+        if not param.active:
+            continue
+        loc = param.locations[0]
+        if loc.matrix is model.mx_beta:
+            names = model.names_beta
+        elif loc.matrix is model.mx_lambda:
+            names = model.names_lambda
+        else:
+            names = model.names_psi if loc.matrix is model.mx_psi else model.names_theta
+        lval, rval = names[0][loc.indices[0]], names[1][loc.indices[1]]
+        if loc.matrix is model.mx_beta or loc.matrix is model.mx_lambda:
+            relations[name] = (rval, "=~", lval) if rval in latent else (lval, "~", rval)
+        else:
+            relations[name] = (min(lval, rval), "~~", max(lval, rval))
+    return relations
+
+
+def _fit_constrained(models: Dict[str, semopy.Model], equal: Tuple[str, ...]
+                     ) -> Dict[str, Dict[str, float]]:
+    """Fits the models of several groups jointly by maximum likelihood, with the parameters of
+    the kinds in equal shared between them, starting from their current estimates.
+
+    The models are left with their share of the joint estimates. Returns the standard errors of
+    each group's parameters, from the joint Fisher information.
+    """
+    first = next(iter(models.values()))
+    names = [name for name, param in first.parameters.items() if param.active]
+    kinds = _parameter_kinds(first)
+    shared = [name for name in names if kinds[name] in equal]
+    # Where each group's parameters are in the joint parameter vector: the shared ones first,
+    # then every group's own.
+    indices = {}
+    size = len(shared)
+    for group in models:
+        index = []
+        for name in names:
+            if name in shared:
+                index.append(shared.index(name))
+            else:
+                index.append(size)
+                size += 1
+        indices[group] = np.array(index)
+
+    weights = np.zeros(size)
+    start = np.zeros(size)
+    bounds = [None] * size
+    for group, model in models.items():
+        np.add.at(weights, indices[group], model.n_samples)
+        np.add.at(start, indices[group], model.n_samples * model.param_vals)
+        for i, bound in zip(indices[group], model.get_bounds()):
+            bounds[i] = bound
+    start /= weights
+
+    def _information(x):
+        information = np.zeros((size, size))
+        for group, model in models.items():
+            model.update_matrices(x[indices[group]])
+            sigma, (m, c) = model.calc_sigma()
+            weighted_grads = np.linalg.inv(sigma) @ np.array(model.calc_sigma_grad(m, c))
+            information[np.ix_(indices[group], indices[group])] += _expected_information(
+                weighted_grads, model.n_samples)
+        return information
+
+    # The parameters range from shares to squared dollars, so the optimizer works on them
+    # divided by their standard errors at the start.
+    scale = np.sqrt(_information(start).diagonal())
+    scale[~(scale > 0)] = 1
+
+    def _objective(z):
+        # Sum of the groups' chi-square statistics and its gradient.
+        x = z / scale
+        loss = 0.0
+        grad = np.zeros(size)
+        for group, model in models.items():
+            group_x = x[indices[group]]
+            group_loss = model.obj_mlw(group_x)
+            if not np.isfinite(group_loss):
+                return np.inf, grad
+            loss += model.n_samples * group_loss
+            np.add.at(grad, indices[group], model.n_samples * model.grad_mlw(group_x))
+        return loss, grad / scale
+
+    bounds = [tuple(None if bound is None else bound * s for bound in pair)
+              for pair, s in zip(bounds, scale)]
+    result = scipy.optimize.minimize(_objective, start * scale, jac=True, method="L-BFGS-B",
+                                     bounds=bounds)
+    estimates = result.x / scale
+    for group, model in models.items():
+        x = estimates[indices[group]]
+        model.param_vals = x
+        model.last_result = semopy.solver.SolverResult(
+            fun=model.obj_mlw(x), success=result.success, n_it=result.nit, x=x,
+            message=result.message, name_method="L-BFGS-B", name_obj="MLW")
+    information = _information(estimates)
+    try:
+        variances = np.linalg.inv(information).diagonal().copy()
+    except np.linalg.LinAlgError:
+        variances = np.linalg.pinv(information).diagonal().copy()
+    variances[variances < 0] = np.nan
+    std_errors = np.sqrt(variances)
+    return {group: dict(zip(names, std_errors[indices[group]])) for group in models}
+
+
+def _expected_information(weighted_grads: np.ndarray, n: int) -> np.ndarray:
+    """Returns the expected Fisher information of n samples about a model's parameters, given
+    inv(sigma) @ d(sigma)/d(param) for each of them.
+    """
+    flat = weighted_grads.reshape(len(weighted_grads), -1)
+    return n / 2 * flat @ weighted_grads.transpose(0, 2, 1).reshape(len(weighted_grads), -1).T
+
+
+def _recursive_structure(model: semopy.Model):
+    """Reads the equations of a loaded semopy model with no latent variables.
+
+    Returns a dict from each endogenous variable to its (predictor, parameter name) pairs and
+    residual variance parameter name, the groups of endogenous variables whose residuals are
+    connected by covariances, a dict from each covarying pair to its parameter name, and a dict
+    from each free exogenous covariance parameter to its pair of variables. Returns None if the
+    model has constraints, fixed or shared parameters, or feedback loops.
+    """
+    if model.constraints:
+        return None
+    beta, lamb, psi, theta = model.matrices[:4]
+    endogenous = model.vars["endogenous"]
+    regressions, variances, covariances, exogenous = [], {}, {}, {}
+    for name, param in model.parameters.items():
+        if len(param.locations) != 1:
+            return None
+        loc = param.locations[0]
+        i, j = loc.indices
+        if loc.matrix is beta or loc.matrix is lamb:
+            rows, cols = model.names[0 if loc.matrix is beta else 1]
+            if not param.active:
+                return None
+            regressions.append((rows[i], cols[j], name))
+        elif loc.matrix is psi or loc.matrix is theta:
+            rows, cols = model.names[2 if loc.matrix is psi else 3]
+            lval, rval = rows[i], cols[j]
+            num_endogenous = (lval in endogenous) + (rval in endogenous)
+            if num_endogenous == 0:
+                # semopy fixes the rest of these to their sample values.
+                if param.active:
+                    exogenous[name] = (lval, rval)
+            elif not param.active or num_endogenous == 1:
+                return None
+            elif lval == rval:
+                variances[lval] = name
+            elif loc.matrix is theta and (
+                    lval in model.vars["inner"] or rval in model.vars["inner"]):
+                # semopy adds these to the implied covariance of the observed variables rather
+                # than of the residuals, so they are not residual covariances.
+                return None
+            else:
+                covariances[frozenset((lval, rval))] = name
+        else:
+            return None
+
+    equations = {var: ([], variances.get(var)) for var in endogenous}
+    for lval, rval, name in regressions:
+        equations[lval][0].append((rval, name))
+    if any(variance is None for _, variance in equations.values()):
+        return None
+
+    # Feedback loops: repeatedly remove endogenous variables none of whose predictors remain.
+    remaining = set(endogenous)
+    while remaining:
+        roots = {var for var in remaining
+                 if not any(pred in remaining for pred, _ in equations[var][0])}
+        if not roots:
+            return None
+        remaining -= roots
+
+    # Group the equations whose residuals are connected by covariances.
+    group = {var: {var} for var in endogenous}
+    for pair in covariances:
+        lval, rval = pair
+        if group[lval] is not group[rval]:
+            merged = group[lval] | group[rval]
+            for var in merged:
+                group[var] = merged
+    blocks = list({id(members): sorted(members) for members in group.values()}.values())
+    return equations, blocks, covariances, exogenous
+
+
+def _fit_sur(block: List[str], equations: Dict, covariances: Dict, position: Dict[str, int],
+        cov: np.ndarray) -> Tuple[Dict[str, float], int]:
+    """Solves a group of equations with covarying residuals by iterated SUR, using only the
+    sample covariance matrix.
+
+    Each iteration solves for the coefficients by GLS given the residual covariance, then for
+    the residual covariance given the coefficients. Returns the parameter estimates and the
+    number of iterations.
+    """
+    k = len(block)
+    preds = [[position[pred] for pred, _ in equations[var][0]] for var in block]
+    outcomes = np.array([position[var] for var in block])
+    stacked_preds = np.array([pred for p in preds for pred in p], dtype=int)
+    # Equation of each stacked coefficient.
+    equation = np.repeat(np.arange(k), [len(p) for p in preds])
+    s_xx = cov[np.ix_(stacked_preds, stacked_preds)]
+    s_xy = cov[np.ix_(stacked_preds, outcomes)]
+    free = np.identity(k, dtype=bool)
+    for (g, var_g), (h, var_h) in itertools.combinations(enumerate(block), 2):
+        free[g, h] = free[h, g] = frozenset((var_g, var_h)) in covariances
+
+    def _residual_cov(coefs):
+        # The residuals are A z for the observed variables z, so their covariance is A S A'.
+        weights = np.zeros((k, len(cov)))
+        weights[np.arange(k), outcomes] = 1
+        np.subtract.at(weights, (equation, stacked_preds), coefs)
+        return weights @ cov @ weights.T
+
+    coefs = np.concatenate([np.linalg.solve(cov[np.ix_(p, p)], cov[p, y]) if p else np.zeros(0)
+                            for p, y in zip(preds, outcomes)])
+    omega = _fit_residual_cov(_residual_cov(coefs), free, None)
+    for iteration in range(1, SUR_MAX_ITERATIONS + 1):
+        weights = np.linalg.inv(omega)
+        lhs = weights[np.ix_(equation, equation)] * s_xx
+        rhs = (weights[equation] * s_xy).sum(axis=1)
+        coefs = np.linalg.solve(lhs, rhs)
+        new_omega = _fit_residual_cov(_residual_cov(coefs), free, omega)
+        converged = np.max(np.abs(new_omega - omega)) <= SUR_TOLERANCE * np.max(np.abs(omega))
+        omega = new_omega
+        if converged:
+            break
+
+    estimates = {}
+    for g, var in enumerate(block):
+        for (_, name), val in zip(equations[var][0], coefs[equation == g]):
+            estimates[name] = val
+        estimates[equations[var][1]] = omega[g, g]
+    for (g, var_g), (h, var_h) in itertools.combinations(enumerate(block), 2):
+        if free[g, h]:
+            estimates[covariances[frozenset((var_g, var_h))]] = omega[g, h]
+    return estimates, iteration
+
+
+def _fit_residual_cov(resid: np.ndarray, free: np.ndarray, start: np.ndarray) -> np.ndarray:
+    """Returns the ML residual covariance matrix given the residuals' sample covariance, with
+    the entries that are not free fixed at zero.
+
+    Uses Newton's method with a backtracking line search, starting from start (or the diagonal
+    of resid), and takes Anderson's scoring step instead where the Hessian is not positive
+    definite.
+    """
+    if free.all():
+        return resid
+    # Omega is the sum of theta_i (E_ab + E_ba) * scale_i over the free entries (a_i, b_i).
+    a, b = np.nonzero(np.triu(free))
+    scale = np.where(a == b, 0.5, 1.0)
+
+    def _traces(x, y):
+        # tr(X E_j Y E_i) for every pair of free entries i, j.
+        return (x[np.ix_(b, a)] * y[np.ix_(b, a)].T + x[np.ix_(b, b)] * y[np.ix_(a, a)].T
+                + x[np.ix_(a, a)] * y[np.ix_(b, b)].T + x[np.ix_(a, b)] * y[np.ix_(a, b)].T)
+
+    def _objective(omega):
+        sign, logdet = np.linalg.slogdet(omega)
+        return logdet + np.trace(np.linalg.solve(omega, resid)) if sign > 0 else np.inf
+
+    omega = np.diag(np.diag(resid)) if start is None else start
+    loss = _objective(omega)
+    for _ in range(SUR_MAX_ITERATIONS):
+        weights = np.linalg.inv(omega)
+        weighted_resid = weights @ resid @ weights
+        grad = 2 * scale * (weights - weighted_resid)[a, b]
+        info = np.outer(scale, scale) * _traces(weights, weights)
+        hessian = np.outer(scale, scale) * (_traces(weights, weighted_resid)
+                                            + _traces(weighted_resid, weights)) - info
+        try:
+            np.linalg.cholesky(hessian)
+            direction = -np.linalg.solve(hessian, grad)
+        except np.linalg.LinAlgError:
+            direction = -np.linalg.solve(info, grad)
+        change = np.zeros_like(omega)
+        change[a, b] = change[b, a] = direction
+        # Step back while the update does not decrease the objective enough.
+        step = 1.0
+        while True:
+            new_loss = _objective(omega + step * change)
+            if new_loss <= loss + 1e-4 * step * (grad @ direction) or step <= SUR_TOLERANCE:
+                break
+            step /= 2
+        converged = (np.max(np.abs(step * change)) <= SUR_TOLERANCE * np.max(np.abs(omega))
+                     or not new_loss < loss)
+        if new_loss < loss:
+            omega, loss = omega + step * change, new_loss
+        if converged:
+            break
+    return omega
 
 
 # def get_description(model_name: ModelName, covariances: List[Tuple[str, str]]=[],
@@ -206,6 +1294,7 @@ def fit(desc: str, variables: Set[str], data: pd.DataFrame, verbose=False) -> se
 #     return model_description, variables
 
 
+@traced
 def get_description(model_name: ModelName, model_type: str, data: pd.DataFrame, covariances: List[Tuple[str, str]]=[],
                     control_regressions: Dict[str, List[str]]={}, verbose=False
                         ) -> Tuple[str, Set[str]]:
@@ -384,8 +1473,367 @@ def get_description(model_name: ModelName, model_type: str, data: pd.DataFrame,
     return model_description, variables
 
 
-def evaluate(model: semopy.Model) -> Tuple[Dict[str, float], pd.DataFrame]:
+@traced
+def robust_statistics(model: semopy.Model) -> Tuple[np.ndarray, float]:
+    """Returns Huber-White sandwich standard errors of a fitted model's active parameters and the
+    Satorra-Bentler scaling factor for its chi-square statistic.
+
+    Both come from the model's centered data (tracts missing values are left out): the scores of
+    every tract and the fourth moments of the data are computed for ROBUST_CHUNK_ROWS tracts at a
+    time with batched matrix products, so the cost is a few passes over the data. Models fitted
+    by fit_fiml are rejected, as these moments of the complete tracts don't describe them.
+    """
+    if getattr(model, "last_result", None) is not None and model.last_result.name_obj == "FIML":
+        raise ValueError("robust statistics can't be computed for FIML fits")
+    if model.mx_data is None:
+        raise ValueError("robust statistics need the data the model was fitted to")
+    values = model.mx_data[np.isfinite(model.mx_data).all(axis=1)]
+    values = values - values.mean(axis=0)
+    n, num_vars = values.shape
+    sigma, (m, c) = model.calc_sigma()
+    # d(sigma)/d(param) for every active parameter. Both statistics are unchanged by rescaling
+    # the variables, so they are standardized to keep the matrices below well conditioned (the
+    # variables range from shares to dollars).
+    sigma_grads = np.array(model.calc_sigma_grad(m, c))
+    scale = np.sqrt(sigma.diagonal())
+    values = values / scale
+    sigma = sigma / np.outer(scale, scale)
+    sigma_grads = sigma_grads / np.outer(scale, scale)
+    inv_sigma = np.linalg.inv(sigma)
+    weighted_grads = inv_sigma @ sigma_grads
+    traces = np.einsum("kii->k", weighted_grads)
+    information = _expected_information(weighted_grads, n)
+    try:
+        inv_information = np.linalg.inv(information)
+    except np.linalg.LinAlgError:
+        inv_information = np.linalg.pinv(information)
+
+    # Normal-theory weight matrix and Jacobian of the non-duplicated covariances (vech(sigma)),
+    # and the residual weight matrix U whose product with the fourth moments gives the scaling.
+    rows, cols = np.triu_indices(num_vars)
+    multiplicity = np.where(rows == cols, 1.0, 2.0)
+    weight = (np.outer(multiplicity, multiplicity) / 4
+              * (inv_sigma[np.ix_(rows, rows)] * inv_sigma[np.ix_(cols, cols)]
+                 + inv_sigma[np.ix_(rows, cols)] * inv_sigma[np.ix_(cols, rows)]))
+    jacobian = sigma_grads[:, rows, cols].T
+    column_norms = np.sqrt(np.einsum("ik,ij,jk->k", jacobian, weight, jacobian))
+    jacobian = jacobian / np.where(column_norms > 0, column_norms, 1)
+    weighted_jacobian = weight @ jacobian
+    residual_weight = weight - weighted_jacobian @ np.linalg.pinv(
+        jacobian.T @ weighted_jacobian) @ weighted_jacobian.T
+
+    # A tract's score is (x' inv(sigma) dsigma inv(sigma) x - trace(inv(sigma) dsigma)) / 2, and
+    # as the matrices are symmetric the quadratic forms are products with vech(x x').
+    quadratic_forms = (weighted_grads @ inv_sigma)[:, rows, cols] * multiplicity
+    sample_moments = (values.T @ values / n)[rows, cols]
+    score_products = np.zeros_like(information)
+    fourth_moments = 0.0
+    for start in range(0, n, ROBUST_CHUNK_ROWS):
+        chunk = values[start:start + ROBUST_CHUNK_ROWS]
+        products = chunk[:, rows] * chunk[:, cols]
+        scores = (products @ quadratic_forms.T - traces) / 2
+        score_products += scores.T @ scores
+        deviations = products - sample_moments
+        fourth_moments += ((deviations @ residual_weight) * deviations).sum()
+
+    sandwich = inv_information @ score_products @ inv_information
+    variances = sandwich.diagonal().copy()
+    variances[variances < 0] = np.nan
+    dof = semopy.stats.calc_dof(model)
+    scaling = fourth_moments / n / dof if dof > 0 else np.nan
+    return np.sqrt(variances), scaling
+
+
+@traced
+def evaluate(model: semopy.Model, robust=False) -> Tuple[Dict[str, float], pd.DataFrame]:
     """Returns evaluations of how well an SEM fits a dataset.
+
+    Models fitted by fit_fiml are measured against FIML saturated and baseline models (see
+    fiml_statistics), and their parameter table gets standard errors, z-values and p-values
+    that account for the missing values (see fiml_std_errors).
+
+    With robust, the Satorra-Bentler scaled chi-square and its p-value are added to the
+    statistics, and the parameter table gets sandwich standard errors, z-values and p-values
+    (see robust_statistics).
+    """
+    if model.last_result.name_obj == "FIML":
+        stats = fiml_statistics(model)
+    else:
+        stats = semopy.calc_stats(model)
+        stats = {col: stats[col].iloc[0] for col in stats.columns}
+    if not robust and model.last_result.name_obj == "FIML":
+        params = inspector.inspect_list(model, index_names=True)
+        names = [name for name, param in model.parameters.items() if param.active]
+        std_errors = params.index.map(dict(zip(names, fiml_std_errors(model)))).astype(float)
+        params["Std. Err"] = std_errors
+        params["z-value"] = pd.to_numeric(params["Estimate"]) / std_errors
+        params["p-value"] = 2 * scipy.stats.norm.sf(np.abs(params["z-value"]))
+        return stats, params.reset_index(drop=True)
+    if not robust:
+        return stats, model.inspect()
+
+    std_errors, scaling = robust_statistics(model)
+    stats["SB scaling"] = scaling
+    stats["SB chi2"] = stats["chi2"] / scaling
+    stats["SB chi2 p-value"] = scipy.stats.chi2.sf(stats["SB chi2"], stats["DoF"])
+    params = inspector.inspect_list(model, index_names=True)
+    names = [name for name, param in model.parameters.items() if param.active]
+    robust_std_errors = dict(zip(names, std_errors))
+    estimates = pd.to_numeric(params["Estimate"])
+    robust_std_errors = params.index.map(robust_std_errors).astype(float)
+    params["Robust Std. Err"] = robust_std_errors
+    params["Robust z-value"] = estimates / robust_std_errors
+    params["Robust p-value"] = 2 * scipy.stats.norm.sf(np.abs(params["Robust z-value"]))
+    return stats, params.reset_index(drop=True)
+
+
+def set_estimates(model: semopy.Model, inspection: pd.DataFrame):
+    """Sets the parameters of a model, loaded with data, to the estimates of an inspection
+    written by the fit command (model_inspection.csv), restoring a fitted model without
+    refitting it.
+    """
+    latent = set(model.vars["latent"])
+    estimates = {}
+    for lval, op, rval, estimate in inspection[["lval", "op", "rval", "Estimate"]].itertuples(
+            index=False):
+        if op == "~" and rval in latent:
+            estimates[(rval, "=~", lval)] = estimate
+        elif op == "~~":
+            estimates[(min(lval, rval), "~~", max(lval, rval))] = estimate
+        else:
+            estimates[(lval, op, rval)] = estimate
+    relations = _parameter_relations(model)
+    names = [name for name, param in model.parameters.items() if param.active]
+    missing = [relations[name] for name in names if relations[name] not in estimates]
+    if missing:
+        raise ValueError(f"The inspection has no estimates of {missing}.")
+    model.param_vals = np.array([estimates[relations[name]] for name in names], dtype=float)
+    model.update_matrices(model.param_vals)
+
+
+@traced
+def search_specification(desc: str, data: pd.DataFrame, criterion="BIC", threshold=0.05,
+                         max_additions=10, max_steps=100, equationwise=True,
+                         processes: int=None, output_path: str=None, verbose=False
+                         ) -> Tuple[pd.DataFrame, str]:
+    """Searches for a better model specification by adding and removing paths one at a time.
+
+    Each step considers removing every regression or covariance whose p-value is above
+    threshold and adding the max_additions regressions or covariances (among the model's
+    endogenous variables, and without feedback loops) with the largest modification indices
+    significant at threshold.
+    The candidates are fitted from the dataset's cached covariance matrix, in parallel over
+    processes, and the one with the lowest criterion ("AIC" or "BIC", from the chi-square) is
+    taken if it improves on the current model. Moves never change the set of variables, so the
+    criteria stay comparable. With equationwise, only candidates fit_recursive can solve are
+    considered, as semopy's optimizer can take minutes for each of the others.
+
+    Fits are memoized by the hash of the canonical description, so no specification is fitted
+    twice, within or across searches on the same data. Returns the trajectory of the search and
+    the final description, which is also written to output_path if given.
     """
-    stats = semopy.calc_stats(model)
-    return {col: stats[col][0] for col in stats.columns}, model.inspect()
\ No newline at end of file
+    if criterion not in ("AIC", "BIC"):
+        raise ValueError(f"Unknown criterion {criterion}.")
+    observed = semopy.Model(desc).vars["observed"]
+    cov, n_samples = get_sufficient_statistics(data)
+    cov = cov.loc[observed, observed]
+    data_key = hashlib.sha256(cov.to_numpy().tobytes() + str(n_samples).encode()).hexdigest()
+    relations = _parse_description(desc)
+    current = _write_description(relations)
+    current_fit = _fit_specifications([current], cov, n_samples, data_key, False, None)[0]
+    trajectory = [{"step": 0, "move": "start", "relation": "", criterion: current_fit[criterion],
+                   "chi2": current_fit["chi2"], "parameters": current_fit["parameters"],
+                   "hash": description_hash(current)}]
+    if verbose:
+        print(f"Start: {criterion}={current_fit[criterion]}")
+
+    executor = ProcessPoolExecutor(max_workers=processes) if processes != 1 else None
+    try:
+        for step in range(1, max_steps + 1):
+            moves = [("remove", relation) for relation, p_value
+                     in current_fit["p-values"].items()
+                     if p_value > threshold and _removable(relation, relations)]
+            indices = _modification_indices(relations, current_fit["estimates"], cov,
+                                            n_samples)
+            significant = scipy.stats.chi2.isf(threshold, 1)
+            moves += [("add", relation) for relation, index
+                      in sorted(indices.items(), key=lambda item: -item[1])[:max_additions]
+                      if index > significant]
+            candidates = [_write_description(relations - {relation} if move == "remove"
+                                             else relations | {relation})
+                          for move, relation in moves]
+            with span("search_step", step=step, candidates=len(candidates)):
+                fits = _fit_specifications(candidates, cov, n_samples, data_key, equationwise,
+                                           executor)
+            if not fits:
+                break
+            best = min(range(len(fits)), key=lambda i: fits[i][criterion])
+            if not fits[best][criterion] < current_fit[criterion]:
+                break
+            move, relation = moves[best]
+            relations = (relations - {relation} if move == "remove"
+                         else relations | {relation})
+            current, current_fit = candidates[best], fits[best]
+            trajectory.append({"step": step, "move": move, "relation": " ".join(relation),
+                               criterion: current_fit[criterion], "chi2": current_fit["chi2"],
+                               "parameters": current_fit["parameters"],
+                               "hash": description_hash(current)})
+            if verbose:
+                print(f"Step {step}: {move} {' '.join(relation)}, "
+                      f"{criterion}={current_fit[criterion]}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            f.write(current)
+    return pd.DataFrame(trajectory), current
+
+
+def _parse_description(desc: str) -> Set[Tuple[str, str, str]]:
+    """Returns the relations (lval, op, rval) of a model description, one per pair of variables
+    and with the variables of covariances in sorted order.
+    """
+    relations = set()
+    for line in desc.splitlines():
+        for op in ("=~", "~~", "~"):
+            if op in line:
+                lvals, rvals = line.split(op, 1)
+                for lval, rval in itertools.product(lvals.split("+"), rvals.split("+")):
+                    lval, rval = lval.strip(), rval.strip()
+                    if op == "~~":
+                        lval, rval = min(lval, rval), max(lval, rval)
+                    relations.add((lval, op, rval))
+                break
+    return relations
+
+
+def _write_description(relations: Set[Tuple[str, str, str]]) -> str:
+    """Returns the canonical description of a set of relations: one per line, in sorted order.
+    """
+    return "".join(" ".join(relation) + "\n" for relation in sorted(relations))
+
+
+def description_hash(desc: str) -> str:
+    """Returns the hash of a model description's canonical form, the same for descriptions
+    differing only in the order or grouping of their relations.
+    """
+    return hashlib.sha256(_write_description(_parse_description(desc)).encode()).hexdigest()[:16]
+
+
+def _removable(relation: Tuple[str, str, str], relations: Set[Tuple[str, str, str]]) -> bool:
+    """Returns whether a regression or covariance can be removed without dropping a variable
+    from the model.
+    """
+    lval, op, rval = relation
+    if op == "=~" or relation not in relations:
+        return False
+    others = relations - {relation}
+    return all(any(var in (other[0], other[2]) for other in others) for var in (lval, rval))
+
+
+def _fit_specifications(descs: List[str], cov: pd.DataFrame, n_samples: int, data_key: str,
+                        equationwise: bool, executor: ProcessPoolExecutor) -> List[Dict]:
+    """Returns the fit of each description (see _fit_specification), fitting those that aren't
+    memoized yet in the executor's processes.
+    """
+    keys = [(data_key, description_hash(desc), equationwise) for desc in descs]
+    pending = list({key: desc for key, desc in zip(keys, descs)
+                    if key not in _specification_fits}.items())
+    jobs = [(desc, cov, n_samples, equationwise) for _, desc in pending]
+    if executor is not None and len(jobs) > 1:
+        results = executor.map(_fit_specification, jobs)
+    else:
+        results = map(_fit_specification, jobs)
+    for (key, _), result in zip(pending, results):
+        _specification_fits[key] = result
+    return [_specification_fits[key] for key in keys]
+
+
+def _fit_specification(job: Tuple) -> Dict:
+    """Fits a description to a covariance matrix, returning its estimates and p-values by
+    relation, its chi-square, number of parameters, AIC and BIC. With equationwise, models
+    fit_recursive can't solve are not fitted and get infinite criteria.
+    """
+    desc, cov, n_samples, equationwise = job
+    model = semopy.Model(desc)
+    observed = model.vars["observed"]
+    unfitted = {"estimates": {}, "p-values": {}, "chi2": np.inf, "parameters": np.nan,
+                "AIC": np.inf, "BIC": np.inf}
+    try:
+        if not fit_recursive(model, cov=cov.loc[observed, observed], n_samples=n_samples):
+            if equationwise:
+                return unfitted
+            model.fit(cov=cov.loc[observed, observed], n_samples=n_samples)
+        sigma, (m, c) = model.calc_sigma()
+        weighted_grads = np.linalg.inv(sigma) @ np.array(model.calc_sigma_grad(m, c))
+        variances = np.linalg.pinv(_expected_information(weighted_grads, n_samples)).diagonal()
+    except np.linalg.LinAlgError:
+        return unfitted
+    relations = list(_parameter_relations(model).values())
+    std_errors = np.sqrt(np.where(variances > 0, variances, np.nan))
+    p_values = 2 * scipy.stats.norm.sf(np.abs(model.param_vals / std_errors))
+    chi2 = n_samples * model.last_result.fun
+    num_params = len(model.param_vals)
+    return {"estimates": dict(zip(relations, model.param_vals)),
+            "p-values": dict(zip(relations, np.nan_to_num(p_values, nan=1.0))),
+            "chi2": chi2, "parameters": num_params, "AIC": chi2 + 2 * num_params,
+            "BIC": chi2 + np.log(n_samples) * num_params}
+
+
+def _modification_indices(relations: Set[Tuple[str, str, str]],
+                          estimates: Dict[Tuple[str, str, str], float], cov: pd.DataFrame,
+                          n_samples: int) -> Dict[Tuple[str, str, str], float]:
+    """Returns the modification index (the score test statistic) of every regression of an
+    endogenous variable on another variable that it doesn't affect, and every covariance
+    between endogenous variables, that a fitted model doesn't have.
+
+    All the indices come from one model with every candidate added and set to zero.
+    """
+    observed = cov.columns
+    endogenous = sorted({lval for lval, op, _ in relations if op == "~"})
+    # Variables each variable affects, directly or not; regressions on them would add feedback
+    # loops, which make fitting far slower.
+    effects = {}
+    for lval, op, rval in relations:
+        if op != "~~":
+            cause, effect = (lval, rval) if op == "=~" else (rval, lval)
+            effects.setdefault(cause, set()).add(effect)
+    downstream = {}
+    for var in endogenous:
+        reached, frontier = set(), [var]
+        while frontier:
+            for effect in effects.get(frontier.pop(), ()):
+                if effect not in reached:
+                    reached.add(effect)
+                    frontier.append(effect)
+        downstream[var] = reached
+    candidates = {(lval, "~", rval) for lval in endogenous for rval in observed
+                  if lval != rval and rval not in downstream[lval]}
+    candidates |= {(lval, "~~", rval) for lval, rval in itertools.combinations(endogenous, 2)}
+    candidates -= relations
+    if not candidates:
+        return {}
+
+    model = semopy.Model(_write_description(relations | candidates))
+    model.load(cov=cov.loc[model.vars["observed"], model.vars["observed"]], n_samples=n_samples)
+    parameter_relations = list(_parameter_relations(model).values())
+    x = np.array([0.0 if relation in candidates else estimates.get(relation, start)
+                  for relation, start in zip(parameter_relations, model.param_vals)])
+    model.update_matrices(x)
+    sigma, (m, c) = model.calc_sigma()
+    inv_sigma = np.linalg.inv(sigma)
+    weighted_grads = inv_sigma @ np.array(model.calc_sigma_grad(m, c))
+    information = _expected_information(weighted_grads, n_samples)
+    scores = n_samples / 2 * np.einsum("ij,kji->k", inv_sigma @ (model.mx_cov - sigma),
+                                       weighted_grads)
+    new = np.array([relation in candidates for relation in parameter_relations])
+    # Information about each new parameter left after adjusting for the existing ones.
+    cross = information[np.ix_(new, ~new)]
+    residual = (information.diagonal()[new]
+                - ((cross @ np.linalg.pinv(information[np.ix_(~new, ~new)])) * cross).sum(axis=1))
+    indices = scores[new] ** 2 / np.where(residual > 0, residual, np.nan)
+    return {relation: index for relation, index
+            in zip(itertools.compress(parameter_relations, new), indices)
+            if np.isfinite(index)}
@@ -0,0 +1,211 @@
+"""Indexed registry of fitted models.
+
+The fit command records every run into a SQLite database: the output path, the hash of the
+canonical model description (the same for descriptions differing only in the order or grouping
+of their relations), a fingerprint of the data, the fit statistics and every row of the
+parameter table. Output directories written before the registry existed can be imported with
+add_output. Parameters are indexed by relation and p-value, so queries such as every run where
+the 2002_2010_percent_upzoned -> d_2010_2018_median_gross_rent estimate has p < 0.05 only read
+the matching rows.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from .lazy import lazy_import
+from .model import description_hash
+
+pd = lazy_import("pandas")
+
+REGISTRY_PATH = "experiments.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    recorded REAL NOT NULL,
+    description_hash TEXT,
+    data_fingerprint TEXT,
+    description TEXT,
+    data_path TEXT,
+    model TEXT,
+    objective TEXT,
+    n_samples INTEGER
+);
+CREATE TABLE IF NOT EXISTS stats (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    stat TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, stat)
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    lval TEXT NOT NULL,
+    op TEXT NOT NULL,
+    rval TEXT NOT NULL,
+    estimate REAL,
+    std_err REAL,
+    z_value REAL,
+    p_value REAL,
+    robust_std_err REAL,
+    robust_z_value REAL,
+    robust_p_value REAL
+);
+CREATE INDEX IF NOT EXISTS runs_output_path ON runs (output_path);
+CREATE INDEX IF NOT EXISTS runs_description_hash ON runs (description_hash);
+CREATE INDEX IF NOT EXISTS runs_data_fingerprint ON runs (data_fingerprint);
+CREATE INDEX IF NOT EXISTS stats_stat ON stats (stat, value);
+CREATE INDEX IF NOT EXISTS parameters_relation ON parameters (lval, op, rval, p_value);
+CREATE INDEX IF NOT EXISTS parameters_rval ON parameters (rval, op, p_value);
+CREATE INDEX IF NOT EXISTS parameters_run ON parameters (run_id);
+"""
+
+# Columns of the parameter table written by the fit command (evaluate), by registry column.
+_PARAMETER_COLUMNS = {
+    "estimate": "Estimate",
+    "std_err": "Std. Err",
+    "z_value": "z-value",
+    "p_value": "p-value",
+    "robust_std_err": "Robust Std. Err",
+    "robust_z_value": "Robust z-value",
+    "robust_p_value": "Robust p-value",
+}
+
+
+def connect(path: str=REGISTRY_PATH) -> sqlite3.Connection:
+    """Opens the registry at path, creating it if it doesn't exist.
+    """
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def data_fingerprint(data: pd.DataFrame) -> str:
+    """Returns a fingerprint of a dataset's columns, index and values.
+    """
+    digest = hashlib.sha256("\n".join(map(str, data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def record_run(connection: sqlite3.Connection, output_path: str, desc: str, stats: Dict,
+               params: pd.DataFrame, data: pd.DataFrame=None, fingerprint: str=None,
+               **info) -> int:
+    """Records a fitted model and returns its run id.
+
+    stats and params are the fit statistics and parameter table from evaluate. The data's
+    fingerprint is computed from data unless given. info sets the run's data_path, model,
+    objective and n_samples. A run already recorded for the same output path, description and
+    data is replaced.
+    """
+    output_path = os.path.abspath(output_path)
+    digest = description_hash(desc) if desc is not None else None
+    if fingerprint is None and data is not None:
+        fingerprint = data_fingerprint(data)
+    rows = params.reindex(columns=["lval", "op", "rval"] + list(_PARAMETER_COLUMNS.values()))
+    values = rows[list(_PARAMETER_COLUMNS.values())].apply(pd.to_numeric, errors="coerce")
+    values = values.astype(object).where(values.notna(), None)
+    with connection:
+        connection.execute(
+            "DELETE FROM runs WHERE output_path = ? AND description_hash IS ? "
+            "AND data_fingerprint IS ?", (output_path, digest, fingerprint))
+        run_id = connection.execute(
+            "INSERT INTO runs (name, output_path, recorded, description_hash, data_fingerprint, "
+            "description, data_path, model, objective, n_samples) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (os.path.basename(output_path.rstrip(os.sep)), output_path, time.time(), digest,
+             fingerprint, desc, info.get("data_path"), info.get("model"), info.get("objective"),
+             info.get("n_samples"))).lastrowid
+        connection.executemany(
+            "INSERT INTO stats (run_id, stat, value) VALUES (?, ?, ?)",
+            [(run_id, stat, _to_float(value)) for stat, value in stats.items()])
+        connection.executemany(
+            "INSERT INTO parameters (run_id, lval, op, rval, " + ", ".join(_PARAMETER_COLUMNS)
+            + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(run_id, lval, op, rval, *row) for (lval, op, rval), row
+             in zip(rows[["lval", "op", "rval"]].itertuples(index=False, name=None),
+                    values.itertuples(index=False, name=None))])
+    return run_id
+
+
+def _read_stats(output_path: str) -> Dict:
+    """Reads the statistics the fit command wrote, as model_stats.txt or model_stats.json.
+    """
+    path = os.path.join(output_path, "model_stats.txt")
+    if os.path.exists(path):
+        with open(path) as f:
+            return dict(line.rstrip("\n").split(": ", 1) for line in f if ": " in line)
+    path = os.path.join(output_path, "model_stats.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def add_output(connection: sqlite3.Connection, output_path: str) -> int:
+    """Records the model in an output directory of the fit command, from its
+    model_inspection.csv, statistics and model_description.txt if it has one, and returns its
+    run id. The data it was fitted to is unknown, so the run has no data fingerprint.
+    """
+    params = pd.read_csv(os.path.join(output_path, "model_inspection.csv"), index_col=0)
+    desc = None
+    if os.path.exists(os.path.join(output_path, "model_description.txt")):
+        with open(os.path.join(output_path, "model_description.txt")) as f:
+            desc = f.read()
+    return record_run(connection, output_path, desc, _read_stats(output_path), params)
+
+
+def add_outputs(connection: sqlite3.Connection, paths: Iterable[str]) -> Dict[str, int]:
+    """Records every fit command output directory among paths, returning their run ids.
+    """
+    return {path: add_output(connection, path) for path in paths
+            if os.path.exists(os.path.join(path, "model_inspection.csv"))}
+
+
+def find_parameters(connection: sqlite3.Connection, x: str=None, y: str=None, op="~",
+                    max_p_value: float=None, robust=False) -> pd.DataFrame:
+    """Returns the parameters of every recorded run of the relation from x to y (the regression
+    y ~ x by default), either of which may be left out to match any variable, with
+    p-values below max_p_value if given (the robust p-values with robust).
+    """
+    conditions, values = ["parameters.op = ?"], [op]
+    if y is not None:
+        conditions.append("parameters.lval = ?")
+        values.append(y)
+    if x is not None:
+        conditions.append("parameters.rval = ?")
+        values.append(x)
+    if max_p_value is not None:
+        conditions.append(f"parameters.{'robust_p_value' if robust else 'p_value'} < ?")
+        values.append(max_p_value)
+    query = ("SELECT runs.id AS run_id, runs.name, runs.output_path, runs.description_hash, "
+             "runs.data_fingerprint, parameters.lval, parameters.op, parameters.rval, "
+             + ", ".join("parameters." + column for column in _PARAMETER_COLUMNS)
+             + " FROM parameters JOIN runs ON runs.id = parameters.run_id WHERE "
+             + " AND ".join(conditions) + " ORDER BY runs.id")
+    return pd.read_sql_query(query, connection, params=values)
+
+
+def get_runs(connection: sqlite3.Connection) -> pd.DataFrame:
+    """Returns every recorded run with its statistics as columns.
+    """
+    runs = pd.read_sql_query(
+        "SELECT id, name, output_path, recorded, description_hash, data_fingerprint, data_path, "
+        "model, objective, n_samples FROM runs ORDER BY id", connection, index_col="id")
+    stats = pd.read_sql_query("SELECT run_id, stat, value FROM stats", connection)
+    return runs.join(stats.pivot(index="run_id", columns="stat", values="value"))
@@ -0,0 +1,177 @@
+"""Local HTTP/JSON service answering queries about a fitted model.
+
+The model is restored from the output directory of the fit command and its effects are
+computed once when the server starts, so every query is answered from memory. Requests are
+handled on their own threads and only read the shared state.
+
+GET /variables
+    The model's structural variables, its outcomes and the number of tracts.
+GET /effect?x=X[&y=Y]
+    The total effects of setting X on Y, or on every outcome.
+GET /paths?x=X&y=Y
+    Every directed path from X to Y, with the product of its coefficients.
+GET /predict?tract=T&x=X&value=V[&y=Y]
+    The predicted change in Y, or in every outcome, in tract T (an ITZ_GEOID) if X were set to
+    V. Values are on the model's scale, so e.g. log_ variables take logged values.
+
+Errors are returned as {"error": message} with status 400, or 404 for unknown paths and tracts.
+"""
+
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+import json
+import os
+
+from .lazy import lazy_import
+from .model import counterfactual_effects, set_estimates, transform_data
+from .tracing import span
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+semopy = lazy_import("semopy")
+
+
+class QueryError(Exception):
+    """A query that can't be answered, with the HTTP status to answer it with.
+    """
+
+    def __init__(self, message: str, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def load_model(output_path: str, data: pd.DataFrame) -> Tuple[semopy.Model, pd.DataFrame]:
+    """Restores the model fitted by the fit command into output_path, returning it and its
+    transformed data indexed by ITZ_GEOID.
+    """
+    with open(os.path.join(output_path, "model_description.txt")) as f:
+        desc = f.read()
+    inspection = pd.read_csv(os.path.join(output_path, "model_inspection.csv"), index_col=0)
+    model = semopy.Model(desc)
+    model_data = transform_data(set(model.vars["observed"]), data)
+    model_data.index = data.loc[model_data.index, "ITZ_GEOID"]
+    model.load(model_data)
+    set_estimates(model, inspection)
+    return model, model_data
+
+
+def make_state(model: semopy.Model, model_data: pd.DataFrame) -> Dict:
+    """Computes everything queries are answered from: the total effects of every structural
+    variable, the structural edges, and the tracts' values.
+    """
+    with span("make_state") as info:
+        structural = [var for var in model.vars["inner"] if var in model.vars["observed"]]
+        effects = {var: counterfactual_effects(model, [var])[var] for var in structural}
+        edges = {}
+        for matrix, names in ((model.mx_beta, model.names_beta),
+                              (model.mx_lambda, model.names_lambda)):
+            for i, j in zip(*np.nonzero(matrix)):
+                lval, rval = names[0][i], names[1][j]
+                if lval != rval:
+                    edges.setdefault(rval, []).append((lval, float(matrix[i, j])))
+        info["variables"] = len(structural)
+        info["rows"] = len(model_data)
+    return {
+        "effects": effects,
+        "edges": edges,
+        "outcomes": list(next(iter(effects.values())).index) if effects else [],
+        "data": model_data,
+    }
+
+
+def answer(state: Dict, endpoint: str, params: Dict[str, str]) -> Dict:
+    """Answers a query to an endpoint with the given parameters.
+    """
+    if endpoint == "/variables":
+        return {"variables": list(state["effects"]), "outcomes": state["outcomes"],
+                "tracts": len(state["data"])}
+    if endpoint == "/effect":
+        effects = _effects(state, params)
+        return {"x": params["x"], "effects": effects.to_dict()}
+    if endpoint == "/paths":
+        x, y = _param(params, "x"), _param(params, "y")
+        _effects(state, params)
+        paths = _paths(state["edges"], x, y, [x], 1.0)
+        return {"x": x, "y": y,
+                "paths": [{"path": path, "coefficient": coef} for path, coef in paths]}
+    if endpoint == "/predict":
+        effects = _effects(state, params)
+        x, tract = params["x"], _param(params, "tract")
+        try:
+            value = float(_param(params, "value"))
+        except ValueError:
+            raise QueryError("value must be a number.")
+        if tract not in state["data"].index:
+            raise QueryError(f"Unknown tract {tract}.", 404)
+        current = float(state["data"].at[tract, x])
+        if np.isnan(current):
+            raise QueryError(f"Tract {tract} has no value of {x}.")
+        return {"tract": tract, "x": x, "current": current, "value": value,
+                "changes": (effects * (value - current)).to_dict()}
+    raise QueryError(f"Unknown endpoint {endpoint}.", 404)
+
+
+def _param(params: Dict[str, str], name: str) -> str:
+    """Returns a required query parameter.
+    """
+    if name not in params:
+        raise QueryError(f"Missing parameter {name}.")
+    return params[name]
+
+
+def _effects(state: Dict, params: Dict[str, str]) -> pd.Series:
+    """Returns the effects of the query's x on its y, or on every outcome without one.
+    """
+    x = _param(params, "x")
+    if x not in state["effects"]:
+        raise QueryError(f"Unknown variable {x}.")
+    effects = state["effects"][x]
+    if "y" not in params:
+        return effects
+    if params["y"] not in effects.index:
+        raise QueryError(f"Unknown outcome {params['y']}.")
+    return effects[[params["y"]]]
+
+
+def _paths(edges: Dict[str, List[Tuple[str, float]]], var: str, y: str, path: List[str],
+           coef: float) -> List[Tuple[List[str], float]]:
+    """Returns every directed path from the end of path to y, with the products of their
+    coefficients.
+    """
+    if var == y:
+        return [(path, coef)]
+    paths = []
+    for lval, edge_coef in edges.get(var, []):
+        if lval not in path:
+            paths.extend(_paths(edges, lval, y, path + [lval], coef * edge_coef))
+    return paths
+
+
+def make_server(state: Dict, host="127.0.0.1", port=8000, verbose=False) -> ThreadingHTTPServer:
+    """Returns a server answering queries from state on its own thread per request, logging
+    the requests if verbose.
+    """
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: vals[-1] for key, vals in parse_qs(url.query).items()}
+            try:
+                status, body = 200, answer(state, url.path.rstrip("/"), params)
+            except QueryError as e:
+                status, body = e.status, {"error": str(e)}
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return ThreadingHTTPServer((host, port), Handler)
@@ -0,0 +1,359 @@
+"""Spatial weights between census tracts, spatial lags and Moran's I.
+
+Tract boundaries are read from the 2010 census tract GeoJSON into flat vertex arrays. Contiguity
+is found from the vertices tracts share, which are matched by snapping them to a grid rather
+than by testing pairs of polygons: queen neighbors share a vertex, rook neighbors share at least
+two (and so a stretch of boundary). Nearest neighbors are found with a KD-tree over the tracts'
+centroids in state plane feet. Weights are row-standardized sparse matrices, cached per file.
+
+Points are placed in tracts by locate_points, which finds the rings whose bounding boxes contain
+each point from a grid over the bounding boxes, then counts the crossings of a ray from the
+point with the edges of those rings in the point's horizontal band.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, NamedTuple, Tuple
+import json
+import math
+import os
+
+from .data import CENSUS_TRACT_GEODATA_PATH, CODE_TO_COUNTY
+from .lazy import lazy_import
+from .tracing import span, traced
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+scipy = lazy_import("scipy")
+semopy = lazy_import("semopy")
+
+
+WEIGHT_KINDS = ("queen", "rook", "knn")
+
+# Decimal places of longitude and latitude that vertices are snapped to when matching them,
+# about 10cm.
+VERTEX_DECIMALS = 6
+
+# Cells of locate_points' grid per ring, and horizontal bands its edges are binned into per
+# grid cell height.
+LOCATE_CELLS_PER_RING = 1
+LOCATE_BANDS_PER_CELL = 16
+
+# Feet per meter in the US survey foot.
+US_SURVEY_FOOT = 1200 / 3937
+
+_geometries = {}
+_weights = {}
+
+
+class TractGeometry(NamedTuple):
+    """The boundaries of census tracts as flat arrays of rings.
+    """
+    ids: pd.Index  # ITZ_GEOID of every tract.
+    vertices: np.ndarray  # Longitude and latitude of every vertex of every (closed) ring.
+    ring_offsets: np.ndarray  # Index of the first vertex of every ring, then the vertex count.
+    ring_tracts: np.ndarray  # Tract of every ring.
+
+
+def to_state_plane(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Projects longitude and latitude into New York State Plane Long Island (EPSG:2263) feet,
+    the coordinate system of PLUTO's XCoord and YCoord.
+    """
+    a, f = 6378137.0, 1 / 298.257222101
+    e = math.sqrt(2 * f - f * f)
+    lat_1, lat_2 = math.radians(41 + 2 / 60), math.radians(40 + 40 / 60)
+    lat_0, lon_0 = math.radians(40 + 10 / 60), math.radians(-74)
+    x_0 = 300000.0
+
+    def _m(phi):
+        return np.cos(phi) / np.sqrt(1 - (e * np.sin(phi)) ** 2)
+
+    def _t(phi):
+        return (np.tan(np.pi / 4 - phi / 2)
+                / ((1 - e * np.sin(phi)) / (1 + e * np.sin(phi))) ** (e / 2))
+
+    n = (math.log(_m(lat_1)) - math.log(_m(lat_2))) / (math.log(_t(lat_1)) - math.log(_t(lat_2)))
+    big_f = _m(lat_1) / (n * _t(lat_1) ** n)
+    rho_0 = a * big_f * _t(lat_0) ** n
+    phi, lam = np.radians(lat), np.radians(lon)
+    rho = a * big_f * _t(phi) ** n
+    theta = n * (lam - lon_0)
+    x = x_0 + rho * np.sin(theta)
+    y = rho_0 - rho * np.cos(theta)
+    return x / US_SURVEY_FOOT, y / US_SURVEY_FOOT
+
+
+@traced
+def get_tract_geometry(path: str=CENSUS_TRACT_GEODATA_PATH) -> TractGeometry:
+    """Returns the boundaries of the New York City tracts in a census tract GeoJSON, cached
+    until the file changes.
+    """
+    key = (path, os.path.getmtime(path))
+    if key not in _geometries:
+        with open(path, "r") as f:
+            geodata = json.load(f)
+        ids, rings, ring_tracts = [], [], []
+        for feature in geodata["features"]:
+            properties = feature["properties"]
+            if properties["COUNTYFP10"] not in CODE_TO_COUNTY:
+                continue
+            geometry = feature["geometry"]
+            polygons = ([geometry["coordinates"]] if geometry["type"] == "Polygon"
+                        else geometry["coordinates"])
+            for polygon in polygons:
+                for ring in polygon:
+                    rings.append(np.asarray(ring, dtype=float)[:, :2])
+                    ring_tracts.append(len(ids))
+            ids.append(CODE_TO_COUNTY[properties["COUNTYFP10"]] + properties["NAME10"])
+        _geometries[key] = TractGeometry(
+            pd.Index(ids, name="ITZ_GEOID"),
+            np.concatenate(rings),
+            np.cumsum([0] + [len(ring) for ring in rings]),
+            np.array(ring_tracts),
+        )
+    return _geometries[key]
+
+
+def get_centroids(geometry: TractGeometry) -> np.ndarray:
+    """Returns the centroid of every tract in state plane feet.
+    """
+    x, y = to_state_plane(geometry.vertices[:, 0], geometry.vertices[:, 1])
+    # Shoelace terms of consecutive vertices within the same ring.
+    ring_of_vertex = np.repeat(np.arange(len(geometry.ring_tracts)),
+                               np.diff(geometry.ring_offsets))
+    same_ring = ring_of_vertex[:-1] == ring_of_vertex[1:]
+    x0, y0, x1, y1 = x[:-1][same_ring], y[:-1][same_ring], x[1:][same_ring], y[1:][same_ring]
+    cross = x0 * y1 - x1 * y0
+    # Signed areas, so holes wound against their polygon are subtracted from it.
+    tracts = geometry.ring_tracts[ring_of_vertex[:-1][same_ring]]
+    count = len(geometry.ids)
+    area = np.bincount(tracts, cross, count) / 2
+    centroid_x = np.bincount(tracts, (x0 + x1) * cross, count) / (6 * area)
+    centroid_y = np.bincount(tracts, (y0 + y1) * cross, count) / (6 * area)
+    return np.column_stack([centroid_x, centroid_y])
+
+
+@traced
+def locate_points(x: np.ndarray, y: np.ndarray, geometry: TractGeometry) -> np.ndarray:
+    """Returns the index in geometry.ids of the tract containing each point, given in state
+    plane feet, or -1 for points outside every tract.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    vx, vy = to_state_plane(geometry.vertices[:, 0], geometry.vertices[:, 1])
+    offsets = geometry.ring_offsets
+    ring_of_vertex = np.repeat(np.arange(len(geometry.ring_tracts)), np.diff(offsets))
+    min_x, max_x = np.minimum.reduceat(vx, offsets[:-1]), np.maximum.reduceat(vx, offsets[:-1])
+    min_y, max_y = np.minimum.reduceat(vy, offsets[:-1]), np.maximum.reduceat(vy, offsets[:-1])
+
+    # Grid of square cells over the tracts, listing the rings whose bounding boxes overlap each.
+    origin_x, origin_y = min_x.min(), min_y.min()
+    size = math.sqrt((max_x.max() - origin_x) * (max_y.max() - origin_y)
+                     / (len(min_x) * LOCATE_CELLS_PER_RING))
+    columns = int((max_x.max() - origin_x) // size) + 1
+    rows = int((max_y.max() - origin_y) // size) + 1
+    cells, cell_rings = _overlapping_cells(
+        (min_x - origin_x) // size, (max_x - origin_x) // size, (min_y - origin_y) // size,
+        (max_y - origin_y) // size, columns)
+    order = np.argsort(cells, kind="stable")
+    cell_offsets = np.searchsorted(cells[order], np.arange(columns * rows + 1))
+    cell_rings = cell_rings[order]
+
+    # Edges of each ring, binned by the bands they span.
+    height = size / LOCATE_BANDS_PER_CELL
+    bands = rows * LOCATE_BANDS_PER_CELL
+    same_ring = np.flatnonzero(ring_of_vertex[:-1] == ring_of_vertex[1:])
+    x0, y0, x1, y1 = vx[same_ring], vy[same_ring], vx[same_ring + 1], vy[same_ring + 1]
+    edge_keys, edges = _overlapping_cells(
+        np.zeros(len(same_ring)), np.zeros(len(same_ring)),
+        (np.minimum(y0, y1) - origin_y) // height, (np.maximum(y0, y1) - origin_y) // height, 1)
+    edge_keys = ring_of_vertex[same_ring][edges] * bands + edge_keys
+    order = np.argsort(edge_keys, kind="stable")
+    edge_keys, edges = edge_keys[order], edges[order]
+
+    # Candidate rings of every point inside the grid.
+    column, row = (x - origin_x) // size, (y - origin_y) // size
+    inside = (column >= 0) & (column < columns) & (row >= 0) & (row < rows)
+    points = np.flatnonzero(inside)
+    cell = (row[points] * columns + column[points]).astype(int)
+    counts = cell_offsets[cell + 1] - cell_offsets[cell]
+    pair_points = np.repeat(points, counts)
+    pair_rings = cell_rings[_ranges(cell_offsets[cell], counts)]
+    in_box = ((x[pair_points] >= min_x[pair_rings]) & (x[pair_points] <= max_x[pair_rings])
+              & (y[pair_points] >= min_y[pair_rings]) & (y[pair_points] <= max_y[pair_rings]))
+    pair_points, pair_rings = pair_points[in_box], pair_rings[in_box]
+
+    # Crossings of a ray to the right of every point with its candidate rings' edges in its band.
+    keys = pair_rings * bands + ((y[pair_points] - origin_y) // height).astype(int)
+    starts = np.searchsorted(edge_keys, keys)
+    counts = np.searchsorted(edge_keys, keys, side="right") - starts
+    tests = np.repeat(np.arange(len(keys)), counts)
+    edge = edges[_ranges(starts, counts)]
+    px, py = x[pair_points][tests], y[pair_points][tests]
+    ex0, ey0, ex1, ey1 = x0[edge], y0[edge], x1[edge], y1[edge]
+    straddles = (ey0 > py) != (ey1 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crosses = straddles & (px < ex0 + (py - ey0) * (ex1 - ex0) / (ey1 - ey0))
+    crossings = np.bincount(tests, crosses, len(keys))
+
+    # A point is in a tract if it crosses the edges of all its rings (parts and holes) an odd
+    # number of times.
+    pair_tracts = geometry.ring_tracts[pair_rings]
+    pair_keys, totals = np.unique(pair_points * len(geometry.ids) + pair_tracts,
+                                  return_inverse=True)
+    totals = np.bincount(totals.ravel(), crossings, len(pair_keys))
+    contained = pair_keys[totals % 2 == 1]
+    tracts = np.full(len(x), -1)
+    tracts[contained // len(geometry.ids)] = contained % len(geometry.ids)
+    return tracts
+
+
+def _overlapping_cells(first_column: np.ndarray, last_column: np.ndarray, first_row: np.ndarray,
+                       last_row: np.ndarray, columns: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the cells of a grid that boxes spanning the given cells overlap, and the box
+    overlapping each.
+    """
+    first_column, last_column = first_column.astype(int), last_column.astype(int)
+    first_row, last_row = first_row.astype(int), last_row.astype(int)
+    widths, heights = last_column - first_column + 1, last_row - first_row + 1
+    boxes = np.repeat(np.arange(len(widths)), widths * heights)
+    within = _ranges(np.zeros(len(widths), dtype=int), widths * heights)
+    cells = ((first_row[boxes] + within // widths[boxes]) * columns
+             + first_column[boxes] + within % widths[boxes])
+    return cells, boxes
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Returns the concatenation of the ranges of counts integers from starts.
+    """
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts - starts, counts)
+
+
+@traced
+def get_weights(kind="queen", k=6, path: str=CENSUS_TRACT_GEODATA_PATH
+                ) -> Tuple[pd.Index, scipy.sparse.csr_matrix]:
+    """Returns the tracts of a census tract GeoJSON and a row-standardized sparse weights
+    matrix between them, of queen or rook contiguity or of each tract's k nearest neighbors.
+    Tracts without neighbors have empty rows. Weights are cached until the file changes.
+    """
+    if kind not in WEIGHT_KINDS:
+        raise ValueError(f"Unknown kind of weights {kind}.")
+    key = (path, os.path.getmtime(path), kind, k if kind == "knn" else None)
+    if key in _weights:
+        return _weights[key]
+
+    geometry = get_tract_geometry(path)
+    count = len(geometry.ids)
+    with span("build_weights", kind=kind) as info:
+        if kind == "knn":
+            centroids = get_centroids(geometry)
+            k = min(k, count - 1)
+            _, neighbors = scipy.spatial.cKDTree(centroids).query(centroids, k + 1)
+            # The nearest point to every centroid is itself.
+            links = scipy.sparse.csr_matrix(
+                (np.ones(count * k), (np.repeat(np.arange(count), k), neighbors[:, 1:].ravel())),
+                shape=(count, count))
+        else:
+            # Incidence of tracts and snapped vertices, so A A^T counts the vertices every pair
+            # of tracts shares.
+            snapped = np.round(geometry.vertices, VERTEX_DECIMALS)
+            _, vertex_ids = np.unique(snapped, axis=0, return_inverse=True)
+            ring_of_vertex = np.repeat(np.arange(len(geometry.ring_tracts)),
+                                       np.diff(geometry.ring_offsets))
+            incidence = scipy.sparse.csr_matrix(
+                (np.ones(len(vertex_ids)), (geometry.ring_tracts[ring_of_vertex],
+                                            vertex_ids.ravel())),
+                shape=(count, vertex_ids.max() + 1))
+            incidence.data[:] = 1
+            shared = (incidence @ incidence.T).tocsr()
+            shared.setdiag(0)
+            shared.eliminate_zeros()
+            links = shared >= (1 if kind == "queen" else 2)
+        links = scipy.sparse.csr_matrix(links, dtype=float)
+        degree = np.asarray(links.sum(axis=1)).ravel()
+        weights = (scipy.sparse.diags(np.divide(1, degree, out=np.zeros(count), where=degree > 0))
+                   @ links).tocsr()
+        info["rows"] = count
+        info["links"] = links.nnz
+    _weights[key] = (geometry.ids, weights)
+    return _weights[key]
+
+
+def _align(weights: Tuple[pd.Index, scipy.sparse.csr_matrix], geoids: pd.Series
+           ) -> scipy.sparse.csr_matrix:
+    """Returns the weights between the tracts with the given ITZ_GEOIDs, in their order.
+    Tracts missing from the weights have no neighbors.
+    """
+    ids, matrix = weights
+    positions = ids.get_indexer(geoids)
+    found = positions >= 0
+    # Maps the weights' tracts to rows of geoids, dropping tracts that aren't there.
+    selection = scipy.sparse.csr_matrix(
+        (np.ones(found.sum()), (positions[found], np.flatnonzero(found))),
+        shape=(len(ids), len(geoids)))
+    return (selection.T @ matrix @ selection).tocsr()
+
+
+@traced
+def spatial_lag(data: pd.DataFrame, columns, weights: Tuple[pd.Index, scipy.sparse.csr_matrix]
+                =None) -> pd.DataFrame:
+    """Returns the weighted average of each column over every tract's neighbors, in columns
+    named lag_<column>, for a dataset with an ITZ_GEOID column. Missing values are left out of
+    the averages, and tracts without neighbors with values get NaN. Weights default to queen
+    contiguity (see get_weights).
+    """
+    matrix = _align(weights if weights is not None else get_weights(), data["ITZ_GEOID"])
+    values = data[list(columns)].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    totals = matrix @ np.where(present, values, 0)
+    shares = matrix @ present.astype(float)
+    lags = np.divide(totals, shares, out=np.full(values.shape, np.nan), where=shares > 0)
+    return pd.DataFrame(lags, index=data.index, columns=["lag_" + column for column in columns])
+
+
+def morans_i(values: np.ndarray, matrix: scipy.sparse.spmatrix) -> Dict[str, float]:
+    """Returns Moran's I of values under weights between them, with its expectation and the
+    z-value and two-sided p-value of the normal approximation under randomization.
+    """
+    n = len(values)
+    z = values - values.mean()
+    s0 = matrix.sum()
+    moran = n / s0 * (z @ (matrix @ z)) / (z @ z)
+    symmetric = matrix + matrix.T
+    s1 = symmetric.multiply(symmetric).sum() / 2
+    s2 = ((np.asarray(matrix.sum(axis=0)).ravel() + np.asarray(matrix.sum(axis=1)).ravel()) ** 2
+          ).sum()
+    kurtosis = n * (z ** 4).sum() / (z @ z) ** 2
+    expected = -1 / (n - 1)
+    variance = ((n * ((n ** 2 - 3 * n + 3) * s1 - n * s2 + 3 * s0 ** 2)
+                 - kurtosis * ((n ** 2 - n) * s1 - 2 * n * s2 + 6 * s0 ** 2))
+                / ((n - 1) * (n - 2) * (n - 3) * s0 ** 2) - expected ** 2)
+    z_value = (moran - expected) / math.sqrt(variance)
+    return {"Moran's I": moran, "expected": expected, "z-value": z_value,
+            "p-value": 2 * scipy.stats.norm.sf(abs(z_value))}
+
+
+@traced
+def residual_morans_i(model: semopy.Model, geoids: pd.Series,
+                      weights: Tuple[pd.Index, scipy.sparse.csr_matrix]=None) -> pd.DataFrame:
+    """Returns Moran's I of the residuals of every structural equation of a fitted model over
+    observed variables, given the ITZ_GEOIDs of the rows of its data. Tracts with missing
+    residuals are left out. Weights default to queen contiguity (see get_weights).
+    """
+    observed = list(model.vars["observed"])
+    inner = list(model.vars["inner"])
+    data = pd.DataFrame(model.mx_data, columns=observed)
+    latent = [inner.index(var) for var in model.vars["latent"]]
+    matrix = _align(weights if weights is not None else get_weights(), pd.Series(geoids))
+    results = {}
+    for var in observed:
+        # semopy keeps the equations of variables that aren't regressors in Lambda.
+        coefs = (model.mx_beta[inner.index(var)] if var in inner
+                 else model.mx_lambda[observed.index(var)])
+        if not coefs.any() or coefs[latent].any():
+            continue
+        regressors = [inner[j] for j in np.flatnonzero(coefs)]
+        resid = (data[var] - data[regressors].to_numpy() @ coefs[np.flatnonzero(coefs)]).to_numpy()
+        keep = ~np.isnan(resid)
+        results[var] = morans_i(resid[keep], matrix[keep][:, keep])
+    return pd.DataFrame(results).T
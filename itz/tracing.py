@@ -0,0 +1,151 @@
+"""Stage timing and memory tracing.
+
+Code marks stages with span(), which does nothing until tracing is started. While tracing,
+each span records its wall time, CPU time, the process's peak RSS, the tracemalloc change and
+peak within the span, and any values set on the dictionary it yields (such as row counts).
+Spans nest, and the trace is written in the Chrome trace event format, which opens in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+
+_events: List[Dict] = None
+_stack: List[Dict] = []
+_origin = 0.0
+
+
+def is_tracing() -> bool:
+    """Returns whether a trace is being recorded.
+    """
+    return _events is not None
+
+
+def start():
+    """Starts recording spans and tracing memory allocations.
+    """
+    global _events, _origin
+    _events = []
+    _stack.clear()
+    _origin = time.perf_counter()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def stop(path: str=None) -> List[Dict]:
+    """Stops recording and returns the trace events, writing them to path if given.
+    """
+    global _events
+    events = _events if _events is not None else []
+    _events = None
+    _stack.clear()
+    tracemalloc.stop()
+    if path is not None:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, indent=1)
+    return events
+
+
+def _peak_rss_mb() -> float:
+    """Returns the peak resident set size of the process in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+@contextmanager
+def span(name: str, **args):
+    """Records a stage of work.
+
+    Yields a dictionary; anything stored in it (e.g. info["rows"] = len(df)) is saved with the
+    span, along with the keyword arguments.
+    """
+    info = dict(args)
+    if _events is None:
+        yield info
+        return
+
+    # The allocation peak is reset for every span, so fold the peak so far into the open spans
+    # before resetting it.
+    _, peak = tracemalloc.get_traced_memory()
+    for open_span in _stack:
+        open_span["peak"] = max(open_span["peak"], peak)
+    tracemalloc.reset_peak()
+    current, _ = tracemalloc.get_traced_memory()
+    frame = {"peak": current}
+    _stack.append(frame)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield info
+    finally:
+        wall_end, cpu_end = time.perf_counter(), time.process_time()
+        end_current, peak = tracemalloc.get_traced_memory()
+        _stack.pop()
+        frame["peak"] = max(frame["peak"], peak)
+        if _stack:
+            _stack[-1]["peak"] = max(_stack[-1]["peak"], frame["peak"])
+        if _events is not None:
+            _events.append({
+                "name": name,
+                "ph": "X",
+                "ts": (wall_start - _origin) * 1e6,
+                "dur": (wall_end - wall_start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {
+                    "wall_s": wall_end - wall_start,
+                    "cpu_s": cpu_end - cpu_start,
+                    "peak_rss_mb": _peak_rss_mb(),
+                    "tracemalloc_delta_mb": (end_current - current) / 2**20,
+                    "tracemalloc_peak_mb": (frame["peak"] - current) / 2**20,
+                    **{key: _jsonable(val) for key, val in info.items()},
+                },
+            })
+
+
+def traced(func: Callable) -> Callable:
+    """Decorator recording every call of a function as a span named after it. When the function
+    returns DataFrames, their row count is recorded too.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__name__) as info:
+            result = func(*args, **kwargs)
+            rows = _count_rows(result)
+            if rows is not None:
+                info["rows"] = rows
+            return result
+    return wrapper
+
+
+def _count_rows(result):
+    """Returns the number of rows in a DataFrame, or in all the DataFrames in a list or tuple.
+    """
+    if hasattr(result, "shape"):
+        return result.shape[0] if len(result.shape) else None
+    if isinstance(result, (list, tuple)):
+        counts = [_count_rows(item) for item in result]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def _jsonable(val):
+    """Converts numpy scalars and other values so they can be written as JSON.
+    """
+    if isinstance(val, (str, int, float, bool)) or val is None:
+        return val
+    try:
+        return val.item()
+    except AttributeError:
+        return str(val)
@@ -0,0 +1,107 @@
+"""The registry of census tracts.
+
+Sources name tracts in several formats: ACS GEO_IDs and GEOID10s ("1400000US36061000101" or
+"36061000101"), the tract_10 numbers of the subsidized properties (36061000101), PLUTO's borough
+and CT2010 ("MN" and "1.01"), and the geodata's county and tract codes ("061" and "000101").
+Every one is converted, vectorized, to the ITZ_GEOID used in output files ("MN1.01"). Internally,
+ITZ_GEOIDs are interned into dense int32 codes with encode, so joins and groupings compare
+integers, and turned back into strings with decode when written out.
+"""
+
+from __future__ import annotations
+
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+CODE_TO_COUNTY = {
+    "005": "BX",
+    "047": "BK",
+    "061": "MN",
+    "081": "QN",
+    "085": "SI"
+}
+COUNTY_TO_CODE = {
+    "BX": "005",
+    "BK": "047",
+    "MN": "061",
+    "QN": "081",
+    "SI": "085"
+}
+
+# Created on first use by _get_registry, so that importing the module doesn't import pandas.
+_registry = None
+
+
+def _get_registry() -> pd.Index:
+    """Returns the registry of ITZ_GEOIDs, creating it if it is still empty.
+    """
+    global _registry
+    if _registry is None:
+        _registry = pd.Index([], dtype=object, name="ITZ_GEOID")
+    return _registry
+
+
+def encode(geoids) -> np.ndarray:
+    """Returns the int32 codes of ITZ_GEOIDs, registering those seen for the first time, with
+    -1 for missing values.
+    """
+    global _registry
+    geoids = pd.Series(np.asarray(geoids, dtype=object))
+    codes = _get_registry().get_indexer(geoids)
+    new = pd.unique(geoids[(codes < 0) & geoids.notna()])
+    if len(new):
+        _registry = _registry.append(pd.Index(new, dtype=object, name="ITZ_GEOID"))
+        codes = _registry.get_indexer(geoids)
+    return codes.astype(np.int32)
+
+
+def decode(codes) -> np.ndarray:
+    """Returns the ITZ_GEOIDs of codes, with NaN for -1.
+    """
+    codes = np.asarray(codes)
+    geoids = np.asarray(_get_registry(), dtype=object)[np.maximum(codes, 0)]
+    return np.where(codes >= 0, geoids, np.nan)
+
+
+def decode_index(frame: pd.DataFrame) -> pd.DataFrame:
+    """Returns a frame indexed by codes re-indexed by their ITZ_GEOIDs.
+    """
+    frame = frame.copy()
+    frame.index = pd.Index(decode(frame.index), name="ITZ_GEOID")
+    return frame
+
+
+def from_county_tract(counties: pd.Series, tracts: pd.Series) -> pd.Series:
+    """Returns the ITZ_GEOIDs of tracts given their county codes (e.g. "061") and six digit
+    tract codes (e.g. "000101" for tract 1.01), with NaN outside New York City.
+    """
+    counties, tracts = pd.Series(counties, dtype="string"), pd.Series(tracts, dtype="string")
+    tracts = tracts.str.strip().str.zfill(6)
+    numbers = pd.to_numeric(tracts.str[:4], errors="coerce").astype("Int64").astype("string")
+    suffixes = tracts.str[4:]
+    geoids = (counties.str.strip().str.zfill(3).map(CODE_TO_COUNTY).astype("string") + numbers
+              + ("." + suffixes).where(suffixes != "00", ""))
+    return geoids.astype(object).where(geoids.notna(), np.nan)
+
+
+def from_geoid(geoids: pd.Series) -> pd.Series:
+    """Returns the ITZ_GEOIDs of census GEOIDs, in the ACS GEO_ID ("1400000US36061000101"),
+    GEOID10 ("36061000101") or numeric (36061000101) formats.
+    """
+    geoids = pd.Series(geoids)
+    if pd.api.types.is_numeric_dtype(geoids):
+        geoids = geoids.astype("Int64")
+    geoids = geoids.astype("string").str.strip()
+    return from_county_tract(geoids.str[-9:-6], geoids.str[-6:])
+
+
+def from_borough_tract(boroughs: pd.Series, tracts: pd.Series) -> pd.Series:
+    """Returns the ITZ_GEOIDs of tracts given their borough codes (e.g. "MN") and tract numbers
+    (e.g. "1.01", as in PLUTO's CT2010), with NaN where either is missing.
+    """
+    tracts = pd.Series(tracts, dtype="string").str.strip()
+    geoids = pd.Series(boroughs, dtype="string").str.strip() + tracts.where(tracts != "")
+    return geoids.astype(object).where(geoids.notna(), np.nan)
@@ -1,13 +1,18 @@
 """Statistics utility functions.
 """
 
+from __future__ import annotations
+
 from enum import Enum
 from typing import Tuple
 import math
 
-import numpy as np
-import pandas as pd
-import scipy
+from .lazy import lazy_import
+from .tracing import traced
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+scipy = lazy_import("scipy")
 
 
 # Value for shifting variables before log transformations. 
@@ -48,6 +53,47 @@ TRANSFORMATION_NAMES = (
     'identity'
 )
 
+# Transformations defined only for values >= 0 (or > -LOG_TRANSFORM_SHIFT), into which
+# search_transformations shifts variables with negative values.
+NONNEGATIVE_TRANSFORMATIONS = ('log', 'ln', 'log10', 'log2', 'cbrt', 'sqrt', 'reciprocal')
+
+# Prefixes of the variable names model.fit transforms, by transformation. Identity has none.
+FIT_PREFIXES = {
+    'identity': '',
+    'log': 'log_',
+    'ln': 'log_',
+    'sqrt': 'sqrt_',
+    'square': 'square_',
+}
+
+# Array versions of Transformations, applied to whole columns at once. Values outside a
+# transformation's domain come out as NaN/inf instead of raising.
+VECTORIZED_TRANSFORMATIONS = {
+    'log': lambda X: np.log(X + LOG_TRANSFORM_SHIFT),
+    'ln': lambda X: np.log(X + LOG_TRANSFORM_SHIFT),
+    'log10': lambda X: np.log10(X + LOG_TRANSFORM_SHIFT),
+    'log2': lambda X: np.log2(X + LOG_TRANSFORM_SHIFT),
+    'expe': lambda Y: np.exp(Y) - LOG_TRANSFORM_SHIFT,
+    'exp2': lambda Y: np.exp2(Y) - LOG_TRANSFORM_SHIFT,
+    'exp10': lambda Y: np.power(10.0, Y) - LOG_TRANSFORM_SHIFT,
+    'square': lambda X: X*X,
+    'cube': lambda X: X**3,
+    'cbrt': lambda X: X**(1/3),
+    'sqrt': lambda X: np.sqrt(X),
+    'reciprocal': lambda X: 1/(X+RECIPROCAL_TRANSFORM_SHIFT),
+    'identity': lambda X: X
+}
+
+
+def vectorized_transform(X: np.ndarray, transformation: str) -> np.ndarray:
+    """Applies one of TRANSFORMATION_NAMES to an array, returning floats with NaN wherever the
+    transformation is undefined.
+    """
+    with np.errstate(all="ignore"):
+        transformed = VECTORIZED_TRANSFORMATIONS[transformation](np.asarray(X, dtype=float))
+    transformed[~np.isfinite(transformed)] = np.nan
+    return transformed
+
 
 def log_transform(X: pd.Series) -> pd.Series:
     """Returns the log-transformed version of a variable.
@@ -113,4 +159,74 @@ def regress(x: str, y: str, data: pd.DataFrame, transformation_x=Transformations
     # transform_y = lambda y_: math.e ** y_ - LOG_TRANSFORM_SHIFT if transformation_y else y_
 
     # return fit[0], fit[1], r, p, r ** 2, lambda x_: transform_y(fit[0] * transform_x(x_) + fit[1])
-    return fit[0], fit[1], r, p, r ** 2, lambda x_: transformation_y(fit[0] * transformation_x(x_) + fit[1])
\ No newline at end of file
+    return fit[0], fit[1], r, p, r ** 2, lambda x_: transformation_y(fit[0] * transformation_x(x_) + fit[1])
+
+
+@traced
+def search_transformations(data: pd.DataFrame, transformations=TRANSFORMATION_NAMES
+                           ) -> pd.DataFrame:
+    """Scores every transformation of every numeric variable by how normal it makes the
+    variable's distribution, over all tracts (group "ALL") and within each borough.
+
+    Variables with negative values in a group are shifted up to 0 before transformations only
+    defined for nonnegative values. Every transformation is applied to the variables of every
+    group at once, as a (groups, tracts, variables) array, and scored by its skewness, excess
+    kurtosis and Jarque-Bera statistic (smaller is closer to normal). Transformations leaving out
+    values the identity keeps, e.g. by overflowing, aren't scored.
+
+    Returns one row per variable, group and transformation, ranked within the variable and group
+    from the most normal. fit_variable is the name fit transforms the variable by, for the
+    transformations fit applies (FIT_PREFIXES) without a shift, and recommended marks the best
+    ranked of those.
+    """
+    columns = [column for column in data.columns
+               if not str(column).startswith("Unnamed") and column != "all_vars"
+               and pd.api.types.is_numeric_dtype(data[column])]
+    values = data[columns].to_numpy(dtype=float)
+    boroughs = (data["ITZ_GEOID"].astype(str).str[:2].to_numpy() if "ITZ_GEOID" in data.columns
+                else np.full(len(data), "ALL"))
+    groups = ["ALL"] + sorted(set(boroughs) - {"ALL"})
+    masks = np.array([np.ones(len(data), dtype=bool)] + [boroughs == group for group in groups[1:]])
+    grouped = np.where(masks[:, :, np.newaxis], values[np.newaxis], np.nan)
+    present = ~np.isnan(grouped)
+    minimum = np.where(present, grouped, np.inf).min(axis=1)
+    shifts = np.where(np.isfinite(minimum) & (minimum < 0), -minimum, 0)
+
+    tables = []
+    for transformation in transformations:
+        shifted = transformation in NONNEGATIVE_TRANSFORMATIONS
+        X = vectorized_transform(grouped + shifts[:, np.newaxis, :] if shifted else grouped,
+                                 transformation)
+        kept = ~np.isnan(X)
+        n = kept.sum(axis=1)
+        with np.errstate(all="ignore"):
+            deviations = np.where(kept, X - np.where(kept, X, 0).sum(axis=1, keepdims=True)
+                                  / n[:, np.newaxis, :], 0)
+            m2 = (deviations ** 2).sum(axis=1) / n
+            skewness = (deviations ** 3).sum(axis=1) / n / m2 ** 1.5
+            kurtosis = (deviations ** 4).sum(axis=1) / n / m2 ** 2 - 3
+        jarque_bera = n / 6 * (skewness ** 2 + kurtosis ** 2 / 4)
+        # Transformations are only compared on the same values.
+        jarque_bera[(n < present.sum(axis=1)) | (n < 3) | ~np.isfinite(jarque_bera)] = np.nan
+        tables.append(pd.DataFrame({
+            "variable": np.tile(columns, len(groups)),
+            "group": np.repeat(groups, len(columns)),
+            "transformation": transformation,
+            "shift": (shifts if shifted else np.zeros_like(shifts)).ravel(),
+            "n": n.ravel(),
+            "skewness": skewness.ravel(),
+            "kurtosis": kurtosis.ravel(),
+            "jarque_bera": jarque_bera.ravel(),
+        }))
+    table = pd.concat(tables, ignore_index=True)
+    table["p_value"] = scipy.stats.chi2.sf(table["jarque_bera"], 2)
+    table = table.sort_values(["variable", "group", "jarque_bera"], na_position="last",
+                              kind="stable", ignore_index=True)
+    table["rank"] = table.groupby(["variable", "group"]).cumcount() + 1
+    prefixes = table["transformation"].map(FIT_PREFIXES)
+    usable = prefixes.notna() & (table["shift"] == 0) & table["jarque_bera"].notna()
+    table["fit_variable"] = (prefixes + table["variable"]).where(usable)
+    table["recommended"] = False
+    best = table[usable].groupby(["variable", "group"])["rank"].idxmin()
+    table.loc[best, "recommended"] = True
+    return table
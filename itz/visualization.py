@@ -6,14 +6,23 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import math
+import os
 import semopy
 import seaborn as sn
 import scipy
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from typing import List, Tuple
+from typing import List, Sequence, Tuple
 
 from .model import ModelName, get_description
-from .util import get_data_linreg, regress, Transformations
+from .tracing import traced
+from .util import (get_data_linreg, regress, vectorized_transform, Transformations,
+                   TRANSFORMATION_NAMES)
+
+
+HISTOGRAM_BINS = 100
+# Name of the bin table kept next to the rendered histograms.
+HISTOGRAM_BIN_STORE = "histogram-bins.csv"
 
 
 def make_sem_diagram(model_name: ModelName, data: pd.DataFrame, path: str, verbose: bool=False):
@@ -133,8 +142,6 @@ def make_residual_plot(x: str, y: str, data: pd.DataFrame, path: str,
 def make_histogram(x: str, data: pd.DataFrame, path: str, transformation=lambda x: x):
     """"Creates a histogram and returns descriptive statistics as a dictionary.
     """
-    print(data[x])
-    print(data.columns)
     # subdata = data[data["2002_2010_percent_upzoned"] < 50]
     # superdata = data[data["2002_2010_percent_upzoned"] > 50]
     X = (data[x][data[x].notnull()]).transform(transformation)
@@ -142,7 +149,6 @@ def make_histogram(x: str, data: pd.DataFrame, path: str, transformation=lambda
     # Z = (superdata[x][superdata[x].notnull()]).transform(transformation)
     mean, stdev = X.mean(), X.std()
     # print(Y.mean(), Z.mean())
-    print(X[X > 100])
     plt.hist(X, bins=100)
     # plt.hist(Y, bins=200)
     # plt.hist(Z, bins=200)
@@ -157,6 +163,137 @@ def make_histogram(x: str, data: pd.DataFrame, path: str, transformation=lambda
     }
 
 
+@traced
+def compute_histogram_bins(data: pd.DataFrame, transformations: Sequence[str]=TRANSFORMATION_NAMES,
+        bins: int=HISTOGRAM_BINS) -> pd.DataFrame:
+    """Computes histogram counts and descriptive statistics for every numeric column of the data
+    under every transformation.
+
+    Each transformation is applied to the whole data matrix at once and all columns are binned
+    with a single bincount. Bins are evenly spaced between each column's minimum and maximum, the
+    same as make_histogram. Returns one row per (variable, transformation) with columns n, mean,
+    stdev, min, max and count_0 ... count_<bins - 1>.
+    """
+    columns = [column for column in data.columns
+               if not str(column).startswith("Unnamed") and column != "all_vars"
+               and pd.api.types.is_numeric_dtype(data[column])]
+    values = data[columns].to_numpy(dtype=float)
+
+    tables = []
+    for transformation in transformations:
+        X = vectorized_transform(values, transformation)
+        present = ~np.isnan(X)
+        n = present.sum(axis=0)
+        filled = np.where(present, X, 0)
+        with np.errstate(all="ignore"):
+            mean = filled.sum(axis=0) / n
+            stdev = np.sqrt((np.where(present, X - mean, 0) ** 2).sum(axis=0) / (n - 1))
+        minimum = np.where(present, X, np.inf).min(axis=0)
+        maximum = np.where(present, X, -np.inf).max(axis=0)
+        empty = n == 0
+        minimum[empty], maximum[empty] = np.nan, np.nan
+
+        # Bin every present value, then count all columns at once.
+        rows, cols = np.nonzero(present)
+        width = (maximum - minimum)[cols]
+        with np.errstate(all="ignore"):
+            bin_index = np.floor((X[rows, cols] - minimum[cols]) / width * bins)
+        # Constant columns land in the middle bin, as in np.histogram.
+        bin_index[width == 0] = bins // 2
+        bin_index = np.clip(bin_index, 0, bins - 1).astype(np.int64)
+        counts = np.bincount(cols * bins + bin_index, minlength=len(columns) * bins)
+
+        table = pd.DataFrame(counts.reshape(len(columns), bins),
+                             columns=[f"count_{i}" for i in range(bins)])
+        table.insert(0, "max", maximum)
+        table.insert(0, "min", minimum)
+        table.insert(0, "stdev", stdev)
+        table.insert(0, "mean", mean)
+        table.insert(0, "n", n)
+        table.insert(0, "transformation", transformation)
+        table.insert(0, "variable", columns)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+def _histogram_path(output_dir: str, variable: str, transformation: str) -> str:
+    """Returns the image path for a variable's histogram under a transformation.
+    """
+    if transformation == "identity":
+        return os.path.join(output_dir, variable + ".png")
+    return os.path.join(output_dir, transformation + "_" + variable + ".png")
+
+
+def _render_histogram(job: Tuple[str, str, float, float, np.ndarray]):
+    """Renders one histogram from precomputed counts.
+    """
+    path, title, minimum, maximum, counts = job
+    if minimum == maximum:
+        minimum, maximum = minimum - 0.5, maximum + 0.5
+    edges = np.linspace(minimum, maximum, len(counts) + 1)
+    plt.hist(edges[:-1], bins=edges, weights=counts)
+    plt.title(title)
+    plt.savefig(path)
+    plt.clf()
+
+
+@traced
+def render_histogram_atlas(bin_table: pd.DataFrame, output_dir: str,
+        transformations: Sequence[str]=("identity",), processes: int=None, verbose: bool=False
+        ) -> List[str]:
+    """Renders histograms from a table made by compute_histogram_bins and stores the table in
+    output_dir.
+
+    Images are only rendered for the given transformations, and only when they are missing or
+    their row differs from the previously stored table. Rendering is spread over a process pool.
+    Returns the paths of the images that were rendered.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    store_path = os.path.join(output_dir, HISTOGRAM_BIN_STORE)
+    key_columns = ["variable", "transformation"]
+    value_columns = [column for column in bin_table.columns if column not in key_columns]
+
+    def _fingerprints(table):
+        return pd.Series(
+            pd.util.hash_pandas_object(table[value_columns].astype(float), index=False).values,
+            index=pd.MultiIndex.from_frame(table[key_columns]))
+
+    try:
+        previous = _fingerprints(pd.read_csv(store_path))
+    except (FileNotFoundError, KeyError):
+        previous = pd.Series(dtype="uint64")
+    bin_table.to_csv(store_path, index=False)
+
+    requested = bin_table[bin_table["transformation"].isin(transformations) & (bin_table["n"] > 0)]
+    current = _fingerprints(requested)
+    unchanged = current.index.isin(previous.index)
+    unchanged[unchanged] = (current[unchanged].values
+                            == previous.reindex(current.index[unchanged]).values)
+
+    count_columns = [column for column in bin_table.columns if column.startswith("count_")]
+    jobs = []
+    for is_unchanged, (_, row) in zip(unchanged, requested.iterrows()):
+        path = _histogram_path(output_dir, row["variable"], row["transformation"])
+        if is_unchanged and os.path.exists(path):
+            continue
+        title = f"{row['variable']} M: {round(row['mean'], 3)} S: {round(row['stdev'], 3)}"
+        jobs.append((path, title, row["min"], row["max"],
+                     row[count_columns].to_numpy(dtype=float)))
+    if verbose:
+        print(f"Rendering {len(jobs)} of {len(requested)} histograms... ", end="")
+
+    if len(jobs) > 1 and processes != 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            list(executor.map(_render_histogram, jobs, chunksize=max(1, len(jobs) // 64)))
+    else:
+        for job in jobs:
+            _render_histogram(job)
+    if verbose:
+        print("done!")
+    return [job[0] for job in jobs]
+
+
+@traced
 def make_map_vis(geoset: dict, data: pd.DataFrame, path: str, columns: List[str], tracts: bool):
     """Creates an html file containing an interactive choropleth map based on the specified values
     """
@@ -0,0 +1,413 @@
+"""End-to-end benchmarks for the itz pipeline.
+
+usage:
+python3 -m scripts.benchmark [--scales SCALE ...] [--stages STAGE ...] [--repeat N]
+                             [--baseline PATH] [--threshold FRACTION] [--save_baseline]
+                             [--output PATH] [--data_root PATH] [--skip_startup]
+
+Each stage is timed at every scale (best of --repeat runs) and run once more under tracemalloc
+to record its peak memory. Results are compared against the stored baseline, and the script
+exits with status 1 if any stage got slower or bigger than the baseline by more than
+--threshold (0.25 means 25 percent). --save_baseline overwrites the baseline with the current
+results.
+
+Startup is timed too, unless --skip_startup is given: each of STARTUP_COMMANDS is run in a fresh
+interpreter (best of --repeat runs), e.g. importing itz.data or printing the CLI's help, which
+shouldn't import the heavy dependencies that itz.lazy defers.
+
+Everything runs inside a temporary directory, because several stages read or write paths under
+in-the-zone-data/. _get_tract_data and _get_lot_data parse raw ACS and PLUTO files: by default
+these are written by scripts.synthetic_data at each scale, and --data_root points them at a
+directory containing a real in-the-zone-data/ instead. The other stages use in-memory data.
+"""
+
+from contextlib import contextmanager, redirect_stdout
+from typing import Callable, Dict, List, Tuple
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import itz
+from itz.data import CODE_TO_COUNTY, LOT_DATA_YEARS, TRACT_DATA_YEARS
+from scripts import effect_evaluator, synthetic_data
+
+
+# Number of tracts and lots per tract. "nyc" is roughly the size of the real data.
+SCALES = {
+    "small": (100, 20),
+    "medium": (500, 100),
+    "nyc": (2168, 400),
+}
+DEFAULT_SCALES = ("small", "medium")
+DEFAULT_BASELINE_PATH = "benchmark-baseline.json"
+DEFAULT_THRESHOLD = 0.25
+
+# Arguments to a fresh interpreter timed by the startup benchmark, by name. "interpreter" is the
+# interpreter's own startup, for reference. "cli_parse_imports" imports what the parse command
+# uses before it reads any data: itz.data, and itz.greenspace for its coverage and distance
+# paths.
+STARTUP_COMMANDS = {
+    "interpreter": ["-c", "pass"],
+    "import_itz": ["-c", "import itz"],
+    "import_itz_data": ["-c", "import itz.data"],
+    "cli_help": ["-m", "itz", "-h"],
+    "cli_parse_help": ["-m", "itz", "parse", "-h"],
+    "cli_parse_imports": ["-c", "import itz.__main__, itz.data, itz.greenspace"],
+}
+
+TRACT_COLUMNS = (
+    "pop_density",
+    "percent_non_hispanic_or_latino_white_alone",
+    "percent_non_hispanic_black_alone",
+    "percent_hispanic_any_race",
+    "percent_non_hispanic_asian_alone",
+    "median_age",
+    "per_capita_income",
+    "resid_unit_density",
+    "percent_multi_family_units",
+    "percent_occupied_housing_units",
+    "median_gross_rent",
+    "median_home_value",
+    "percent_households_with_people_under_18",
+    "percent_of_households_in_same_house_year_ago",
+    "percent_bachelor_degree_or_higher",
+    "percent_car_commuters",
+    "percent_public_transport_commuters",
+    "percent_public_transport_trips_under_45_min",
+    "percent_car_trips_under_45_min",
+)
+
+
+def _make_tract_ids(num_tracts: int) -> List[str]:
+    """Returns ITZ_GEOIDs spread over the five boroughs, some with decimal suffixes.
+    """
+    boroughs = list(CODE_TO_COUNTY.values())
+    return [boroughs[i % 5] + str(i // 5 + 1) + (".01" if i % 7 == 0 else "")
+            for i in range(num_tracts)]
+
+
+def _make_tract_dfs(tract_ids: List[str], rng: np.random.Generator) -> List[pd.DataFrame]:
+    """Returns one tract DataFrame per TRACT_DATA_YEARS, as _get_tract_data would.
+    """
+    base = rng.lognormal(3, 1, size=(len(tract_ids), len(TRACT_COLUMNS)))
+    tract_dfs = []
+    for _ in TRACT_DATA_YEARS:
+        values = base * rng.normal(1, 0.05, size=base.shape)
+        tract_df = pd.DataFrame(values, index=pd.Index(tract_ids, name="ITZ_GEOID"),
+                                columns=TRACT_COLUMNS)
+        tract_dfs.append(tract_df)
+    return tract_dfs
+
+
+def _make_lot_df(tract_ids: List[str], lots_per_tract: int, rng: np.random.Generator
+        ) -> pd.DataFrame:
+    """Returns a DataFrame in the format produced by _get_lot_data.
+    """
+    num_lots = len(tract_ids) * lots_per_tract
+    lot_df = pd.DataFrame(index=pd.Index(np.arange(num_lots) + 1000000000, name="BBL"))
+    lot_df["ITZ_GEOID"] = np.repeat(tract_ids, lots_per_tract)
+    lot_df["lot_area"] = rng.lognormal(8, 0.7, size=num_lots).round()
+    far = rng.choice([0.0, 0.9, 1.25, 2.0, 2.43, 3.44, 6.02, 10.0], size=num_lots)
+    for year in LOT_DATA_YEARS:
+        # Roughly 5% of lots change their maximum residential FAR between consecutive years.
+        changed = rng.random(num_lots) < 0.05
+        far = np.where(changed, far * rng.choice([0.5, 1.5, 2.0], size=num_lots), far)
+        lot_df["land_use" + year] = rng.choice(["01", "02", "03", "04", "05", "11"], size=num_lots)
+        lot_df["zoning" + year] = rng.choice(["R5", "R6", "C4-4", "M1-1"], size=num_lots)
+        lot_df["max_resid_far" + year] = far.round(2).astype(str)
+        lot_df["mixed_development" + year] = lot_df["land_use" + year] == "04"
+        lot_df["resid_units" + year] = rng.poisson(4, size=num_lots).astype(str)
+    return lot_df
+
+
+def _make_geoset(tract_ids: List[str]) -> dict:
+    """Returns a GeoJSON FeatureCollection with one square polygon per tract.
+    """
+    side = int(np.ceil(np.sqrt(len(tract_ids))))
+    features = []
+    for i, tract_id in enumerate(tract_ids):
+        x, y = -74.2 + 0.01 * (i % side), 40.5 + 0.01 * (i // side)
+        features.append({
+            "type": "Feature",
+            "properties": {"ITZ_GEOID": tract_id},
+            "geometry": {"type": "Polygon", "coordinates": [[
+                [x, y], [x + 0.01, y], [x + 0.01, y + 0.01], [x, y + 0.01], [x, y]]]},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _write_subsidized_properties(tract_ids: List[str], rng: np.random.Generator):
+    """Writes the subsidized properties file read by _get_tract_lot_data.
+    """
+    county_codes = {county: code for code, county in CODE_TO_COUNTY.items()}
+    tracts = []
+    for tract_id in tract_ids:
+        number = tract_id[2:].split(".")
+        suffix = number[1] if len(number) > 1 else "00"
+        tracts.append(int("36" + county_codes[tract_id[:2]] + number[0].zfill(4) + suffix))
+    pd.DataFrame({"tract_10": rng.choice(tracts, size=len(tracts) * 2)}).to_csv(
+        itz.data.SUBSIDIZED_PROPERTIES_PATH, index=False)
+
+
+def _make_inputs(scale: str, seed: int=0) -> Dict:
+    """Generates the inputs shared by all stages at a scale.
+
+    Must be called from inside the benchmark's working directory.
+    """
+    num_tracts, lots_per_tract = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    tract_ids = _make_tract_ids(num_tracts)
+    os.makedirs("in-the-zone-data", exist_ok=True)
+    _write_subsidized_properties(tract_ids, rng)
+    return {
+        "rng": rng,
+        "tract_dfs": _make_tract_dfs(tract_ids, rng),
+        "lot_df": _make_lot_df(tract_ids, lots_per_tract, rng),
+        "geoset": _make_geoset(tract_ids),
+    }
+
+
+def _stage_get_tract_data(ctx: Dict):
+    return itz.data._get_tract_data()
+
+
+def _stage_get_lot_data(ctx: Dict):
+    return itz.data._get_lot_data()
+
+
+def _stage_get_data(ctx: Dict):
+    lot_df, tract_dfs, model_df = itz.get_data(ctx["lot_df"].reset_index(),
+                                               [df.copy() for df in ctx["tract_dfs"]])
+    # Greenspace columns are integrated separately by the parse command.
+    for column in ("orig_feet_distance_from_park", "d_2010_2018_feet_distance_from_park",
+                   "orig_square_meter_greenspace_coverage",
+                   "d_2010_2018_square_meter_greenspace_coverage"):
+        model_df[column] = ctx["rng"].lognormal(5, 1, size=len(model_df))
+    model_df["2002_2010_percent_upzoned"] = model_df["2002_2010_percent_upzoned"].astype(float)
+    return model_df.astype(float)
+
+
+def _stage_get_tract_lot_data(ctx: Dict):
+    lot_df = ctx["lot_df"]
+    tracts_to_lots = {tract: list(lots) for tract, lots
+                      in lot_df.groupby("ITZ_GEOID").groups.items()}
+    return itz.data._get_tract_lot_data(lot_df, tracts_to_lots)
+
+
+def _stage_get_delta_data(ctx: Dict):
+    return itz.data._get_delta_data(ctx["tract_dfs"], ctx["tract_dfs"][0].index)
+
+
+def _stage_get_description(ctx: Dict):
+    return itz.get_description(itz.model.ModelName.LONG_TERM, "2002_2010_percent_upzoned",
+                               ctx["get_data"])
+
+
+def _stage_fit(ctx: Dict):
+    desc, variables = ctx["get_description"]
+    return itz.fit(desc, variables, ctx["get_data"])
+
+
+def _stage_evaluate(ctx: Dict):
+    return itz.evaluate(ctx["fit"])
+
+
+def _stage_effect_evaluator(ctx: Dict):
+    _, inspection = ctx["evaluate"]
+    regression_graph = effect_evaluator.get_regression_graph(inspection)
+    return {y: effect_evaluator.get_total_effect_dfs(regression_graph,
+                                                     itz.data.EARLY_UPZONING, y)[0]
+            for y in itz.data.DEPENDENT_VARS if y in regression_graph}
+
+
+def _stage_make_map_vis(ctx: Dict):
+    data = ctx["get_data"].reset_index()
+    geoset = json.loads(json.dumps(ctx["geoset"]))
+    itz.make_map_vis(geoset, data, "vis.html",
+                     ["ITZ_GEOID", "2002_2010_percent_upzoned", "d_2010_2018_pop_density"], True)
+
+
+# Stages in execution order, with the stages whose output they use.
+STAGES: Tuple[Tuple[str, Callable, Tuple[str, ...]], ...] = (
+    ("_get_tract_data", _stage_get_tract_data, ()),
+    ("_get_lot_data", _stage_get_lot_data, ()),
+    ("_get_tract_lot_data", _stage_get_tract_lot_data, ()),
+    ("_get_delta_data", _stage_get_delta_data, ()),
+    ("get_data", _stage_get_data, ()),
+    ("get_description", _stage_get_description, ("get_data",)),
+    ("fit", _stage_fit, ("get_data", "get_description")),
+    ("evaluate", _stage_evaluate, ("fit",)),
+    ("effect_evaluator", _stage_effect_evaluator, ("evaluate",)),
+    ("make_map_vis", _stage_make_map_vis, ("get_data",)),
+)
+STAGE_NAMES = tuple(name for name, _, _ in STAGES)
+# Stages parsing raw files from in-the-zone-data/.
+RAW_DATA_STAGES = ("_get_tract_data", "_get_lot_data")
+
+
+@contextmanager
+def _working_directory(path: str):
+    """Temporarily changes the working directory.
+    """
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _measure(func: Callable, ctx: Dict, repeat: int) -> Tuple[object, float, float]:
+    """Runs a stage, returning its output, best wall time in seconds, and peak traced memory in
+    megabytes.
+    """
+    times = []
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            output = func(ctx)
+            times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        with redirect_stdout(io.StringIO()):
+            output = func(ctx)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return output, min(times), peak / 2**20
+
+
+def _required_stages(selected: List[str]) -> List[str]:
+    """Returns the selected stages plus every stage they depend on, in execution order.
+    """
+    dependencies = {name: requires for name, _, requires in STAGES}
+    required = set()
+    pending = list(selected)
+    while pending:
+        name = pending.pop()
+        if name not in required:
+            required.add(name)
+            pending.extend(dependencies[name])
+    return [name for name in STAGE_NAMES if name in required]
+
+
+def run_benchmarks(scales: List[str], stages: List[str], repeat: int=3, data_root: str=None,
+        verbose: bool=False) -> Dict[str, Dict[str, float]]:
+    """Runs the benchmark stages at each scale.
+
+    Returns a dictionary mapping "<scale>/<stage>" to its seconds and peak_mb.
+    """
+    results = {}
+    funcs = {name: func for name, func, _ in STAGES}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as working_dir, _working_directory(working_dir):
+            ctx = _make_inputs(scale)
+            required = _required_stages(stages)
+            raw_data_root = data_root
+            if raw_data_root is None and any(name in RAW_DATA_STAGES for name in required):
+                raw_data_root = os.path.join(working_dir, "raw")
+                num_tracts, lots_per_tract = SCALES[scale]
+                synthetic_data.generate_data(raw_data_root, num_tracts,
+                                             num_tracts * lots_per_tract)
+            for name in required:
+                if name in RAW_DATA_STAGES:
+                    with _working_directory(raw_data_root):
+                        output, seconds, peak_mb = _measure(funcs[name], ctx, repeat)
+                elif name in stages:
+                    output, seconds, peak_mb = _measure(funcs[name], ctx, repeat)
+                else:
+                    with redirect_stdout(io.StringIO()):
+                        ctx[name] = funcs[name](ctx)
+                    continue
+                ctx[name] = output
+                results[f"{scale}/{name}"] = {"seconds": seconds, "peak_mb": peak_mb}
+                if verbose:
+                    print(f"{scale}/{name}: {seconds:.3f}s, {peak_mb:.1f}MB")
+    return results
+
+
+def run_startup_benchmarks(repeat: int=3, verbose: bool=False) -> Dict[str, Dict[str, float]]:
+    """Times each of STARTUP_COMMANDS in a fresh interpreter from the repository's root.
+
+    Returns a dictionary mapping "startup/<command>" to its seconds.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for name, args in STARTUP_COMMANDS.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], cwd=root, check=True,
+                           stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        results[f"startup/{name}"] = {"seconds": min(times)}
+        if verbose:
+            print(f"startup/{name}: {min(times):.3f}s")
+    return results
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]],
+        baseline: Dict[str, Dict[str, float]], threshold: float=DEFAULT_THRESHOLD
+        ) -> List[str]:
+    """Returns a description of every measurement exceeding its baseline by more than the
+    threshold fraction.
+    """
+    regressions = []
+    for key, measurements in results.items():
+        if key not in baseline:
+            continue
+        for metric, value in measurements.items():
+            reference = baseline[key].get(metric)
+            if reference is not None and value > reference * (1 + threshold):
+                regressions.append(f"{key} {metric}: {value:.3f} vs. baseline {reference:.3f} "
+                                   f"(+{100 * (value / reference - 1):.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("--scales", nargs="+", choices=SCALES, default=list(DEFAULT_SCALES))
+    parser.add_argument("--stages", nargs="+", choices=STAGE_NAMES, default=list(STAGE_NAMES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--save_baseline", action="store_true")
+    parser.add_argument("--output", required=False)
+    parser.add_argument("--data_root", required=False)
+    parser.add_argument("--skip_startup", action="store_true")
+    args = parser.parse_args()
+
+    data_root = os.path.abspath(args.data_root) if args.data_root else None
+    results = {} if args.skip_startup else run_startup_benchmarks(args.repeat, verbose=True)
+    results.update(run_benchmarks(args.scales, args.stages, args.repeat, data_root, verbose=True))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    try:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save_baseline to create one.")
+        sys.exit(0)
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    for regression in regressions:
+        print("REGRESSION:", regression)
+    if not regressions:
+        print(f"No regressions beyond {round(100 * args.threshold)}% of the baseline.")
+    sys.exit(1 if regressions else 0)
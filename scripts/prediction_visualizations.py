@@ -1,5 +1,5 @@
 """Usage:
-python3 scripts/prediction_visualizations.py <model_path> <data_path> <x> <y> <output_path> [--full_model] [--include_endogenous] [--all]
+python3 scripts/prediction_visualizations.py <model_path> <data_path> <x> <y> <output_path> [--full_model] [--include_endogenous] [--sweep] [--all]
 
 --full_model creates a regression plot of model predictions considering the entire
 model. Not including this flag creates a graph considering only the effect of the 
@@ -8,6 +8,9 @@ explanatory variable on the response variable.
 if --full_model is specified, --include_endogenous can also be specified in order to
 set the values of endogenous variables to known in the model's predictions.
 
+--sweep plots the predicted change in y as x is set to values across its range in every
+tract, using the model's reduced form rather than a prediction per value.
+
 --all does all of the script's functionality.
 """
 
@@ -156,6 +159,32 @@ def make_model_regression_graph(data, x, y, output_path):
     plt.clf()
 
 
+def make_scenario_sweep(model, x, y, output_path, steps=101):
+    """Plots the mean and 10th-90th percentile change in y across tracts as x is set to steps
+    values across its range, and writes the mean changes in every outcome to a CSV.
+    """
+    model_data = pd.DataFrame(model.mx_data, columns=model.vars["observed"])
+    effects = itz.model.counterfactual_effects(model, [x])
+    scenarios = pd.DataFrame({x: np.linspace(model_data[x].min(), model_data[x].max(), steps)})
+    deltas = itz.model.predict_counterfactuals(effects, scenarios, model_data)
+
+    sweep = pd.DataFrame(deltas.mean(axis=1), index=scenarios[x], columns=effects.index)
+    sweep.to_csv(os.path.join(output_path, "scenario_sweep.csv"))
+
+    y_deltas = deltas[:, :, effects.index.get_loc(y)]
+    plt.subplots(figsize=(18, 10))
+    plt.fill_between(scenarios[x], np.percentile(y_deltas, 10, axis=1),
+                     np.percentile(y_deltas, 90, axis=1), alpha=0.3,
+                     label="10th-90th percentile of tracts")
+    plt.plot(scenarios[x], sweep[y], color="black", label="Mean change")
+    plt.xlabel(f"{x} set to")
+    plt.ylabel(f"Predicted change in {y}")
+    plt.title(f"Predicted change in {y} as {x} varies")
+    plt.legend()
+    plt.savefig(os.path.join(output_path, "scenario sweep.pdf"), format="pdf")
+    plt.clf()
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -166,6 +195,7 @@ if __name__ == "__main__":
     parser.add_argument("output_path")
     parser.add_argument("--full_model", action="store_true")
     parser.add_argument("--include_endogenous", action="store_true")
+    parser.add_argument("--sweep", action="store_true")
     parser.add_argument("--all", action="store_true")
     args = parser.parse_args()
 
@@ -194,7 +224,10 @@ if __name__ == "__main__":
         make_model_evaluation_graph(data, model, args.x, args.y, args.output_path, True)
         make_model_evaluation_graph(data, model, args.x, args.y, args.output_path, False)
         make_model_regression_graph(data, model, args.x, args.y, args.output_path)
+        make_scenario_sweep(model, args.x, args.y, args.output_path)
 
+    elif args.sweep:
+        make_scenario_sweep(model, args.x, args.y, args.output_path)
     elif args.full_model:
         make_model_evaluation_graph(data, model, args.x, args.y, args.output_path, args.include_endogenous)
     else:
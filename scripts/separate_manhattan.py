@@ -41,15 +41,9 @@ do_regression(non_manhattan, "non_MN", itz.util.Transformations.identity, itz.ut
 
 data.set_index("ITZ_GEOID", inplace=True)
 
-for index, row in data.iterrows():
-    if index[:2] == "MN":
-        data.loc[index, "2002_2010_percent_upzoned_manhattan"] = data.loc[index, "2002_2010_percent_upzoned"]
-        data.loc[index, "2002_2010_percent_upzoned_non_manhattan"] = None
-    else:
-        data.loc[index, "2002_2010_percent_upzoned_manhattan"] = None
-        data.loc[index, "2002_2010_percent_upzoned_non_manhattan"] = data.loc[index, "2002_2010_percent_upzoned"]
-        if index == "SI17":
-            print(data.loc[index, ["2002_2010_percent_upzoned_manhattan", "2002_2010_percent_upzoned_non_manhattan"]], "yees")
+in_manhattan = data.index.str[:2] == "MN"
+data["2002_2010_percent_upzoned_manhattan"] = data["2002_2010_percent_upzoned"].where(in_manhattan)
+data["2002_2010_percent_upzoned_non_manhattan"] = data["2002_2010_percent_upzoned"].where(~in_manhattan)
 
 print(data[["2002_2010_percent_upzoned_manhattan", "2002_2010_percent_upzoned_non_manhattan"]])
 
@@ -1,9 +1,9 @@
 from typing import Dict
-import itertools
+import sys
 
 import pandas as pd
+import semopy
 
-from itz.data import CONTROL_VARS, DEPENDENT_VARS, DENSIFICATION_MEASURES
 import itz
 
 
@@ -14,19 +14,25 @@ def _print_stats(dict_: Dict[str, float]):
         print(f"{key}: {round(val, 3)}")
 
 
-def do_stepwise_regression():
-
+def do_stepwise_regression(output_path="stepwise_model_description.txt", criterion="BIC"):
+    """Searches for a specification starting from the long term model, writing the final
+    description to output_path and the search's trajectory beside it.
+    """
     data = pd.read_csv("in-the-zone-data/extra-updated-itz-data.csv")
+    model_type = itz.model.MODEL_TYPE_UPZONED_VARS["UNIFIED"]
+    data = data[~data[model_type].isna()]
+
+    desc, _ = itz.get_description(itz.model.ModelName.LONG_TERM, model_type, data, verbose=True)
+    trajectory, desc = itz.model.search_specification(desc, data, criterion=criterion,
+                                                      output_path=output_path, verbose=True)
+    trajectory.to_csv(output_path.rsplit(".", 1)[0] + "_trajectory.csv", index=False)
+    print(trajectory)
 
-    # covariances = []
-    # for var1, var2 in itertools.combinations(CONTROL_VARS):
-    #     covariances.append((var1, var2))
-    #     desc = itz.get_description(itz.model.ModelName.LONG_TERM, covariances, control_regressions)
-    desc, variables = itz.get_description(itz.model.ModelName.LONG_TERM, verbose=True)
+    variables = set(semopy.Model(desc).vars["observed"])
     model = itz.fit(desc, variables, data, verbose=True)
     model_stats, inspection = itz.evaluate(model)
     _print_stats(model_stats)
     print(inspection)
 
 if __name__ == "__main__":
-    do_stepwise_regression()
\ No newline at end of file
+    do_stepwise_regression(*sys.argv[1:])
@@ -0,0 +1,548 @@
+"""Generates synthetic raw data in the layout itz.data expects under in-the-zone-data/.
+
+usage:
+python3 -m scripts.synthetic_data <root> [--scale SCALE] [--tracts N] [--lots N] [--seed SEED]
+                                  [--upzoning_rate RATE] [--missing_rate RATE] [-v]
+
+Writes <root>/in-the-zone-data/ containing:
+- zoning-data/mergedPLUTO-<year>.csv for every LOT_DATA_YEARS year, plus mergedPLUTO-2012.txt
+  with the CT2010 column used to place 2002 lots in 2010 tracts.
+- acs/nyc-<demographic|economic|housing|social|transportation>-data-<year>.csv for every
+  TRACT_DATA_YEARS year, with the label row under the header, and the matching
+  code-to-column-<kind>-data-<year>.txt dictionaries.
+- ny_2010_census_tracts.json, a GeoJSON FeatureCollection of rectangular tracts.
+- subsidized_properties.csv, greenspace-orthoimagery/ and greenspace-distance/.
+
+--scale multiplies the size of New York City (2168 tracts, 857,000 lots); --tracts and --lots
+override it. Column names, value formats and missing-value codes ("(X)", "-", "**", "N", and
+top codes such as "2,000+") follow the real files year by year, so the output can be parsed with
+python3 -m itz parse when run from <root>.
+
+Upzoning is generated as tract-level rezonings: a share of tracts is rezoned in each period, and
+a share of lots in a rezoned tract moves to a denser zoning district. Rezonings are more common
+in 2002-2010 than afterwards, as in the real data. --upzoning_rate scales the rezoning
+probabilities.
+"""
+
+from typing import Dict, List, Tuple
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from itz.data import CODE_TO_COUNTY, LOT_DATA_YEARS, TRACT_DATA_YEARS
+from itz.spatial import to_state_plane
+
+
+NYC_TRACTS = 2168
+NYC_LOTS = 857000
+
+# Share of tracts and bounding box (min lon, min lat, max lon, max lat) of each borough.
+BOROUGHS = {
+    "MN": (0.133, (-74.03, 40.70, -73.93, 40.88)),
+    "BX": (0.156, (-73.93, 40.80, -73.75, 40.92)),
+    "BK": (0.351, (-74.05, 40.57, -73.85, 40.70)),
+    "QN": (0.309, (-73.85, 40.54, -73.70, 40.80)),
+    "SI": (0.051, (-74.26, 40.49, -74.05, 40.65)),
+}
+BOROUGH_DIGITS = {"MN": "1", "BX": "2", "BK": "3", "QN": "4", "SI": "5"}
+COUNTY_CODES = {county: code for code, county in CODE_TO_COUNTY.items()}
+
+# Zoning districts ordered by maximum residential FAR. Commercial and manufacturing districts
+# are mapped onto the closest residential equivalent.
+ZONING_DISTRICTS = (
+    ("M1-1", 0.0), ("R1-2", 0.5), ("R2", 0.5), ("R3-2", 0.6), ("R4", 0.9), ("R5", 1.25),
+    ("R6", 2.43), ("C4-4", 3.44), ("R7-1", 3.44), ("R8", 6.02), ("R9", 7.52), ("R10", 10.0),
+)
+# Probability that a tract is rezoned, and the mean share of its lots that are upzoned.
+REZONING_RATES = {
+    ("2002", "2010"): (0.30, 0.35),
+    ("2010", "2014"): (0.12, 0.25),
+    ("2014", "2018"): (0.10, 0.25),
+}
+
+# Column names of each PLUTO release.
+PLUTO_COLUMNS = {
+    "2002": {"bbl": "BBL", "borough": "Borough", "lot_area": "LotArea", "land_use": "LandUse",
+             "zoning": "ZoneDist1", "far": "MaxAllwFAR", "units": "UnitsRes", "tract": "CT2000",
+             "x": "XCoord", "y": "YCoord"},
+    "2010": {"bbl": "BBL", "borough": "Borough", "lot_area": "LotArea", "land_use": "LandUse",
+             "zoning": "ZoneDist1", "far": "ResidFAR", "units": "UnitsRes", "tract": "CT2010",
+             "x": "XCoord", "y": "YCoord"},
+    "2014": {"bbl": "BBL", "borough": "Borough", "lot_area": "LotArea", "land_use": "LandUse",
+             "zoning": "ZoneDist1", "far": "ResidFAR", "units": "UnitsRes", "tract": "CT2010",
+             "x": "XCoord", "y": "YCoord"},
+    "2018": {"bbl": "bbl", "borough": "borough", "lot_area": "lotarea", "land_use": "landuse",
+             "zoning": "zonedist1", "far": "residfar", "units": "unitsres", "tract": "ct2010",
+             "x": "xcoord", "y": "ycoord"},
+}
+
+ACS_TABLES = {
+    "demographic": "DP05",
+    "economic": "DP03",
+    "housing": "DP04",
+    "social": "DP02",
+    "transportation": "S0802",
+}
+# Missing-value codes appearing in each ACS table (all of them are in itz.data's na_values).
+ACS_MISSING_CODES = {
+    "demographic": ["(X)", "-", "**"],
+    "economic": ["(X)", "-", "**", "N"],
+    "housing": ["(X)", "-", "**"],
+    "social": ["(X)", "-", "**"],
+    "transportation": ["(X)", "-", "**", "N"],
+}
+TRAVEL_TIMES = ("Less than 10 minutes", "10 to 14 minutes", "15 to 19 minutes",
+                "20 to 24 minutes", "25 to 29 minutes", "30 to 34 minutes", "35 to 44 minutes")
+COMMUTE_MODES = ("Car, truck, or van -- drove alone", "Car, truck, or van -- carpooled",
+                 "Public transportation (excluding taxicab)")
+
+
+def _make_tracts(num_tracts: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Lays out rectangular tracts on a grid inside each borough's bounding box.
+    """
+    shares = np.array([share for share, _ in BOROUGHS.values()])
+    counts = np.maximum(1, np.round(shares / shares.sum() * num_tracts)).astype(int)
+    counts[np.argmax(counts)] += num_tracts - counts.sum()
+
+    frames = []
+    for (borough, (_, (min_lon, min_lat, max_lon, max_lat))), count in zip(BOROUGHS.items(),
+                                                                           counts):
+        columns = int(math.ceil(math.sqrt(count * (max_lon - min_lon) / (max_lat - min_lat))))
+        rows = int(math.ceil(count / columns))
+        i = np.arange(count)
+        width, height = (max_lon - min_lon) / columns, (max_lat - min_lat) / rows
+        # Every ninth tract number is split in two, like "123.01" and "123.02".
+        names, tract_codes = [], []
+        base = 1
+        while len(names) < count:
+            if base % 9 == 1 and count - len(names) > 1:
+                names += [f"{base}.01", f"{base}.02"]
+                tract_codes += [f"{base:04d}01", f"{base:04d}02"]
+            else:
+                names.append(str(base))
+                tract_codes.append(f"{base:04d}00")
+            base += 2
+        frame = pd.DataFrame({
+            "borough": borough,
+            "county": COUNTY_CODES[borough],
+            "name": names,
+            "tract_code": tract_codes,
+            "min_lon": min_lon + width * (i % columns),
+            "min_lat": min_lat + height * (i // columns),
+        })
+        frame["max_lon"] = frame["min_lon"] + width
+        frame["max_lat"] = frame["min_lat"] + height
+        frames.append(frame)
+    tracts = pd.concat(frames, ignore_index=True)
+    tracts["ITZ_GEOID"] = tracts["borough"] + tracts["name"]
+    tracts["GEOID10"] = "36" + tracts["county"] + tracts["tract_code"]
+    mid_lat = np.radians((tracts["min_lat"] + tracts["max_lat"]) / 2)
+    tracts["area"] = ((tracts["max_lon"] - tracts["min_lon"]) * 111320 * np.cos(mid_lat)
+                      * (tracts["max_lat"] - tracts["min_lat"]) * 110540).round()
+    # Density class drives the zoning, built form and demographics of each tract.
+    borough_density = tracts["borough"].map({"MN": 9, "BX": 7, "BK": 7, "QN": 5, "SI": 3})
+    tracts["density_class"] = np.clip(
+        np.round(borough_density + rng.normal(0, 1.5, len(tracts))), 1,
+        len(ZONING_DISTRICTS) - 1).astype(int)
+    return tracts
+
+
+def _make_lots(tracts: pd.DataFrame, num_lots: int, upzoning_rate: float,
+        rng: np.random.Generator) -> pd.DataFrame:
+    """Generates lots with their zoning district index for every LOT_DATA_YEARS year.
+    """
+    # Denser tracts have more, smaller lots.
+    weights = rng.lognormal(0, 0.4, len(tracts)) * (12 - tracts["density_class"].to_numpy())
+    lots_per_tract = rng.multinomial(num_lots, weights / weights.sum())
+    tract_index = np.repeat(np.arange(len(tracts)), lots_per_tract)
+    lots = pd.DataFrame({"tract": tract_index})
+
+    borough = tracts["borough"].to_numpy()[tract_index]
+    lots["borough"] = borough
+    within_borough = lots.groupby("borough").cumcount().to_numpy()
+    lots["BBL"] = (pd.Series(borough).map(BOROUGH_DIGITS).to_numpy().astype(object)
+                   + pd.Series(within_borough // 40 + 1).astype(str).str.zfill(5).to_numpy()
+                   + pd.Series(within_borough % 40 + 1).astype(str).str.zfill(4).to_numpy())
+    lots["lot_area"] = np.round(rng.lognormal(7.8, 0.6, len(lots))
+                                * (1 + (12 - tracts["density_class"].to_numpy()[tract_index])
+                                   / 12))
+
+    lon = (tracts["min_lon"].to_numpy()[tract_index] + rng.random(len(lots))
+           * (tracts["max_lon"] - tracts["min_lon"]).to_numpy()[tract_index])
+    lat = (tracts["min_lat"].to_numpy()[tract_index] + rng.random(len(lots))
+           * (tracts["max_lat"] - tracts["min_lat"]).to_numpy()[tract_index])
+    lots["x"], lots["y"] = to_state_plane(lon, lat)
+
+    district = np.clip(tracts["density_class"].to_numpy()[tract_index]
+                       + rng.integers(-1, 2, len(lots)), 0, len(ZONING_DISTRICTS) - 1)
+    lots["district" + LOT_DATA_YEARS[0]] = district
+    for start, end in zip(LOT_DATA_YEARS[:-1], LOT_DATA_YEARS[1:]):
+        tract_probability, lot_share = REZONING_RATES[(start, end)]
+        rezoned = rng.random(len(tracts)) < min(1.0, tract_probability * upzoning_rate)
+        share = np.where(rezoned, rng.beta(2, 2 / lot_share - 2, len(tracts)), 0)
+        upzoned = rng.random(len(lots)) < share[tract_index]
+        # A few lots in rezoned tracts are downzoned instead.
+        downzoned = ~upzoned & (rng.random(len(lots)) < share[tract_index] / 10)
+        district = np.clip(district + upzoned * rng.integers(1, 4, len(lots)) - downzoned, 0,
+                           len(ZONING_DISTRICTS) - 1)
+        lots["district" + end] = district
+    return lots
+
+
+def _land_use(district: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Draws PLUTO land use codes (1-2 family, walk-up, elevator, mixed, ... ) for lots.
+    """
+    far = np.array([far for _, far in ZONING_DISTRICTS])[district]
+    land_use = np.where(far < 1, 1, np.where(far < 3, 2, 3))
+    other = rng.random(len(district))
+    land_use = np.where(other < 0.08, 4, land_use)
+    land_use = np.where((other >= 0.08) & (other < 0.2), rng.integers(5, 12, len(district)),
+                        land_use)
+    return np.where(far == 0, rng.choice([6, 7, 10], len(district)), land_use)
+
+
+def _write_pluto(lots: pd.DataFrame, tracts: pd.DataFrame, missing_rate: float, root: str,
+        rng: np.random.Generator):
+    """Writes one PLUTO file per lot data year, plus the 2012 file holding CT2010.
+    """
+    districts = np.array([name for name, _ in ZONING_DISTRICTS])
+    fars = np.array([far for _, far in ZONING_DISTRICTS])
+    tract_names = tracts["name"].to_numpy()[lots["tract"].to_numpy()]
+    units_per_use = np.array([0, 1.5, 8, 60, 20, 0, 0, 0, 0, 0, 0, 0])
+
+    units = None
+    for year in LOT_DATA_YEARS:
+        names = PLUTO_COLUMNS[year]
+        district = lots["district" + year].to_numpy()
+        land_use = _land_use(district, rng)
+        # Residential units grow on lots whose allowed FAR grew.
+        capacity = units_per_use[land_use] * (1 + fars[district]) / 2
+        year_units = np.round(capacity * rng.lognormal(0, 0.3, len(lots)))
+        units = year_units if units is None else np.maximum(units, year_units)
+
+        pluto = pd.DataFrame({
+            names["bbl"]: lots["BBL"],
+            names["borough"]: lots["borough"],
+            names["lot_area"]: lots["lot_area"].astype(int),
+            names["land_use"]: (pd.Series(land_use).astype(str).str.zfill(2) if year != "2018"
+                                else pd.Series(land_use).astype(str)),
+            names["zoning"]: districts[district],
+            names["far"]: fars[district],
+            names["units"]: units.astype(int),
+            names["tract"]: pd.Series(tract_names).str.rjust(7),
+            names["x"]: lots["x"].round(),
+            names["y"]: lots["y"].round(),
+        })
+        # Blank out some fields the way PLUTO does, including tracts that leave only the borough
+        # as an ITZ_GEOID.
+        for column in (names["land_use"], names["units"], names["tract"], names["x"],
+                       names["y"]):
+            pluto[column] = pluto[column].astype(object)
+            pluto.loc[rng.random(len(pluto)) < missing_rate, column] = ""
+        if year != LOT_DATA_YEARS[0]:
+            # Lots are merged or renumbered over time.
+            pluto = pluto[rng.random(len(pluto)) >= missing_rate / 2]
+        pluto.to_csv(os.path.join(root, "zoning-data", f"mergedPLUTO-{year}.csv"), index=False)
+        if year == "2010":
+            # The 2012 release is only read for its CT2010 column.
+            pluto.to_csv(os.path.join(root, "zoning-data", "mergedPLUTO-2012.txt"), index=False)
+
+
+def _acs_labels(kind: str, year: str) -> List[str]:
+    """Returns the ACS labels itz.data reads from a table in a given year.
+    """
+    if kind == "demographic":
+        if year == "2010":
+            return ["Estimate!!SEX AND AGE!!Total population",
+                    "Percent!!RACE!!One race!!White",
+                    "Percent!!RACE!!One race!!Black or African American",
+                    "Percent!!HISPANIC OR LATINO AND RACE!!Hispanic or Latino (of any race)",
+                    "Percent!!RACE!!One race!!Asian",
+                    "Estimate!!SEX AND AGE!!Median age (years)"]
+        if year == "2018":
+            return ["Estimate!!SEX AND AGE!!Total population",
+                    "Percent Estimate!!RACE!!Total population!!One race!!White",
+                    "Percent Estimate!!RACE!!Total population!!One race!!Black or African American",
+                    "Percent Estimate!!HISPANIC OR LATINO AND RACE!!Total population!!Hispanic or Latino (of any race)",
+                    "Percent Estimate!!RACE!!Total population!!One race!!Asian",
+                    "Estimate!!SEX AND AGE!!Total population!!Median age (years)"]
+        return ["Estimate!!SEX AND AGE!!Total population",
+                "Percent!!HISPANIC OR LATINO AND RACE!!Total population!!Not Hispanic or Latino!!White alone",
+                "Percent!!HISPANIC OR LATINO AND RACE!!Total population!!Not Hispanic or Latino!!Black or African American alone",
+                "Percent!!HISPANIC OR LATINO AND RACE!!Total population!!Hispanic or Latino (of any race)",
+                "Percent!!HISPANIC OR LATINO AND RACE!!Total population!!Not Hispanic or Latino!!Asian alone",
+                "Estimate!!SEX AND AGE!!Median age (years)"]
+    if kind == "economic":
+        return ["Estimate!!INCOME AND BENEFITS (IN " + year
+                + " INFLATION-ADJUSTED DOLLARS)!!Per capita income (dollars)"]
+    if kind == "housing":
+        if year == "2010":
+            return ["Estimate!!HOUSING OCCUPANCY!!Total housing units",
+                    "Percent!!UNITS IN STRUCTURE!!1-unit, detached",
+                    "Percent!!UNITS IN STRUCTURE!!1-unit, attached",
+                    "Percent!!HOUSING OCCUPANCY!!Occupied housing units",
+                    "Estimate!!GROSS RENT!!Median (dollars)",
+                    "Estimate!!VALUE!!Median (dollars)"]
+        prefix = "Percent Estimate" if year == "2018" else "Percent"
+        return ["Estimate!!HOUSING OCCUPANCY!!Total housing units",
+                prefix + "!!UNITS IN STRUCTURE!!Total housing units!!1-unit, detached",
+                prefix + "!!UNITS IN STRUCTURE!!Total housing units!!1-unit, attached",
+                prefix + "!!HOUSING OCCUPANCY!!Total housing units!!Occupied housing units",
+                "Estimate!!GROSS RENT!!Occupied units paying rent!!Median (dollars)",
+                "Estimate!!VALUE!!Owner-occupied units!!Median (dollars)"]
+    if kind == "social":
+        if year == "2010":
+            return ["Percent!!HOUSEHOLDS BY TYPE!!Households with one or more people under 18 years",
+                    "Percent!!RESIDENCE 1 YEAR AGO!!Same house",
+                    "Percent!!EDUCATIONAL ATTAINMENT!!Percent bachelor's degree or higher"]
+        if year == "2018":
+            return ["Percent Estimate!!HOUSEHOLDS BY TYPE!!Total households!!Households with one or more people under 18 years",
+                    "Percent Estimate!!RESIDENCE 1 YEAR AGO!!Population 1 year and over!!Same house",
+                    "Percent Estimate!!EDUCATIONAL ATTAINMENT!!Population 25 years and over!!Bachelor's degree or higher"]
+        return ["Percent!!HOUSEHOLDS BY TYPE!!Households with one or more people under 18 years",
+                "Percent!!RESIDENCE 1 YEAR AGO!!Population 1 year and over!!Same house",
+                "Percent!!EDUCATIONAL ATTAINMENT!!Percent bachelor's degree or higher"]
+    travel_prefix = ("Workers 16 years and over who did not work at home!!" if year == "2018"
+                     else "")
+    labels = ["Estimate!!Total!!Workers 16 years and over"]
+    labels += [f"Estimate!!{mode}!!Workers 16 years and over" for mode in COMMUTE_MODES]
+    labels += [f"Estimate!!{mode}!!{travel_prefix}TRAVEL TIME TO WORK!!{travel_time}"
+               for mode in COMMUTE_MODES for travel_time in TRAVEL_TIMES]
+    return labels
+
+
+def _tract_year_values(tracts: pd.DataFrame, lots: pd.DataFrame, rng: np.random.Generator
+        ) -> Dict[str, pd.DataFrame]:
+    """Simulates the underlying tract characteristics for each tract data year.
+
+    Tracts with more upzoned lots gain more population and housing, and gentrify faster.
+    """
+    tract_index = lots["tract"].to_numpy()
+    num_lots = np.maximum(np.bincount(tract_index, minlength=len(tracts)), 1)
+    upzoned = (lots["district" + LOT_DATA_YEARS[-1]] > lots["district" + LOT_DATA_YEARS[0]])
+    percent_upzoned = np.bincount(tract_index, weights=upzoned, minlength=len(tracts)) / num_lots
+
+    density = tracts["density_class"].to_numpy() / 10
+    area_sqkm = tracts["area"].to_numpy() / 1e6
+    race = rng.dirichlet([2, 1.5, 1.5, 1], len(tracts)) * 100
+    income = rng.lognormal(10.2, 0.45, len(tracts)) * (0.7 + 0.6 * density)
+    population = np.maximum(rng.lognormal(8.2, 0.4, len(tracts)), 100) * np.maximum(
+        area_sqkm, 0.05) * (0.5 + density)
+
+    values = {}
+    for step, year in enumerate(TRACT_DATA_YEARS):
+        growth = (1 + (0.01 + 0.2 * percent_upzoned) * step) * rng.normal(1, 0.03, len(tracts))
+        gentrification = 1 + (0.03 + 0.15 * percent_upzoned) * step
+        year_income = income * gentrification * rng.normal(1, 0.05, len(tracts))
+        year_race = race + np.array([4, -2, -1, 2]) * step * percent_upzoned[:, None] * 10
+        year_race = np.clip(year_race + rng.normal(0, 1, year_race.shape), 0, 100)
+        workers = population * growth * rng.uniform(0.4, 0.55, len(tracts))
+        modes = rng.dirichlet([2, 0.5, 4], len(tracts)) * (1 - 0.1 * density[:, None])
+        values[year] = pd.DataFrame({
+            "population": population * growth,
+            "white": year_race[:, 0],
+            "black": year_race[:, 1],
+            "hispanic": year_race[:, 2],
+            "asian": year_race[:, 3],
+            "median_age": rng.normal(37, 5, len(tracts)) + step,
+            "income": year_income,
+            "housing_units": population * growth / rng.uniform(2.2, 2.9, len(tracts)),
+            "detached": np.clip(60 * (1 - density) + rng.normal(0, 5, len(tracts)), 0, 95),
+            "attached": np.clip(25 * (1 - density) + rng.normal(0, 5, len(tracts)), 0, 50),
+            "occupied": np.clip(rng.normal(92, 4, len(tracts)), 40, 100),
+            "rent": 400 + 0.025 * year_income + rng.normal(0, 80, len(tracts)),
+            "home_value": 12 * year_income + rng.normal(0, 40000, len(tracts)),
+            "under_18": np.clip(rng.normal(32, 8, len(tracts)) - 10 * density, 2, 70),
+            "same_house": np.clip(rng.normal(88, 4, len(tracts)) - 5 * percent_upzoned, 50, 100),
+            "bachelor": np.clip(year_income / 1000 + rng.normal(0, 5, len(tracts)), 1, 95),
+            "workers": workers,
+            "drove_alone": workers * modes[:, 0],
+            "carpooled": workers * modes[:, 1],
+            "public_transit": workers * modes[:, 2],
+        })
+    return values
+
+
+def _acs_column(kind: str, label: str, values: pd.DataFrame, rng: np.random.Generator
+        ) -> Tuple[np.ndarray, List[str]]:
+    """Returns the values of one ACS column and the top codes that can replace them.
+    """
+    if "Total population" in label and "Median age" not in label and label.startswith("Estimate"):
+        return values["population"].round(), []
+    if "Median age" in label:
+        return values["median_age"].round(1), []
+    if "Per capita income" in label:
+        return values["income"].round(), []
+    if kind == "demographic":
+        for key, group in (("White", "white"), ("Black", "black"), ("Hispanic or Latino (of any",
+                           "hispanic"), ("Asian", "asian")):
+            if key in label:
+                return values[group].round(1), []
+    if label.endswith("Total housing units"):
+        return values["housing_units"].round(), []
+    if "1-unit, detached" in label:
+        return values["detached"].round(1), []
+    if "1-unit, attached" in label:
+        return values["attached"].round(1), []
+    if label.endswith("Occupied housing units"):
+        return values["occupied"].round(1), []
+    if "GROSS RENT" in label:
+        return values["rent"].round(), ["2,000+", "3,500+"]
+    if "VALUE" in label:
+        return values["home_value"].round(-2), ["1,000,000+", "2,000,000+"]
+    if "under 18" in label:
+        return values["under_18"].round(1), []
+    if "Same house" in label:
+        return values["same_house"].round(1), []
+    if "bachelor" in label.lower():
+        return values["bachelor"].round(1), []
+    if label == "Estimate!!Total!!Workers 16 years and over":
+        return values["workers"].round(), []
+    if "TRAVEL TIME TO WORK" in label:
+        return np.round(rng.uniform(2, 20, len(values)), 1), []
+    for mode, column in zip(COMMUTE_MODES, ("drove_alone", "carpooled", "public_transit")):
+        if mode in label:
+            return values[column].round(), []
+    raise ValueError(f"No generator for ACS label {label}")
+
+
+def _write_acs(tracts: pd.DataFrame, lots: pd.DataFrame, missing_rate: float, root: str,
+        rng: np.random.Generator):
+    """Writes the five ACS tables and their code-to-column dictionaries for every year.
+    """
+    geo_ids = "1400000US" + tracts["GEOID10"]
+    county_names = tracts["county"].map({"005": "Bronx", "047": "Kings", "061": "New York",
+                                         "081": "Queens", "085": "Richmond"})
+    names = "Census Tract " + tracts["name"] + ", " + county_names + " County, New York"
+    tract_values = _tract_year_values(tracts, lots, rng)
+
+    for year in TRACT_DATA_YEARS:
+        for kind, table in ACS_TABLES.items():
+            table_data = {"GEO_ID": geo_ids, "NAME": names}
+            label_row = {"GEO_ID": "id", "NAME": "Geographic Area Name"}
+            code_to_column = {}
+            for i, label in enumerate(_acs_labels(kind, year), 1):
+                if table == "S0802":
+                    code = f"S0802_C0{1 + i % 4}_{i:03d}E"
+                else:
+                    code = f"{table}_{i:04d}{'PE' if label.startswith('Percent') else 'E'}"
+                column, top_codes = _acs_column(kind, label, tract_values[year], rng)
+                column = pd.Series(np.asarray(column)).astype(str).astype(object)
+                # Suppressed and top-coded estimates.
+                missing = rng.random(len(column)) < missing_rate
+                column[missing] = rng.choice(ACS_MISSING_CODES[kind], missing.sum())
+                if top_codes:
+                    top_coded = rng.random(len(column)) < missing_rate
+                    column[top_coded] = rng.choice(top_codes, top_coded.sum())
+                table_data[code] = column.to_numpy()
+                label_row[code] = label
+                code_to_column[label] = code
+            acs = pd.concat([pd.DataFrame([label_row]), pd.DataFrame(table_data)],
+                            ignore_index=True)
+            acs.to_csv(os.path.join(root, "acs", f"nyc-{kind}-data-{year}.csv"), index=False)
+            with open(os.path.join(root, "acs", f"code-to-column-{kind}-data-{year}.txt"),
+                      "w") as f:
+                f.write(repr(code_to_column))
+
+
+def _write_geodata(tracts: pd.DataFrame, root: str):
+    """Writes the census tract GeoJSON.
+    """
+    features = []
+    for tract in tracts.itertuples():
+        ring = [[tract.min_lon, tract.min_lat], [tract.max_lon, tract.min_lat],
+                [tract.max_lon, tract.max_lat], [tract.min_lon, tract.max_lat],
+                [tract.min_lon, tract.min_lat]]
+        features.append({
+            "type": "Feature",
+            "properties": {
+                "STATEFP10": "36",
+                "COUNTYFP10": tract.county,
+                "TRACTCE10": tract.tract_code,
+                "GEOID10": tract.GEOID10,
+                "NAME10": tract.name,
+                "ALAND10": int(tract.area),
+                "AWATER10": 0,
+                "ITZ_GEOID": tract.ITZ_GEOID,
+            },
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+        })
+    with open(os.path.join(root, "ny_2010_census_tracts.json"), "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def _write_tract_extras(tracts: pd.DataFrame, lots: pd.DataFrame, root: str,
+        rng: np.random.Generator):
+    """Writes subsidized properties and the precomputed greenspace files.
+    """
+    subsidized = lots.sample(frac=0.01, random_state=int(rng.integers(2**31)))
+    pd.DataFrame({
+        "bbl": subsidized["BBL"].to_numpy(),
+        "borough": subsidized["borough"].to_numpy(),
+        "tract_10": tracts["GEOID10"].to_numpy()[subsidized["tract"].to_numpy()].astype(np.int64),
+    }).to_csv(os.path.join(root, "subsidized_properties.csv"), index=False)
+
+    greenspace = tracts["area"].to_numpy() * rng.beta(1.2, 6, len(tracts))
+    for year, values in (("2010", greenspace),
+                         ("2018", greenspace * rng.normal(1.01, 0.05, len(tracts)))):
+        pd.DataFrame({"ITZ_GEOID": tracts["ITZ_GEOID"],
+                      "SQUARE_METER_GREENSPACE_COVERAGE": values.round(1)}).to_csv(
+            os.path.join(root, "greenspace-orthoimagery", f"{year}-greenspace-orthoimagery.csv"),
+            index=False)
+    distance = rng.lognormal(7, 0.8, len(tracts))
+    pd.DataFrame({"ITZ_GEOID": tracts["ITZ_GEOID"],
+                  "2010_distance_from_park": distance.round(1),
+                  "d_2010_2018_distance_from_park": (distance * rng.normal(0, 0.02, len(tracts))
+                                                     ).round(1)}).to_csv(
+        os.path.join(root, "greenspace-distance", "tract_distance_from_park.csv"), index=False)
+
+
+def generate_data(root: str, num_tracts: int=NYC_TRACTS, num_lots: int=NYC_LOTS, seed: int=0,
+        upzoning_rate: float=1.0, missing_rate: float=0.01, verbose: bool=False
+        ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Writes a synthetic in-the-zone-data/ directory under root.
+
+    Returns the generated tracts and lots.
+    """
+    rng = np.random.default_rng(seed)
+    data_root = os.path.join(root, "in-the-zone-data")
+    for directory in ("zoning-data", "acs", "greenspace-orthoimagery", "greenspace-distance"):
+        os.makedirs(os.path.join(data_root, directory), exist_ok=True)
+
+    tracts = _make_tracts(num_tracts, rng)
+    lots = _make_lots(tracts, num_lots, upzoning_rate, rng)
+    if verbose:
+        print(f"Generated {len(tracts)} tracts and {len(lots)} lots")
+    _write_pluto(lots, tracts, missing_rate, data_root, rng)
+    if verbose:
+        print("PLUTO data written")
+    _write_acs(tracts, lots, missing_rate, data_root, rng)
+    if verbose:
+        print("ACS data written")
+    _write_geodata(tracts, data_root)
+    _write_tract_extras(tracts, lots, data_root, rng)
+    if verbose:
+        print("Tract geodata, subsidized properties and greenspace data written")
+    return tracts, lots
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("root")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--tracts", type=int, required=False)
+    parser.add_argument("--lots", type=int, required=False)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--upzoning_rate", type=float, default=1.0)
+    parser.add_argument("--missing_rate", type=float, default=0.01)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    num_tracts = args.tracts if args.tracts else int(NYC_TRACTS * args.scale)
+    num_lots = args.lots if args.lots else int(NYC_LOTS * args.scale)
+    generate_data(args.root, num_tracts, num_lots, args.seed, args.upzoning_rate,
+                  args.missing_rate, args.verbose)